@@ -2,19 +2,39 @@ import click
 import logging
 import json
 
-from anyqa.models import ChromaDB, WebDocumentLoader, DirectoryDocumentLoader, Chunker, Config, RAG, Persona
+from anyqa.models.config import Config
+from anyqa.models.persona import Persona
 from anyqa.constants import (
+    DEFAULT_ANSWER_CACHE_THRESHOLD,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CONTEXT_TOKENS,
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+    VECTOR_STORES,
+    DEFAULT_EMBEDDING_CACHE_SIZE,
     DEFAULT_EMBEDDING_MODEL,
     DEFAULT_CHUNK_OVERLAP,
     DEFAULT_CHUNK_SIZE,
     DEFAULT_LLM,
     DEFAULT_PERSONA_NAME,
     DEFAULT_PERSONA_TEMPLATE,
+    PREFETCH_BATCHES,
 )
 
 logger = logging.getLogger(__name__)
 
 
+def start_profiling(command: str, profile: bool, profile_functions: bool, trace_path: str | None):
+    """Profile the rest of the current command, reporting when it exits."""
+    if not (profile or profile_functions or trace_path):
+        return
+    from anyqa.models.profiling import ProfilingSession
+
+    session = ProfilingSession(command, trace_path=trace_path, functions=profile_functions).begin()
+    click.get_current_context().call_on_close(session.stop)
+
+
 @click.group()
 def cli():
     pass
@@ -38,8 +58,8 @@ def setup():
 
 @cli.command("config")
 @click.option("--embedding-model", default=None, help="Default HuggingFace model to use for embedding.")
-@click.option("--chunk-size", default=None, help="Size of chunks to store in embeddings")
-@click.option("--chunk-overlap", default=None, help="Overlap between chunks to store in embeddings")
+@click.option("--chunk-size", default=None, type=int, help="Size of chunks to store in embeddings")
+@click.option("--chunk-overlap", default=None, type=int, help="Overlap between chunks to store in embeddings")
 @click.option("--llm", default=None, help="Default LLM to use. Ensure that the model has been pulled with `ollama pull`")
 def update_config(embedding_model: str, chunk_size: int, chunk_overlap: int, llm: str):
     # Load config from config file
@@ -67,31 +87,186 @@ def update_config(embedding_model: str, chunk_size: int, chunk_overlap: int, llm
 @click.option("--collection", default="default", help="Chroma collection name.", show_default=True)
 @click.option("--depth", default=-1, help="Recursive search depth. When -1, search will extend to maximum recursion depth.", show_default=True)
 @click.option("-p", "--pattern", multiple=True, default=[".*"], help="URL/Path regex patterns to match on.")
-def load(dir: str, web: str, embedding_model: str, collection: str, depth: int, pattern: list[str]):
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only load files that changed since the last incremental load, and remove chunks of changed or deleted files. Requires --dir.",
+)
+@click.option("--batch-size", default=DEFAULT_BATCH_SIZE, help="Number of chunks to embed and commit at a time.", show_default=True)
+@click.option("--workers", default=1, help="Number of processes used to parse files. Only applies to --dir.", show_default=True)
+@click.option("--timeout", default=None, type=float, help="Per-file parse timeout in seconds. Only applies to --dir.")
+@click.option("--chunk-workers", default=1, help="Number of processes used to split documents into chunks.", show_default=True)
+@click.option(
+    "--token-chunks",
+    is_flag=True,
+    default=False,
+    help="Measure chunk size and overlap in tokens of the embedding model, capped at its maximum sequence length.",
+)
+@click.option("--web-concurrency", default=8, help="Number of pages fetched concurrently. Only applies to --web.", show_default=True)
+@click.option("--requests-per-second", default=2.0, help="Maximum requests per second to each host. Only applies to --web.", show_default=True)
+@click.option(
+    "--embedding-backend",
+    default=None,
+    type=click.Choice(EMBEDDING_BACKENDS),
+    help="Embedding backend for a new collection: PyTorch, or ONNX Runtime on CPU with optional int8 quantization. Existing collections keep theirs.",
+)
+@click.option(
+    "--vector-store",
+    default=None,
+    type=click.Choice(VECTOR_STORES),
+    help="Vector store for a new collection: Chroma, or an in-process flat index with exact search. Existing collections keep theirs.",
+)
+@click.option("--embedding-batch-size", default=DEFAULT_EMBEDDING_BATCH_SIZE, help="Number of chunks encoded per model call.", show_default=True)
+@click.option("--embedding-processes", default=1, help="Number of CPU processes used to encode chunks.", show_default=True)
+@click.option(
+    "--embedding-cache-size",
+    default=DEFAULT_EMBEDDING_CACHE_SIZE,
+    help="Maximum number of embeddings kept in the on-disk cache for the model. Set to 0 to disable the cache.",
+    show_default=True,
+)
+@click.option("--profile", is_flag=True, default=False, help="Print a per-stage timing breakdown and write a JSON trace.")
+@click.option("--profile-functions", is_flag=True, default=False, help="Also run cProfile and print the hottest functions. Implies --profile.")
+@click.option("--trace", "trace_path", default=None, help="File to write the JSON trace to. Implies --profile. Defaults to a file in db/traces.")
+def load(
+    dir: str,
+    web: str,
+    embedding_model: str,
+    collection: str,
+    depth: int,
+    pattern: list[str],
+    incremental: bool,
+    batch_size: int,
+    workers: int,
+    timeout: float | None,
+    chunk_workers: int,
+    token_chunks: bool,
+    web_concurrency: int,
+    requests_per_second: float,
+    embedding_backend: str | None,
+    vector_store: str | None,
+    embedding_batch_size: int,
+    embedding_processes: int,
+    embedding_cache_size: int,
+    profile: bool,
+    profile_functions: bool,
+    trace_path: str | None,
+):
+    start_profiling("load", profile, profile_functions, trace_path)
+
+    # Heavy imports are deferred so that other commands start quickly
+    from anyqa.models.chunkers import Chunker
+    from anyqa.models.document_loaders import WebDocumentLoader, DirectoryDocumentLoader
+    from anyqa.models.manifest import Manifest
+    from anyqa.models.pipeline import batched, prefetch
+    from anyqa.models.vector_db import ChromaDB, hash_document
+
     # Load config from config file
     config = Config()
     config.load()
 
     # Load documents from address
     if web is not None:
-        loader = WebDocumentLoader(url=web, depth=depth, pattern=pattern)
+        loader = WebDocumentLoader(url=web, depth=depth, pattern=pattern, concurrency=web_concurrency, requests_per_second=requests_per_second)
     elif dir is not None:
-        loader = DirectoryDocumentLoader(path=dir, depth=depth, pattern=pattern)
+        loader = DirectoryDocumentLoader(path=dir, depth=depth, pattern=pattern, workers=workers, timeout=timeout)
     else:
         raise ValueError("One of --dir or --web must be defined.")
-    documents = loader.load()
 
-    # Chunk documents
-    chunker = Chunker(chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap)
-    chunks = chunker.chunk_documents(docs=documents)
-    logger.info(f"Split {len(documents)} documents into {len(chunks)} chunks")
+    if incremental:
+        if dir is None:
+            raise ValueError("--incremental is only supported with --dir.")
+        manifest = Manifest(collection_name=collection)
+        manifest.load()
+        changed, removed = manifest.diff(paths=loader.get_paths(), root=dir)
+        logger.info(f"Found {len(changed)} new or changed files and {len(removed)} removed files")
+        documents = loader.lazy_load(paths=changed)
+    else:
+        documents = loader.lazy_load()
 
-    # Save chunks to DB
+    # Create the collection before any parsing so that configuration errors surface early
     if embedding_model is None:
         embedding_model = config.default_embedding_model
-    db = ChromaDB(embedding_model=embedding_model, collection_name=collection)
-    _ = db.load_documents(documents=chunks)
-    logger.info(f"Successfully loaded {len(documents)} documents ({len(chunks)} chunks) into collection {collection}")
+    db = ChromaDB(
+        embedding_model=embedding_model,
+        collection_name=collection,
+        embedding_batch_size=embedding_batch_size,
+        embedding_processes=embedding_processes,
+        embedding_cache_size=embedding_cache_size,
+        embedding_backend=embedding_backend,
+        vector_store=vector_store,
+    )
+
+    # Stream documents through the chunker and into the DB in batches. Parsing and chunking run in a background
+    # thread that is held at most a few batches ahead of embedding, so memory stays flat regardless of corpus size.
+    tokenizer_name = db.embedding_model if token_chunks else None
+    chunker = Chunker(chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap, tokenizer_name=tokenizer_name, workers=chunk_workers)
+    chunks = prefetch(chunker.lazy_chunk_documents(docs=documents), max_items=PREFETCH_BATCHES * batch_size)
+    # Loaders yield each source's documents together and the chunker keeps their order, so a source is complete once
+    # a chunk of another source arrives. Its old chunks are then reconciled and only the ids of the source being
+    # committed are held in memory.
+    finished = set()
+    n_stale = 0
+
+    def finish_source(source: str, ids: list[str]):
+        nonlocal n_stale
+        # Files that failed to parse are left as they were, so that they are retried next time
+        if web is None and source in loader.failed:
+            return
+        if incremental:
+            if source in finished:
+                # A source split across the stream keeps the chunks it already recorded
+                ids = manifest.ids(source) + ids
+            stale = list(set(manifest.ids(source)) - set(ids))
+            manifest.update(source, ids)
+            db.delete_ids(stale)
+        elif source in finished:
+            return
+        else:
+            # Every source that was read in full replaces its previous chunks
+            stale = db.delete_stale_ids(source, ids)
+        finished.add(source)
+        n_stale += len(stale)
+
+    source, source_ids = None, []
+    n_sources = n_chunks = 0
+    for batch in batched(chunks, batch_size=batch_size):
+        _ = db.load_documents(documents=batch)
+        for chunk in batch:
+            if chunk.metadata["source"] != source:
+                if source is not None:
+                    finish_source(source, source_ids)
+                source, source_ids = chunk.metadata["source"], []
+                n_sources += 1
+            source_ids.append(hash_document(chunk))
+        n_chunks += len(batch)
+        logger.info(f"Committed {n_chunks} chunks from {n_sources} documents")
+    if source is not None:
+        finish_source(source, source_ids)
+    logger.info(f"Successfully loaded {n_sources} documents ({n_chunks} chunks) into collection {collection}")
+    logger.info(f"Embedded {db.embedding_function.n_embedded} chunks at {db.embedding_function.chunks_per_second:.1f} chunks/sec")
+    if db.embedding_function.cache is not None:
+        cache = db.embedding_function.cache
+        logger.info(f"Embedding cache: {cache.hits} hits, {cache.misses} misses ({cache.hit_rate:.1%} hit rate)")
+    db.embedding_function.close()
+    failed = loader.failed if web is None else []
+    if failed:
+        logger.warning(f"Failed to load {len(failed)} files: {failed}")
+
+    if incremental:
+        # Deleted files, and changed files that no longer produce any chunks, lose all of their chunks
+        stale = []
+        for path in removed:
+            stale.extend(manifest.remove(path))
+        for path in changed:
+            if path not in finished and path not in failed:
+                stale.extend(manifest.ids(path))
+                manifest.update(path, [])
+        db.delete_ids(stale)
+        n_stale += len(stale)
+        manifest.save()
+    logger.info(f"Removed {n_stale} stale chunks from collection {collection}")
+    db.invalidate_answers()
 
     config.save()
 
@@ -105,16 +280,24 @@ def load(dir: str, web: str, embedding_model: str, collection: str, depth: int,
 )
 @click.option("--keep", is_flag=True, default=False, help="If present, keep collection", show_default=True)
 def remove(collection: str, where: str | None, keep: bool):
+    from anyqa.models.manifest import Manifest
+    from anyqa.models.vector_db import ChromaDB
+
     # Load config from config file
     config = Config()
     config.load()
 
     db = ChromaDB(collection_name=collection)
+    manifest = Manifest(collection_name=collection)
     if where is not None:
         where = json.loads(where)
-        db.delete_where(where)
+        deleted_ids = db.delete_where(where)
+        manifest.load()
+        manifest.forget_ids(deleted_ids)
+        manifest.save()
         logger.info(f"Successfully deleted records from '{collection}' where {where}")
     else:
+        manifest.delete()
         if collection != "default" and not keep:
             # TODO: Remove collections from config
             deleted = db.delete_collection()
@@ -125,35 +308,120 @@ def remove(collection: str, where: str | None, keep: bool):
         else:
             db.delete_all_records()
             logger.info(f"Successfully deleted all records from collection '{collection}'")
+    db.invalidate_answers()
 
 
 @cli.command("list")
-def list_collections():
+@click.option(
+    "--verify",
+    is_flag=True,
+    default=False,
+    help="Reconcile the source catalog with the database before listing, even if no collection is missing from it.",
+)
+def list_collections(verify: bool):
+    import datetime
+
+    from anyqa.models.vector_db import ChromaDB
+
     # Load config from config file
     config = Config()
     config.load()
 
-    # Connect to db
+    # Collections created before the catalog existed, or by other tools, are reconciled automatically
     db = ChromaDB()
-    collections = db.client.list_collections()
+    if verify or db.collection_names() != {collection["name"] for collection in db.catalog.collections()}:
+        changed = db.verify_catalog()
+        logger.info(f"Verified catalog, {len(changed)} collections updated: {changed}")
 
-    for collection in collections:
-        logger.info(f"{collection.name}: {collection.count()} Embeddings")
-        logger.info(f"\tMetadata: {collection.metadata}")
-        result = collection.get()
-        metadatas = result["metadatas"]
-        sources = {m["source"] for m in metadatas}
-        logger.info(f"\tSources: {sources}")
+    catalog = db.catalog
+    for collection in catalog.collections():
+        logger.info(f"{collection['name']}: {collection['chunks']} Embeddings")
+        logger.info(f"\tEmbedding model: {collection['embedding_model']}")
+        logger.info(f"\tSources ({collection['sources']}, {collection['bytes']} bytes):")
+        for source in catalog.sources(collection["name"]):
+            last_ingested = datetime.datetime.fromtimestamp(source["last_ingested"]).isoformat(timespec="seconds")
+            logger.info(f"\t\t{source['source']}: {source['chunks']} chunks, {source['bytes']} bytes, last ingested {last_ingested}")
 
 
 @cli.command("query")
-@click.argument("question")
+@click.argument("question", required=False)
 @click.option("--collection", default="default", help="Chroma collection name.", show_default=True)
 @click.option("--persona", default="default", help="Persona name to use.", show_default=True)
 @click.option("--llm", default=None, help="LLM to use. Ensure that the model has been pulled with `ollama pull`")
 @click.option("-k", default=3, help="Number of documents to retrieve per query.", show_default=True)
 @click.option("-v", "--verbose", count=True, help="Increase verboseness")
-def query(question: str, collection: str, persona: str, llm: str, k: int, verbose: bool):
+@click.option("--server", default=None, help="URL of a running `anyqa serve` instance to send the query to, e.g. http://127.0.0.1:8765")
+@click.option("--input", "input_path", default=None, help="JSONL file of questions to answer instead of QUESTION. Each line needs a 'question' key.")
+@click.option("--output", "output_path", default=None, help="JSONL file to write answers to. Required with --input.")
+@click.option("--concurrency", default=4, help="Maximum number of concurrent LLM calls with --input.", show_default=True)
+@click.option("--no-cache", is_flag=True, default=False, help="Always generate a new answer instead of using the answer cache.")
+@click.option(
+    "--cache-threshold",
+    default=DEFAULT_ANSWER_CACHE_THRESHOLD,
+    help="Minimum cosine similarity for a previous question to be treated as the same question.",
+    show_default=True,
+)
+@click.option("--hybrid", is_flag=True, default=False, help="Combine vector search with BM25 keyword search using reciprocal rank fusion.")
+@click.option(
+    "--context-tokens", default=DEFAULT_CONTEXT_TOKENS, help="Maximum number of prompt tokens used for retrieved context.", show_default=True
+)
+@click.option("--profile", is_flag=True, default=False, help="Print a per-stage timing breakdown and write a JSON trace.")
+@click.option("--profile-functions", is_flag=True, default=False, help="Also run cProfile and print the hottest functions. Implies --profile.")
+@click.option("--trace", "trace_path", default=None, help="File to write the JSON trace to. Implies --profile. Defaults to a file in db/traces.")
+def query(
+    question: str | None,
+    collection: str,
+    persona: str,
+    llm: str,
+    k: int,
+    verbose: bool,
+    server: str | None,
+    input_path: str | None,
+    output_path: str | None,
+    concurrency: int,
+    no_cache: bool,
+    cache_threshold: float,
+    hybrid: bool,
+    context_tokens: int,
+    profile: bool,
+    profile_functions: bool,
+    trace_path: str | None,
+):
+    start_profiling("query", profile, profile_functions, trace_path)
+
+    if input_path is not None:
+        if output_path is None:
+            raise click.UsageError("--output must be defined when using --input.")
+        if server is not None:
+            raise click.UsageError("--server cannot be used with --input. Batches are answered in this process.")
+        batch_query(input_path, output_path, collection, persona, llm, k, verbose, concurrency, context_tokens, hybrid, no_cache, cache_threshold)
+        return
+    if question is None:
+        raise click.UsageError("One of QUESTION or --input must be defined.")
+
+    if server is not None:
+        from anyqa.server import request_query
+
+        payload = {
+            "question": question,
+            "collection": collection,
+            "persona": persona,
+            "llm": llm,
+            "k": k,
+            "hybrid": hybrid,
+            "context_tokens": context_tokens,
+            "no_cache": no_cache,
+        }
+        result = request_query(server, payload)
+        logger.info(f"Question: {question}")
+        logger.info(f"Response: {result['response']}")
+        logger.info(f"Sources: {result['sources']}")
+        return
+
+    from anyqa.models.answer_cache import AnswerCache
+    from anyqa.models.query import RAG, get_source_names
+    from anyqa.models.vector_db import ChromaDB
+
     # Load config from config file
     config = Config()
     config.load()
@@ -166,14 +434,237 @@ def query(question: str, collection: str, persona: str, llm: str, k: int, verbos
     if llm is None:
         llm = config.default_llm
     search_kwargs = {"k": k}
-    rag = RAG(collection=db, persona=_persona, model_name=llm, verbose=verbose, search_kwargs=search_kwargs)
-    response, sources = rag.query(question=question)
-    source_names = [source.metadata.get("loc") if source.metadata.get("loc") else source.metadata.get("source") for source in sources]
+    answer_cache = None if no_cache else AnswerCache(threshold=cache_threshold)
+    rag = RAG(
+        collection=db,
+        persona=_persona,
+        model_name=llm,
+        verbose=verbose,
+        search_kwargs=search_kwargs,
+        answer_cache=answer_cache,
+        hybrid=hybrid,
+        context_tokens=context_tokens,
+    )
+
+    # Print the answer as it is generated
     logger.info(f"Question: {question}")
-    logger.info(f"Response: {response}")
+    for kind, value in rag.stream(question=question):
+        if kind == "sources":
+            source_names = get_source_names(value)
+        elif kind == "token":
+            click.echo(value, nl=False)
+        elif kind == "timings":
+            timings = value
+    click.echo()
     logger.info(f"Sources: {source_names}")
+    logger.info(
+        f"Retrieval: {timings.retrieval:.2f}s, time to first token: {timings.time_to_first_token or 0:.2f}s, "
+        f"generation: {timings.generation:.2f}s, total: {timings.total:.2f}s"
+    )
 
 
-if __name__ == "__main__":
+def batch_query(
+    input_path: str,
+    output_path: str,
+    collection: str,
+    persona: str,
+    llm: str | None,
+    k: int,
+    verbose: bool,
+    concurrency: int,
+    context_tokens: int,
+    hybrid: bool,
+    no_cache: bool,
+    cache_threshold: float,
+):
+    """Answer every question in a JSONL file, streaming answers to the output file as they complete."""
+    import time
+
+    from anyqa.models.answer_cache import AnswerCache
+    from anyqa.models.metrics import percentile
+    from anyqa.models.query import RAG, get_source_names
+    from anyqa.models.vector_db import ChromaDB
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    with open(input_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    questions = [record["question"] for record in records]
+
+    db = ChromaDB(collection_name=collection)
+    _persona = [p for p in config.personas if p.name == persona][0]
+    if llm is None:
+        llm = config.default_llm
+    answer_cache = None if no_cache else AnswerCache(threshold=cache_threshold)
+    rag = RAG(
+        collection=db,
+        persona=_persona,
+        model_name=llm,
+        verbose=verbose,
+        search_kwargs={"k": k},
+        answer_cache=answer_cache,
+        hybrid=hybrid,
+        context_tokens=context_tokens,
+    )
+
+    start = time.perf_counter()
+    latencies = []
+    failed = 0
+    with open(output_path, "w") as f:
+        for index, response, sources, seconds, error in rag.batch_query(questions, concurrency=concurrency):
+            if error is None:
+                latencies.append(seconds)
+                record = {**records[index], "response": response, "sources": get_source_names(sources), "seconds": seconds}
+            else:
+                failed += 1
+                record = {**records[index], "error": error, "seconds": seconds}
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+    elapsed = time.perf_counter() - start
+
+    logger.info(f"Answered {len(questions)} questions in {elapsed:.1f}s ({len(questions) / max(elapsed, 1e-9):.2f} questions/sec)")
+    if failed:
+        logger.warning(f"{failed} questions failed. Their output records have an 'error' key.")
+    logger.info(f"Latency p50: {percentile(latencies, 50):.2f}s, p95: {percentile(latencies, 95):.2f}s")
+
+
+@cli.command("export")
+@click.argument("collection")
+@click.argument("path")
+@click.option("--dtype", default="float32", type=click.Choice(["float32", "float16"]), help="Precision of the stored vectors.", show_default=True)
+def export(collection: str, path: str, dtype: str):
+    from anyqa.models.snapshot import export_collection
+    from anyqa.models.vector_db import ChromaDB
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    db = ChromaDB(collection_name=collection)
+    manifest = export_collection(db, path, dtype=dtype, chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap)
+    logger.info(f"Exported {manifest['count']} records from collection '{collection}' to {path}")
+
+
+@cli.command("import")
+@click.argument("path")
+@click.option("--collection", default=None, help="Collection to import into. Defaults to the name of the exported collection.")
+@click.option("--vector-store", default=None, type=click.Choice(VECTOR_STORES), help="Vector store for a new collection.")
+def import_(path: str, collection: str | None, vector_store: str | None):
+    from anyqa.models.snapshot import import_snapshot
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    db, added = import_snapshot(path, collection_name=collection, vector_store=vector_store)
+    logger.info(f"Imported {added} records into collection '{db.collection_name}'")
+
+
+@cli.command("serve")
+@click.option("--host", default="127.0.0.1", help="Host to listen on.", show_default=True)
+@click.option("--port", default=8765, help="Port to listen on.", show_default=True)
+@click.option("-c", "--collection", multiple=True, help="Collections to open at startup. Other collections are opened on first use.")
+@click.option("-v", "--verbose", count=True, help="Increase verboseness")
+@click.option("--no-cache", is_flag=True, default=False, help="Always generate new answers instead of using the answer cache.")
+def serve(host: str, port: int, collection: list[str], verbose: bool, no_cache: bool):
+    from anyqa.server import QueryServer, QueryService
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    service = QueryService(config=config, verbose=verbose, answer_cache=not no_cache)
+    for name in collection:
+        service.get_collection(name)
+
+    server = QueryServer(host=host, port=port, service=service)
+    logger.info(f"Serving queries on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def default_models(config: Config) -> list[str]:
+    """The default embedding model and the embedding models of every collection."""
+    from anyqa.models.catalog import SourceCatalog
+
+    names = [config.default_embedding_model or DEFAULT_EMBEDDING_MODEL]
+    names.extend(collection["embedding_model"] for collection in SourceCatalog().collections())
+    return list(dict.fromkeys(name for name in names if name))
+
+
+@cli.group("models")
+def models():
+    pass
+
+
+@models.command("pull")
+@click.argument("model", nargs=-1)
+@click.option("--revision", default=None, help="Branch, tag or commit to pin. Defaults to the latest commit. Requires a single MODEL.")
+def pull_models(model: tuple[str, ...], revision: str | None):
+    from anyqa.models.model_store import pull_model
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    names = list(model) or default_models(config)
+    if revision is not None and len(names) != 1:
+        raise click.UsageError("--revision requires a single MODEL.")
+    for name in names:
+        pin = pull_model(name, revision=revision)
+        logger.info(f"Pinned {name} at revision {pin['revision']}")
+
+
+@models.command("warm")
+@click.argument("model", nargs=-1)
+@click.option(
+    "--embedding-backend",
+    default=DEFAULT_EMBEDDING_BACKEND,
+    type=click.Choice(EMBEDDING_BACKENDS),
+    help="Backend to load the models with. ONNX backends are exported if needed.",
+    show_default=True,
+)
+def warm_models(model: tuple[str, ...], embedding_backend: str):
+    from anyqa.models.model_store import warm_model
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    for name in list(model) or default_models(config):
+        seconds = warm_model(name, embedding_backend)
+        logger.info(f"{name} ({embedding_backend}): cold load took {seconds:.2f}s")
+
+
+@models.command("list")
+def list_models():
+    from anyqa.constants import HF_MODEL_PATH
+    from anyqa.models.model_store import read_pins
+
+    # Load config from config file
+    config = Config()
+    config.load()
+
+    pins = read_pins()
+    for name in dict.fromkeys([*pins, *default_models(config)]):
+        pin = pins.get(name)
+        if pin is None:
+            logger.info(f"{name}: not pinned")
+        else:
+            status = "" if (HF_MODEL_PATH / pin["path"]).is_dir() else ", missing"
+            logger.info(f"{name}: revision {pin['revision']}, pulled {pin['pulled']}{status}")
+
+
+def main():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     cli()
+
+
+if __name__ == "__main__":
+    main()
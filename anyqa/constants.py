@@ -1,26 +1,47 @@
+import functools
 import logging
 import os
 import pathlib
 
-import torch
-
 logger = logging.getLogger(__name__)
 
 DIRECTORY_PATH = pathlib.Path(os.path.dirname(__file__)).parent
 
 HF_MODEL_PATH = DIRECTORY_PATH / "hf_models"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+ONNX_MODEL_DIRECTORY = HF_MODEL_PATH / "onnx"
 
-PERSIST_DIRECTORY = DIRECTORY_PATH / "db"
+PERSIST_DIRECTORY = pathlib.Path(os.environ.get("ANYQA_PERSIST_DIRECTORY", DIRECTORY_PATH / "db"))
+MANIFEST_DIRECTORY = PERSIST_DIRECTORY / "manifests"
+EMBEDDING_CACHE_DIRECTORY = PERSIST_DIRECTORY / "embedding_cache"
+ANSWER_CACHE_FILE = PERSIST_DIRECTORY / "answer_cache.sqlite"
+LEXICAL_INDEX_DIRECTORY = PERSIST_DIRECTORY / "lexical"
+CATALOG_FILE = PERSIST_DIRECTORY / "catalog.sqlite"
+CATALOG_PAGE_SIZE = 1000
+HTTP_CACHE_FILE = PERSIST_DIRECTORY / "http_cache.sqlite"
+TRACE_DIRECTORY = PERSIST_DIRECTORY / "traces"
+FLAT_INDEX_DIRECTORY = PERSIST_DIRECTORY / "flat"
 
-CONFIG_FILE = DIRECTORY_PATH / "config" / "config.yaml"
+CONFIG_FILE = pathlib.Path(os.environ.get("ANYQA_CONFIG_DIRECTORY", DIRECTORY_PATH / "config")) / "config.yaml"
 
 
 # Defaults
 DEFAULT_CHUNK_SIZE = 1000
 DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_BATCH_SIZE = 256
+PREFETCH_BATCHES = 2
+DEFAULT_EMBEDDING_BATCH_SIZE = 32
+DEFAULT_EMBEDDING_CACHE_SIZE = 500_000
+DEFAULT_ANSWER_CACHE_THRESHOLD = 0.95
+DEFAULT_ANSWER_CACHE_TTL = 24 * 60 * 60
+DEFAULT_ANSWER_CACHE_SIZE = 10_000
+DEFAULT_CONTEXT_TOKENS = 2048
 DEFAULT_LLM = "gemma:2b"
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
 DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-miniLM-L6-v2"
+DEFAULT_EMBEDDING_BACKEND = "torch"
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_VECTOR_STORE = "chroma"
+VECTOR_STORES = ("chroma", "flat")
 DEFAULT_PERSONA_NAME = "default"
 DEFAULT_PERSONA_TEMPLATE = """You are a helpful assistant. Answer the user's question based on the
 context below. If you do not know the answer, say "I don't know".
@@ -33,3 +54,18 @@ Question: {question}
 
 Answer:
 """
+
+
+@functools.cache
+def get_device() -> str:
+    """Detect the torch device. Imports torch, so only call this when building a model."""
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def __getattr__(name: str):
+    # DEVICE is resolved lazily so that importing constants does not import torch
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,29 @@
-from anyqa.models.chunkers import Chunker
-from anyqa.models.config import Config
-from anyqa.models.document_loaders import WebDocumentLoader, DirectoryDocumentLoader
-from anyqa.models.embeddings import Embeddings
-from anyqa.models.query import Persona, RAG
-from anyqa.models.vector_db import ChromaDB
+import importlib
+
+# Submodules pull in langchain, chromadb, torch and unstructured, so they are only imported on first attribute access
+_LAZY_IMPORTS = {
+    "Chunker": "anyqa.models.chunkers",
+    "Config": "anyqa.models.config",
+    "WebDocumentLoader": "anyqa.models.document_loaders",
+    "DirectoryDocumentLoader": "anyqa.models.document_loaders",
+    "Embeddings": "anyqa.models.embeddings",
+    "Persona": "anyqa.models.persona",
+    "RAG": "anyqa.models.query",
+    "ChromaDB": "anyqa.models.vector_db",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
 
 
 __all__ = ["Chunker", "Config", "WebDocumentLoader", "DirectoryDocumentLoader", "Embeddings", "Persona", "ChromaDB", "RAG"]
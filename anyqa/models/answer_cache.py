@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from anyqa.constants import ANSWER_CACHE_FILE, DEFAULT_ANSWER_CACHE_SIZE, DEFAULT_ANSWER_CACHE_THRESHOLD, DEFAULT_ANSWER_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """Cache of generated answers, keyed by collection, persona, LLM, a fingerprint of the retrieval and prompt
+    settings, and question embedding.
+
+    A question hits the cache when it matches a stored question exactly, or when the cosine similarity of their
+    embeddings is at least threshold. Entries expire after ttl seconds, the least recently used entries are evicted
+    beyond max_entries, and all entries for a collection are dropped whenever the collection changes.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_ANSWER_CACHE_THRESHOLD,
+        ttl: float = DEFAULT_ANSWER_CACHE_TTL,
+        max_entries: int = DEFAULT_ANSWER_CACHE_SIZE,
+    ):
+        """Initialize."""
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        ANSWER_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(ANSWER_CACHE_FILE, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, collection TEXT NOT NULL, persona TEXT NOT NULL, llm TEXT NOT NULL, settings TEXT NOT NULL, "
+            "question TEXT NOT NULL, embedding BLOB NOT NULL, response TEXT NOT NULL, sources TEXT NOT NULL, created REAL NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS answers_key ON answers (collection, persona, llm, settings)")
+        self.connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, collection: str, persona: str, llm: str, settings: str, question: str, embedding: list[float]) -> tuple[str, list[Document]] | None:
+        """Look up a cached answer and its sources for a question, generated with the same settings fingerprint."""
+        now = time.time()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, question, embedding FROM answers WHERE collection = ? AND persona = ? AND llm = ? AND settings = ? AND created >= ?",
+                (collection, persona, llm, settings, now - self.ttl),
+            ).fetchall()
+            id = self._best_match(rows, question, embedding)
+            if id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            response, sources = self.connection.execute("SELECT response, sources FROM answers WHERE id = ?", (id,)).fetchone()
+            self.connection.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, id))
+            self.connection.commit()
+        sources = [Document(page_content=source["page_content"], metadata=source["metadata"]) for source in json.loads(sources)]
+        return response, sources
+
+    def put(
+        self,
+        collection: str,
+        persona: str,
+        llm: str,
+        settings: str,
+        question: str,
+        embedding: list[float],
+        response: str,
+        sources: list[Document],
+    ):
+        """Store an answer, evicting expired and least recently used entries."""
+        now = time.time()
+        vector = np.asarray(embedding, dtype=np.float32)
+        serialized_sources = json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in sources])
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO answers (collection, persona, llm, settings, question, embedding, response, sources, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (collection, persona, llm, settings, question, vector.tobytes(), response, serialized_sources, now, now),
+            )
+            self.connection.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self.connection.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self.connection.commit()
+
+    def invalidate(self, collection: str):
+        """Drop all cached answers for a collection."""
+        with self.lock:
+            deleted = self.connection.execute("DELETE FROM answers WHERE collection = ?", (collection,)).rowcount
+            self.connection.commit()
+        if deleted:
+            logger.info(f"Invalidated {deleted} cached answers for collection '{collection}'")
+
+    @staticmethod
+    def fingerprint(**settings) -> str:
+        """Short stable hash of the settings that shape an answer, such as retrieval parameters and the prompt template."""
+        return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode("UTF-8")).hexdigest()[:16]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _best_match(self, rows: list[tuple], question: str, embedding: list[float]) -> int | None:
+        if not rows:
+            return None
+        for id, cached_question, _ in rows:
+            if cached_question == question:
+                return id
+
+        query = np.asarray(embedding, dtype=np.float32)
+        matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        similarities = matrix @ query / np.maximum(norms, 1e-12)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return rows[best][0]
@@ -0,0 +1,113 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from anyqa.constants import CATALOG_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class SourceCatalog:
+    """Per-collection record of loaded sources, with chunk counts, byte sizes and last ingestion time.
+
+    The catalog is updated whenever records are added to or deleted from a collection, so that listing a collection
+    does not require reading its records.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        CATALOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(CATALOG_FILE, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS collections (name TEXT PRIMARY KEY, embedding_model TEXT, updated REAL NOT NULL)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sources (collection TEXT NOT NULL, source TEXT NOT NULL, chunks INTEGER NOT NULL, "
+            "bytes INTEGER NOT NULL, last_ingested REAL NOT NULL, PRIMARY KEY (collection, source))"
+        )
+        self.connection.commit()
+
+    def add(self, collection: str, embedding_model: str, counts: dict[str, tuple[int, int]]):
+        """Record newly added chunks, given as a mapping of source to (chunks, bytes)."""
+        now = time.time()
+        with self.lock:
+            self._touch(collection, embedding_model, now)
+            self.connection.executemany(
+                "INSERT INTO sources (collection, source, chunks, bytes, last_ingested) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (collection, source) DO UPDATE SET chunks = chunks + excluded.chunks, bytes = bytes + excluded.bytes, "
+                "last_ingested = excluded.last_ingested",
+                [(collection, source, chunks, size, now) for source, (chunks, size) in counts.items()],
+            )
+            self.connection.commit()
+
+    def remove(self, collection: str, counts: dict[str, tuple[int, int]]):
+        """Record deleted chunks, given as a mapping of source to (chunks, bytes)."""
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE sources SET chunks = chunks - ?, bytes = MAX(bytes - ?, 0) WHERE collection = ? AND source = ?",
+                [(chunks, size, collection, source) for source, (chunks, size) in counts.items()],
+            )
+            self.connection.execute("DELETE FROM sources WHERE collection = ? AND chunks <= 0", (collection,))
+            self.connection.execute("UPDATE collections SET updated = ? WHERE name = ?", (time.time(), collection))
+            self.connection.commit()
+
+    def replace(self, collection: str, embedding_model: str | None, counts: dict[str, tuple[int, int]]):
+        """Replace the sources of a collection, keeping the last ingestion time of sources that are already known."""
+        now = time.time()
+        with self.lock:
+            last_ingested = dict(self.connection.execute("SELECT source, last_ingested FROM sources WHERE collection = ?", (collection,)))
+            self.connection.execute("DELETE FROM sources WHERE collection = ?", (collection,))
+            self._touch(collection, embedding_model, now)
+            self.connection.executemany(
+                "INSERT INTO sources (collection, source, chunks, bytes, last_ingested) VALUES (?, ?, ?, ?, ?)",
+                [(collection, source, chunks, size, last_ingested.get(source, now)) for source, (chunks, size) in counts.items()],
+            )
+            self.connection.commit()
+
+    def clear(self, collection: str, drop: bool = False):
+        """Remove all sources of a collection, and the collection itself if drop is set."""
+        with self.lock:
+            self.connection.execute("DELETE FROM sources WHERE collection = ?", (collection,))
+            if drop:
+                self.connection.execute("DELETE FROM collections WHERE name = ?", (collection,))
+            else:
+                self.connection.execute("UPDATE collections SET updated = ? WHERE name = ?", (time.time(), collection))
+            self.connection.commit()
+
+    def collections(self) -> list[dict]:
+        """Summary of every collection in the catalog."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT collections.name, collections.embedding_model, collections.updated, COUNT(sources.source), "
+                "COALESCE(SUM(sources.chunks), 0), COALESCE(SUM(sources.bytes), 0) "
+                "FROM collections LEFT JOIN sources ON sources.collection = collections.name "
+                "GROUP BY collections.name ORDER BY collections.name"
+            ).fetchall()
+        keys = ["name", "embedding_model", "updated", "sources", "chunks", "bytes"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def updated(self, collection: str) -> float | None:
+        """Time a collection's records last changed, or None if it is not in the catalog."""
+        with self.lock:
+            row = self.connection.execute("SELECT updated FROM collections WHERE name = ?", (collection,)).fetchone()
+        return row[0] if row is not None else None
+
+    def sources(self, collection: str) -> list[dict]:
+        """Every source of a collection."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT source, chunks, bytes, last_ingested FROM sources WHERE collection = ? ORDER BY source", (collection,)
+            ).fetchall()
+        keys = ["source", "chunks", "bytes", "last_ingested"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _touch(self, collection: str, embedding_model: str | None, now: float):
+        self.connection.execute(
+            "INSERT INTO collections (name, embedding_model, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET embedding_model = COALESCE(excluded.embedding_model, embedding_model), updated = excluded.updated",
+            (collection, embedding_model, now),
+        )
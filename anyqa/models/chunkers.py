@@ -1,36 +1,153 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
+import functools
+import json
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from langchain.text_splitter import Language, RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+from anyqa.constants import HF_MODEL_PATH
+from anyqa.models.pipeline import batched
+from anyqa.models.profiling import span
+
+logger = logging.getLogger(__name__)
+
+# Extensions that are split, and the language whose separators to split on. None uses the default separators.
 SPLITTER_MAP = {
-    ".html": lambda **kwargs: RecursiveCharacterTextSplitter.from_language(language=Language.HTML, **kwargs),
-    ".md": lambda **kwargs: RecursiveCharacterTextSplitter.from_language(language=Language.MARKDOWN, **kwargs),
-    ".py": lambda **kwargs: RecursiveCharacterTextSplitter.from_language(language=Language.PYTHON, **kwargs),
-    ".txt": RecursiveCharacterTextSplitter,
-    ".pdf": RecursiveCharacterTextSplitter,
-    ".docx": RecursiveCharacterTextSplitter,
-    ".doc": RecursiveCharacterTextSplitter,
+    ".html": Language.HTML,
+    ".md": Language.MARKDOWN,
+    ".py": Language.PYTHON,
+    ".txt": None,
+    ".pdf": None,
+    ".csv": None,
+    ".xls": None,
+    ".xlsx": None,
+    ".docx": None,
+    ".doc": None,
 }
 
+# Number of documents sent to a chunking worker at a time
+CHUNK_BATCH_SIZE = 64
+
+
+@functools.cache
+def get_tokenizer(tokenizer_name: str):
+    """Load a HuggingFace tokenizer once per process."""
+    from transformers import AutoTokenizer
+
+    from anyqa.models.model_store import resolve_model
+
+    return AutoTokenizer.from_pretrained(str(resolve_model(tokenizer_name, str(HF_MODEL_PATH))))
+
+
+@functools.cache
+def get_max_seq_length(tokenizer_name: str) -> int:
+    """Number of tokens the embedding model encodes before truncating, including special tokens.
+
+    sentence-transformers models record this in sentence_bert_config.json, and it is often shorter than the
+    tokenizer's model_max_length, e.g. 256 rather than 512 for all-MiniLM-L6-v2.
+    """
+    from anyqa.models.model_store import resolve_model
+
+    max_length = get_tokenizer(tokenizer_name).model_max_length
+    config_path = resolve_model(tokenizer_name, str(HF_MODEL_PATH)) / "sentence_bert_config.json"
+    if config_path.exists():
+        max_seq_length = json.loads(config_path.read_text()).get("max_seq_length")
+        if max_seq_length:
+            max_length = min(max_length, max_seq_length)
+    return max_length
+
+
+def _token_length(tokenizer, text: str) -> int:
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+@functools.cache
+def get_splitter(extension: str, chunk_size: int, chunk_overlap: int, tokenizer_name: str | None = None) -> RecursiveCharacterTextSplitter | None:
+    """Build the splitter for an extension once per process and settings.
+
+    When tokenizer_name is set, chunk_size and chunk_overlap are measured in tokens of that tokenizer instead of
+    characters, and chunk_size is capped so that a chunk plus the special tokens the tokenizer adds fits in the
+    embedding model's maximum sequence length.
+    """
+    if extension not in SPLITTER_MAP:
+        return None
+    language = SPLITTER_MAP[extension]
+    kwargs = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    if language is not None:
+        kwargs["separators"] = RecursiveCharacterTextSplitter.get_separators_for_language(language)
+        kwargs["is_separator_regex"] = True
+    if tokenizer_name is None:
+        return RecursiveCharacterTextSplitter(**kwargs)
+
+    tokenizer = get_tokenizer(tokenizer_name)
+    max_tokens = get_max_seq_length(tokenizer_name) - tokenizer.num_special_tokens_to_add()
+    if chunk_size > max_tokens:
+        logger.warning(f"Chunk size {chunk_size} exceeds the maximum sequence length of {tokenizer_name}. Using {max_tokens} tokens.")
+        kwargs["chunk_size"] = max_tokens
+        kwargs["chunk_overlap"] = min(chunk_overlap, max_tokens // 2)
+    # Special tokens are accounted for in the cap, so chunks are measured without them
+    return RecursiveCharacterTextSplitter(length_function=functools.partial(_token_length, tokenizer), **kwargs)
+
+
+def chunk_document(doc: Document, chunk_size: int, chunk_overlap: int, tokenizer_name: str | None = None) -> list[Document]:
+    """Split a single document, using a splitter chosen by its file extension."""
+    splitter = get_splitter(doc.metadata["extension"], chunk_size, chunk_overlap, tokenizer_name)
+    if splitter is None:
+        return [doc]
+    return splitter.split_documents(documents=[doc])
+
+
+def _chunk_batch(docs: list[Document], chunk_size: int, chunk_overlap: int, tokenizer_name: str | None) -> list[Document]:
+    # Runs in a worker process, where splitters are cached across batches
+    chunks = []
+    for doc in docs:
+        chunks.extend(chunk_document(doc, chunk_size, chunk_overlap, tokenizer_name))
+    return chunks
+
 
 class Chunker:
-    def __init__(self, chunk_size: int, chunk_overlap: int):
-        """Initialize."""
+    def __init__(self, chunk_size: int, chunk_overlap: int, tokenizer_name: str | None = None, workers: int = 1):
+        """Initialize.
+
+        When tokenizer_name is set, chunk sizes are measured in tokens. When workers is greater than 1, documents are
+        split in a process pool.
+        """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.tokenizer_name = tokenizer_name
+        self.workers = workers
 
     def chunk_documents(self, docs: list[Document]):
         """Chunk documents into smaller subsections"""
-        chunks = []
+        return list(self.lazy_chunk_documents(docs=docs))
+
+    def lazy_chunk_documents(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """Chunk documents into smaller subsections, preserving document order"""
+        if self.workers > 1:
+            yield from self._parallel_chunk_documents(docs)
+            return
         for doc in docs:
-            # Select a splitter based on file extension
-            extension = doc.metadata["extension"]
-            splitter = SPLITTER_MAP.get(extension, None)
-
-            # Split doc into chunks
-            doc_chunks = [doc]
-            kwargs = {"chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap}
-            if splitter:
-                doc_chunks = splitter(**kwargs).split_documents(documents=doc_chunks)
-            chunks.extend(doc_chunks)
-
-        return chunks
+            with span("chunk.split"):
+                chunks = chunk_document(doc, self.chunk_size, self.chunk_overlap, self.tokenizer_name)
+            yield from chunks
+
+    def _parallel_chunk_documents(self, docs: Iterable[Document]) -> Iterator[Document]:
+        # Keep a bounded window of document batches in flight and yield results in submission order
+        in_flight = deque()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            for batch in batched(docs, CHUNK_BATCH_SIZE):
+                in_flight.append(executor.submit(_chunk_batch, batch, self.chunk_size, self.chunk_overlap, self.tokenizer_name))
+                if len(in_flight) >= 2 * self.workers:
+                    yield from self._wait(in_flight.popleft())
+            while in_flight:
+                yield from self._wait(in_flight.popleft())
+
+    def _wait(self, future) -> list[Document]:
+        # Splitting happens in the workers, so this measures how long the pipeline waits on them
+        with span("chunk.split"):
+            return future.result()
@@ -1,7 +1,7 @@
 import yaml
 
 from anyqa.constants import CONFIG_FILE
-from anyqa.models.query import Persona
+from anyqa.models.persona import Persona
 
 import logging
 
@@ -0,0 +1,152 @@
+import logging
+import math
+import re
+from typing import Callable
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for text, at about four characters per token."""
+    return math.ceil(len(text) / 4)
+
+
+def merge_overlap(first: str, second: str, min_overlap: int = 20) -> str | None:
+    """Merge two texts if the end of one is the start of the other, returning None if they do not overlap."""
+    for a, b in ((first, second), (second, first)):
+        if b in a:
+            return a
+        probe = b[:min_overlap]
+        if len(probe) < min_overlap:
+            continue
+        start = a.find(probe, max(len(a) - len(b), 0))
+        while start != -1:
+            if b.startswith(a[start:]):
+                return a[:start] + b
+            start = a.find(probe, start + 1)
+    return None
+
+
+class ContextStats:
+    """Token accounting for a packed context.
+
+    deduplicated_tokens were saved by merging overlapping chunks and dropping near-duplicate blocks, and
+    truncated_tokens were left out to fit the token budget.
+    """
+
+    def __init__(self, n_docs: int, n_blocks: int, original_tokens: int, packed_tokens: int, deduplicated_tokens: int, truncated_tokens: int):
+        self.n_docs = n_docs
+        self.n_blocks = n_blocks
+        self.original_tokens = original_tokens
+        self.packed_tokens = packed_tokens
+        self.deduplicated_tokens = deduplicated_tokens
+        self.truncated_tokens = truncated_tokens
+
+    def to_dict(self):
+        return {
+            "n_docs": self.n_docs,
+            "n_blocks": self.n_blocks,
+            "original_tokens": self.original_tokens,
+            "packed_tokens": self.packed_tokens,
+            "deduplicated_tokens": self.deduplicated_tokens,
+            "truncated_tokens": self.truncated_tokens,
+        }
+
+
+class ContextPacker:
+    """Assemble retrieved documents into a prompt context that fits a token budget.
+
+    Documents are taken in relevance order. Overlapping chunks from the same source are merged into one block,
+    near-duplicate blocks are dropped, and blocks are added until max_tokens is reached. The most relevant block is
+    always included, truncated if it does not fit on its own.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int | None,
+        token_counter: Callable[[str], int] = estimate_tokens,
+        duplicate_threshold: float = 0.9,
+        min_overlap: int = 20,
+        min_block_tokens: int = 64,
+    ):
+        """Initialize."""
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.min_block_tokens = min_block_tokens
+
+    def pack(self, docs: list[Document]) -> tuple[str, ContextStats]:
+        """Build the context string for docs, which must be ordered from most to least relevant."""
+        original_tokens = sum(self.token_counter(doc.page_content) for doc in docs)
+
+        # Merge overlapping chunks from the same source into the block of the most relevant one
+        blocks: list[tuple[str | None, str]] = []
+        for doc in docs:
+            source = doc.metadata.get("source")
+            text = doc.page_content
+            for i, (block_source, block_text) in enumerate(blocks):
+                if source is not None and block_source == source:
+                    merged = merge_overlap(block_text, text, min_overlap=self.min_overlap)
+                    if merged is not None:
+                        blocks[i] = (block_source, merged)
+                        break
+            else:
+                blocks.append((source, text))
+
+        # Drop near-duplicates, then fill the budget in relevance order
+        unique = []
+        unique_words = []
+        for _, text in blocks:
+            words = set(WORD_PATTERN.findall(text.lower()))
+            if any(self._similarity(words, other) >= self.duplicate_threshold for other in unique_words):
+                continue
+            unique.append(text)
+            unique_words.append(words)
+        unique_tokens = [self.token_counter(text) for text in unique]
+
+        selected = []
+        used_tokens = 0
+        for text, tokens in zip(unique, unique_tokens):
+            if self.max_tokens is not None and used_tokens + tokens > self.max_tokens:
+                remaining = self.max_tokens - used_tokens
+                # Later blocks are only worth truncating if a useful part of them fits
+                if selected and remaining < self.min_block_tokens:
+                    break
+                text = self._truncate(text, tokens, remaining)
+                tokens = self.token_counter(text)
+            selected.append(text)
+            used_tokens += tokens
+
+        context = "\n\n".join(selected)
+        stats = ContextStats(
+            n_docs=len(docs),
+            n_blocks=len(selected),
+            original_tokens=original_tokens,
+            packed_tokens=used_tokens,
+            deduplicated_tokens=max(original_tokens - sum(unique_tokens), 0),
+            truncated_tokens=sum(unique_tokens) - used_tokens,
+        )
+        logger.debug(
+            f"Packed {stats.n_docs} documents into {stats.n_blocks} blocks of {used_tokens} tokens, "
+            f"{stats.deduplicated_tokens} deduplicated and {stats.truncated_tokens} truncated"
+        )
+        return context, stats
+
+    def _truncate(self, text: str, tokens: int, max_tokens: int) -> str:
+        # Cut text in proportion to its token count, then trim further if the counter still finds it too long
+        text = text[: int(len(text) * max(max_tokens, 0) / tokens)]
+        while text and self.token_counter(text) > max_tokens:
+            text = text[: int(len(text) * 0.9)]
+        return text
+
+    @staticmethod
+    def _similarity(a: set[str], b: set[str]) -> float:
+        # Jaccard similarity of the word sets, so that a short block contained in a long one is not a duplicate
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
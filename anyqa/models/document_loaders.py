@@ -1,16 +1,25 @@
+import itertools
 import os
 import logging
+import multiprocessing
+import queue
 import re
+import signal
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator
 
+from bs4 import BeautifulSoup
 from langchain_core.documents import Document
-from langchain_community.document_loaders.csv_loader import CSVLoader
 from langchain_community.document_loaders.text import TextLoader
-from langchain_community.document_loaders.excel import UnstructuredExcelLoader
 from langchain_community.document_loaders.word_document import Docx2txtLoader
-from langchain_community.document_loaders.unstructured import UnstructuredFileLoader
 from langchain_community.document_loaders.markdown import UnstructuredMarkdownLoader
 from langchain_community.document_loaders.html import UnstructuredHTMLLoader
-from langchain_community.document_loaders.sitemap import SitemapLoader
+
+from anyqa.models.file_loaders import CSVRowLoader, ExcelRowLoader, PDFPageLoader
+from anyqa.models.profiling import span
+from anyqa.models.web_fetcher import HttpCache, WebFetcher, iterate_async
 
 
 logger = logging.getLogger(__name__)
@@ -20,42 +29,246 @@ DOCUMENT_MAP = {
     ".txt": TextLoader,
     ".md": UnstructuredMarkdownLoader,
     ".py": TextLoader,
-    ".pdf": UnstructuredFileLoader,
-    ".csv": CSVLoader,
-    ".xls": UnstructuredExcelLoader,
-    ".xlsx": UnstructuredExcelLoader,
+    ".pdf": PDFPageLoader,
+    ".csv": CSVRowLoader,
+    ".xls": ExcelRowLoader,
+    ".xlsx": ExcelRowLoader,
     ".docx": Docx2txtLoader,
     ".doc": Docx2txtLoader,
 }
 
+# Extensions whose loaders yield many documents per file, e.g. row batches or pages. In a process pool, these are
+# parsed in a worker that sends each document back through a bounded queue as soon as it is read, so that memory stays
+# bounded on very large files.
+STREAMED_EXTENSIONS = {".pdf", ".csv", ".xls", ".xlsx"}
+
+# Documents of a streamed file that a worker may parse ahead of the main process
+STREAM_QUEUE_SIZE = 8
+
+
+def lazy_load_single_document(file_path: str) -> Iterator[Document]:
+    # Loads the documents of a single file, one at a time
+    file_extension = os.path.splitext(file_path)[1]
+    loader_class = DOCUMENT_MAP.get(file_extension)
+    if loader_class:
+        loader = loader_class(file_path)
+    else:
+        raise ValueError("Document type is undefined")
+    for doc in loader.lazy_load():
+        doc.metadata["extension"] = file_extension
+        yield doc
+
+
+def load_single_document(file_path: str) -> list[Document]:
+    return list(lazy_load_single_document(file_path))
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("Timed out while parsing document")
+
+
+def _load_single_document_with_timeout(file_path: str, timeout: float | None) -> list[Document]:
+    # Runs in a worker process. SIGALRM interrupts the parse if it exceeds the timeout.
+    if timeout is None or not hasattr(signal, "SIGALRM"):
+        return load_single_document(file_path)
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return load_single_document(file_path)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _stream_single_document(file_path: str, timeout: float | None, documents, skip: int = 0) -> int:
+    # Runs in a worker process. Documents are put on the queue as they are parsed, followed by None, and the first skip
+    # documents are parsed but not sent. Only parsing counts towards the timeout, not waiting for the main process to
+    # take documents off the queue. Returns the number of documents sent.
+    remaining = timeout if hasattr(signal, "SIGALRM") else None
+    previous = signal.signal(signal.SIGALRM, _raise_timeout) if remaining is not None else None
+    sent = 0
+    try:
+        parsed = lazy_load_single_document(file_path)
+        for index in itertools.count():
+            if remaining is None:
+                doc = next(parsed, None)
+            else:
+                if remaining <= 0:
+                    raise TimeoutError("Timed out while parsing document")
+                signal.setitimer(signal.ITIMER_REAL, remaining)
+                try:
+                    doc = next(parsed, None)
+                finally:
+                    remaining = signal.setitimer(signal.ITIMER_REAL, 0)[0]
+            if doc is None:
+                return sent
+            if index >= skip:
+                documents.put(doc)
+                sent += 1
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGALRM, previous)
+        documents.put(None)
+
 
 class DirectoryDocumentLoader:
     """Instance of a directory document loader."""
 
-    def __init__(self, path: str, depth: int, pattern: list[str]):
-        """Initialize."""
+    def __init__(self, path: str, depth: int, pattern: list[str], workers: int = 1, timeout: float | None = None):
+        """Initialize.
+
+        When workers is greater than 1 or a per-file timeout is set, files are parsed in a process pool, and
+        STREAMED_EXTENSIONS are streamed back from their worker a document at a time. Otherwise files are streamed in
+        this process. Files that fail to parse are logged and recorded in self.failed instead of aborting the load.
+        """
         self.path = path
         self.depth = depth
         self.pattern = pattern
+        self.workers = workers
+        self.timeout = timeout
+        self.failed: list[str] = []
+        self._manager = None
 
-    def load(self):
-        docs = self.get_path_documents()
+    def load(self, paths: list[str] | None = None):
+        docs = self.get_path_documents(paths=paths)
         return docs
 
-    def load_single_document(self, file_path: str) -> Document:
-        # Loads a single document from a file path
-        file_extension = os.path.splitext(file_path)[1]
-        loader_class = DOCUMENT_MAP.get(file_extension)
-        if loader_class:
-            loader = loader_class(file_path)
-        else:
-            raise ValueError("Document type is undefined")
-        doc = loader.load()[0]
-        doc.metadata["extension"] = file_extension
-        return doc
+    def lazy_load(self, paths: list[str] | None = None) -> Iterator[Document]:
+        """Load documents one at a time, in the order of paths."""
+        if paths is None:
+            paths = self.get_paths()
+        self.failed = []
+        if self.workers > 1 or self.timeout is not None:
+            yield from self._parallel_load(paths)
+            return
+        for path in paths:
+            yield from self._stream(path)
+
+    def _stream(self, path: str) -> Iterator[Document]:
+        # Parse a file in this process one document at a time. Documents yielded before a failure are kept.
+        documents = lazy_load_single_document(path)
+        while True:
+            try:
+                with span("load.parse"):
+                    doc = next(documents, None)
+            except Exception as e:
+                self._report_failure(path, e)
+                return
+            if doc is None:
+                return
+            yield doc
+
+    def _parallel_load(self, paths: list[str]) -> Iterator[Document]:
+        # Keep a bounded window of files in flight and yield results in submission order. Each entry is a path, its
+        # future and, for streamed files, the queue its documents arrive on.
+        max_in_flight = 2 * max(self.workers, 1)
+        in_flight = deque()
+        remaining = iter(paths)
+        executor = self._new_executor()
+
+        def submit(path: str):
+            documents = None
+            try:
+                if os.path.splitext(path)[1] in STREAMED_EXTENSIONS:
+                    documents = self._new_queue()
+                    future = executor.submit(_stream_single_document, path, self.timeout, documents)
+                else:
+                    future = executor.submit(_load_single_document_with_timeout, path, self.timeout)
+            except BrokenProcessPool as e:
+                # The pool broke after the last result was read. The file is retried with the others in flight.
+                future = Future()
+                future.set_exception(e)
+            in_flight.append((path, future, documents))
+
+        try:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    submit(path)
+                if not in_flight:
+                    return
+                path, future, documents = in_flight.popleft()
+                received = 0
+                try:
+                    if documents is None:
+                        # Parsing happens in the workers, so this measures how long the pipeline waits on them
+                        with span("load.parse"):
+                            docs = future.result()
+                        yield from docs
+                    else:
+                        for doc in self._receive(future, documents):
+                            received += 1
+                            yield doc
+                except BrokenProcessPool:
+                    # A worker died, e.g. crashed or killed for memory, and took every file in flight with it. Each of
+                    # those files is retried alone so that only the one that kills its worker fails, then loading
+                    # continues in a new pool. Documents of a streamed file that were already yielded are not repeated.
+                    logger.warning(f"A document loader process died. Retrying {len(in_flight) + 1} files one at a time.")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    pending = [(path, received), *((pending_path, 0) for pending_path, _, _ in in_flight)]
+                    in_flight.clear()
+                    for pending_path, skip in pending:
+                        yield from self._isolated_load(pending_path, skip)
+                    executor = self._new_executor()
+                except Exception as e:
+                    self._report_failure(path, e)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=max(self.workers, 1), mp_context=multiprocessing.get_context("spawn"))
+
+    def _new_queue(self):
+        # Queues are served by a manager process, started the first time a streamed file is parsed in the pool
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager.Queue(maxsize=STREAM_QUEUE_SIZE)
 
-    def get_path_documents(self) -> list[Document]:
-        # Loads all documents from the source documents directory, including nested folders
+    def _receive(self, future: Future, documents) -> Iterator[Document]:
+        # Yield the documents a worker streams back until it sends None, then raise the worker's error, if any. If the
+        # worker dies before finishing, the future fails with BrokenProcessPool, which is raised here.
+        while True:
+            try:
+                with span("load.parse"):
+                    doc = documents.get(timeout=0.1)
+            except queue.Empty:
+                if future.done() and future.exception() is not None and documents.empty():
+                    future.result()
+                continue
+            if doc is None:
+                future.result()
+                return
+            yield doc
+
+    def _isolated_load(self, path: str, skip: int = 0) -> Iterator[Document]:
+        # Parse a single file in its own worker process, so that a crash only affects that file
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            if os.path.splitext(path)[1] in STREAMED_EXTENSIONS:
+                documents = self._new_queue()
+                future = executor.submit(_stream_single_document, path, self.timeout, documents, skip)
+                yield from self._receive(future, documents)
+                return
+            docs = executor.submit(_load_single_document_with_timeout, path, self.timeout).result()
+        except Exception as e:
+            self._report_failure(path, e)
+            return
+        finally:
+            # The worker may be blocked handing over documents that are no longer wanted, so it is not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+        yield from docs
+
+    def _report_failure(self, path: str, error: Exception):
+        logger.error(f"Failed to load {path}: {type(error).__name__}: {error}")
+        self.failed.append(path)
+
+    def get_paths(self) -> list[str]:
+        # Finds all loadable files in the source documents directory, including nested folders
         paths = []
         abs_path = os.path.abspath(self.path)
         for root, _, files in os.walk(self.path):
@@ -67,28 +280,44 @@ class DirectoryDocumentLoader:
                         source_file_path = os.path.join(root, file_name)
                         if file_extension in DOCUMENT_MAP.keys():
                             paths.append(source_file_path)
+        return paths
 
-        docs = []
-        for path in paths:
-            docs.append(self.load_single_document(path))
-
-        return docs
+    def get_path_documents(self, paths: list[str] | None = None) -> list[Document]:
+        # Loads all documents from the source documents directory, or only the given paths
+        return list(self.lazy_load(paths=paths))
 
 
 class WebDocumentLoader:
-    """Instance of a web document loader."""
+    """Instance of a web document loader.
 
-    def __init__(self, url: str, depth: int, pattern: list[str]):
+    Pages listed in the sitemap are fetched concurrently, rate limited per host, and cached on disk. Pages whose
+    sitemap lastmod has not changed are read from the cache, and other cached pages are revalidated with
+    conditional requests.
+    """
+
+    def __init__(self, url: str, depth: int, pattern: list[str], concurrency: int = 8, requests_per_second: float = 2.0):
         """Initialize."""
         self.url = url
         self.depth = 1000 if depth == -1 else depth
         self.pattern = pattern
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
 
     def load(self) -> list[Document]:
         """Load documents."""
-        loader = SitemapLoader(web_path=self.url, restrict_to_same_domain=True, filter_urls=self.pattern)
-        loader.requests_per_second = 2
-        documents = loader.load()
-        for doc in documents:
-            doc.metadata["extension"] = ".html"
-        return documents
+        return list(self.lazy_load())
+
+    def lazy_load(self) -> Iterator[Document]:
+        """Load documents one at a time."""
+        cache = HttpCache()
+        fetcher = WebFetcher(cache=cache, concurrency=self.concurrency, requests_per_second=self.requests_per_second)
+        try:
+            for page in iterate_async(fetcher.crawl(self.url, patterns=self.pattern, max_depth=self.depth)):
+                metadata = {"source": page.url, "loc": page.url, "extension": ".html"}
+                if page.lastmod is not None:
+                    metadata["lastmod"] = page.lastmod
+                with span("load.parse"):
+                    text = BeautifulSoup(page.content, "html.parser").get_text()
+                yield Document(page_content=text, metadata=metadata)
+        finally:
+            cache.close()
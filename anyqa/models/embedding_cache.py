@@ -0,0 +1,170 @@
+import contextlib
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from anyqa.constants import EMBEDDING_CACHE_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+
+def hash_text(text: str) -> str:
+    """Content hash used as the cache key for a chunk."""
+    return hashlib.sha256(text.encode("UTF-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache for one embedding model, shared by every collection that uses the model.
+
+    Vectors are stored in a memory-mapped float32 matrix, and an SQLite index maps content hashes to rows of
+    the matrix along with their last access time. When the cache is full, the least recently used entries are
+    evicted and their rows are reused. Reads and writes run in SQLite immediate transactions, so processes sharing
+    the cache never allocate the same row or read a row while another process rewrites it.
+    """
+
+    def __init__(self, model_name: str, max_entries: int):
+        """Initialize."""
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.directory = EMBEDDING_CACHE_DIRECTORY / model_name.replace("/", "--")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.f32"
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.directory / "index.sqlite", timeout=60, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.connection.commit()
+
+        self.dim = None
+        self.capacity = 0
+        self.vectors = None
+        self._refresh()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Look up cached vectors, returning a mapping for the keys that were found."""
+        found = {}
+        with self.lock:
+            if keys:
+                with self._transaction():
+                    if self.vectors is not None:
+                        for key, row in self._select_rows(list(dict.fromkeys(keys))):
+                            found[key] = np.array(self.vectors[row])
+                        now = time.time()
+                        self.connection.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, keys: list[str], vectors: np.ndarray):
+        """Store vectors, evicting least recently used entries if the cache is full."""
+        if not keys or self.max_entries <= 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock, self._transaction():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_meta("dim", self.dim)
+
+            # Keep only the last vector for each new key, and never more than fits in the cache
+            new = {}
+            for key, vector in zip(keys, vectors):
+                new[key] = vector
+            existing = {key for key, _ in self._select_rows(list(new))}
+            new = {key: vector for key, vector in new.items() if key not in existing}
+            new = dict(list(new.items())[-self.max_entries :])
+            if not new:
+                return
+
+            # Rows are allocated inside the transaction, so they reflect every other process's committed writes
+            next_row = self.connection.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries").fetchone()[0]
+            free_rows = list(range(next_row, max(next_row, min(self.max_entries, next_row + len(new)))))
+            n_evict = len(new) - len(free_rows)
+            if n_evict > 0:
+                evicted = self.connection.execute("SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (n_evict,)).fetchall()
+                self.connection.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                free_rows.extend(row for _, row in evicted)
+                logger.debug(f"Evicted {len(evicted)} entries from the embedding cache for {self.model_name}")
+
+            self._ensure_capacity(max(free_rows) + 1)
+            now = time.time()
+            for row, vector in zip(free_rows, new.values()):
+                self.vectors[row] = vector
+            self.vectors.flush()
+            self.connection.executemany(
+                "INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)", [(key, row, now) for key, row in zip(new, free_rows)]
+            )
+
+    def close(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes SQLite's write lock up front, serializing this block with other processes
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._refresh()
+            yield
+        except BaseException:
+            self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
+
+    def _refresh(self):
+        # Another process may have set the dimension or grown the vector file since it was mapped
+        self.dim = self._get_meta("dim")
+        capacity = self._get_meta("capacity") or 0
+        if self.dim is not None and capacity and (self.vectors is None or capacity != self.capacity):
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    def _select_rows(self, keys: list[str]) -> list[tuple[str, int]]:
+        rows = []
+        for start in range(0, len(keys), 500):
+            part = keys[start : start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows.extend(self.connection.execute(f"SELECT key, row FROM entries WHERE key IN ({placeholders})", part).fetchall())
+        return rows
+
+    def _ensure_capacity(self, rows: int):
+        # Grow the vector file geometrically, up to max_entries rows
+        if rows <= self.capacity:
+            return
+        capacity = min(self.max_entries, max(rows, 2 * self.capacity, 1024))
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.capacity = capacity
+        self._set_meta("capacity", capacity)
+
+    def _get_meta(self, key: str) -> int | None:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key: str, value: int):
+        # Only called inside a transaction, which commits it
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
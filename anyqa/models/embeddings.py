@@ -1,21 +1,354 @@
+import json
 import logging
+import os
+import pathlib
+import shutil
+import time
 
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+import numpy as np
+from langchain_core.embeddings import Embeddings as BaseEmbeddings
 
-from anyqa.constants import HF_MODEL_PATH, DEVICE
+from anyqa.constants import (
+    DEFAULT_EMBEDDING_BACKEND,
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_EMBEDDING_CACHE_SIZE,
+    HF_MODEL_PATH,
+    ONNX_MODEL_DIRECTORY,
+    get_device,
+)
+from anyqa.models.embedding_cache import EmbeddingCache, hash_text
+from anyqa.models.profiling import span
 
 logger = logging.getLogger(__name__)
 
+ONNX_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+class EmbeddingEngine(BaseEmbeddings):
+    """Batched sentence-transformers encoder used for both loading and retrieval.
+
+    Texts are sorted by length before batching so that each batch pads to a similar length, and results are
+    returned in the original order as L2-normalized float32 vectors. When processes is greater than 1, encoding
+    is spread over a sentence-transformers multi-process pool. Document embeddings are looked up in, and saved to,
+    an on-disk cache keyed by model and content hash, so re-loading a chunk never re-embeds it.
+    """
+
+    backend = "torch"
+
+    def __init__(
+        self,
+        model_name: str,
+        device: str,
+        cache_folder: str,
+        batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        processes: int = 1,
+        cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE,
+    ):
+        """Initialize."""
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.processes = processes
+        self.pool = None
+        self.dimension = self._load_model(cache_folder)
+        # Other backends produce slightly different vectors, so they get their own cache
+        cache_name = model_name if self.backend == "torch" else f"{model_name}@{self.backend}"
+        self.cache = EmbeddingCache(model_name=cache_name, max_entries=cache_size) if cache_size > 0 else None
+
+        # Throughput statistics across all calls
+        self.n_embedded = 0
+        self.seconds = 0.0
+
+    def _load_model(self, cache_folder: str) -> int:
+        # Loads the model, shared with other engines in this process, and returns its embedding dimension
+        from anyqa.models.model_store import get_model, load_sentence_transformer
+
+        key = ("torch", self.model_name, self.device)
+        self.model = get_model(key, lambda: load_sentence_transformer(self.model_name, self.device, cache_folder))
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.n_embedded / self.seconds if self.seconds else 0.0
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Encode texts into a (len(texts), dim) matrix of normalized float32 vectors."""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        with span("embed.encode", texts=len(texts)):
+            return self._encode(texts)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        start = time.perf_counter()
+        # Length bucketing: longest first, so batches contain texts of similar length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        sorted_texts = [texts[i] for i in order]
+        vectors = np.asarray(self._encode_sorted(sorted_texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+
+        embeddings = np.empty_like(vectors)
+        embeddings[order] = vectors
+        elapsed = time.perf_counter() - start
+
+        self.n_embedded += len(texts)
+        self.seconds += elapsed
+        logger.debug(f"Embedded {len(texts)} chunks in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec)")
+        return embeddings
+
+    def _encode_sorted(self, texts: list[str]) -> np.ndarray:
+        if self.processes > 1 and len(texts) > self.batch_size:
+            if self.pool is None:
+                self.pool = self.model.start_multi_process_pool(target_devices=[self.device] * self.processes)
+            return self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.cache is None:
+            return self.encode(texts).tolist()
+
+        with span("embed.cache_lookup"):
+            keys = [hash_text(text) for text in texts]
+            cached = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        vectors = self.encode([texts[i] for i in missing])
+        with span("embed.cache_write"):
+            self.cache.put_many([keys[i] for i in missing], vectors)
+
+        embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key in cached:
+                embeddings[i] = cached[key]
+        embeddings[missing] = vectors
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.encode([text])[0].tolist()
+
+    def close(self):
+        """Stop the multi-process pool, if one was started, and close the cache."""
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+
+def get_onnx_directory(model_name: str, revision: str) -> pathlib.Path:
+    return ONNX_MODEL_DIRECTORY / model_name.replace("/", "--") / revision
+
+
+# Pooling attributes of sentence-transformers Pooling modules, mapped to the modes pool_embeddings supports
+POOLING_MODES = {
+    "pooling_mode_cls_token": "cls",
+    "pooling_mode_max_tokens": "max",
+    "pooling_mode_mean_tokens": "mean",
+    "pooling_mode_mean_sqrt_len_tokens": None,
+    "pooling_mode_weightedmean_tokens": None,
+    "pooling_mode_lasttoken": None,
+}
+
+
+def get_pooling_mode(pooling) -> str:
+    """ONNX pooling mode of a sentence-transformers Pooling module, which must use exactly one of cls, max or mean pooling."""
+    enabled = [name for name in POOLING_MODES if getattr(pooling, name, False)]
+    if len(enabled) != 1 or POOLING_MODES[enabled[0]] is None:
+        raise ValueError(f"Pooling {enabled} is not supported by the ONNX backend. Only one of cls, max or mean pooling is.")
+    return POOLING_MODES[enabled[0]]
+
+
+def export_onnx(model_name: str, quantize: bool = False, cache_folder: str = str(HF_MODEL_PATH)) -> pathlib.Path:
+    """Export a sentence-transformers model to ONNX, optionally int8-quantized, returning the path of the model file.
+
+    Exports are written under hf_models/onnx/ along with the tokenizer and pooling settings, and reused afterwards.
+    They are keyed by the revision of the local model, so pulling a new snapshot exports it again, and are built in a
+    temporary directory and renamed into place, so an interrupted export is never reused.
+    Only models made of a transformer, a cls, max or mean pooling layer and optionally normalization layers are supported.
+    """
+    from anyqa.models.model_store import get_model_revision
+
+    revision = get_model_revision(model_name, cache_folder)
+    directory = get_onnx_directory(model_name, revision)
+    fp32_path = directory / "model.onnx"
+    int8_path = directory / "model.int8.onnx"
+    path = int8_path if quantize else fp32_path
+    if path.exists():
+        return path
+
+    if not fp32_path.exists():
+        import torch
+        from sentence_transformers import models
+
+        from anyqa.models.model_store import load_sentence_transformer
+
+        model = load_sentence_transformer(model_name, "cpu", cache_folder)
+        modules = list(model)
+        if (
+            len(modules) < 2
+            or not isinstance(modules[0], models.Transformer)
+            or not isinstance(modules[1], models.Pooling)
+            or not all(isinstance(module, models.Normalize) for module in modules[2:])
+        ):
+            raise ValueError(f"Model {model_name} is not supported by the ONNX backend. Only transformer, pooling and normalize layers are.")
+        transformer, pooling = modules[0], modules[1]
+        pooling_mode = get_pooling_mode(pooling)
+
+        logger.info(f"Exporting {model_name} at revision {revision} to ONNX")
+        tmp_directory = directory.with_name(f".{directory.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        tmp_directory.mkdir(parents=True)
+        try:
+            transformer.tokenizer.save_pretrained(tmp_directory)
+            inputs = transformer.tokenizer(["Export"], return_tensors="pt")
+            input_names = [name for name in ONNX_INPUT_NAMES if name in inputs]
+            dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in [*input_names, "last_hidden_state"]}
+            with torch.no_grad():
+                torch.onnx.export(
+                    transformer.auto_model.eval(),
+                    ({name: inputs[name] for name in input_names},),
+                    str(tmp_directory / fp32_path.name),
+                    input_names=input_names,
+                    output_names=["last_hidden_state"],
+                    dynamic_axes=dynamic_axes,
+                    opset_version=14,
+                    do_constant_folding=True,
+                )
+            settings = {"pooling": pooling_mode, "max_seq_length": model.max_seq_length, "input_names": input_names, "revision": revision}
+            (tmp_directory / "anyqa.json").write_text(json.dumps(settings))
+            try:
+                os.replace(tmp_directory, directory)
+            except OSError:
+                # Another process finished the same export first
+                if not fp32_path.exists():
+                    raise
+        finally:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {model_name} to int8")
+        tmp_path = int8_path.with_name(f".{int8_path.name}.tmp-{os.getpid()}")
+        try:
+            quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return path
+
+
+def load_onnx_runtime(model_name: str, quantize: bool, cache_folder: str = str(HF_MODEL_PATH)) -> tuple:
+    """ONNX Runtime session, tokenizer and export settings for a model, exporting it first if needed."""
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("The ONNX embedding backend requires onnxruntime. Install it with `pip install anyqa[onnx]`.") from e
+    from transformers import AutoTokenizer
+
+    path = export_onnx(model_name, quantize=quantize, cache_folder=cache_folder)
+    settings = json.loads((path.parent / "anyqa.json").read_text())
+    tokenizer = AutoTokenizer.from_pretrained(path.parent)
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+    return session, tokenizer, settings
+
+
+def pool_embeddings(hidden: np.ndarray, attention_mask: np.ndarray, mode: str) -> np.ndarray:
+    """Pool token embeddings of shape (batch, sequence, dim) into sentence embeddings."""
+    if mode == "cls":
+        return hidden[:, 0]
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    if mode == "max":
+        return np.where(mask > 0, hidden, -1e9).max(axis=1)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+class OnnxEmbeddingEngine(EmbeddingEngine):
+    """EmbeddingEngine that runs an ONNX export of the model, optionally int8-quantized, with ONNX Runtime on CPU.
+
+    Requires the onnx extra. PyTorch is only imported to export the model the first time it is used.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_folder: str,
+        batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE,
+        quantize: bool = False,
+    ):
+        """Initialize."""
+        self.quantize = quantize
+        super().__init__(model_name=model_name, device="cpu", cache_folder=cache_folder, batch_size=batch_size, processes=1, cache_size=cache_size)
+
+    @property
+    def backend(self) -> str:
+        return "onnx-int8" if self.quantize else "onnx"
+
+    @staticmethod
+    def model_key(model_name: str, quantize: bool) -> tuple:
+        return ("onnx-int8" if quantize else "onnx", model_name)
+
+    def _load_model(self, cache_folder: str) -> int:
+        from anyqa.models.model_store import get_model
+
+        key = self.model_key(self.model_name, self.quantize)
+        self.session, self.tokenizer, settings = get_model(key, lambda: load_onnx_runtime(self.model_name, self.quantize, cache_folder))
+        self.pooling = settings["pooling"]
+        self.max_seq_length = settings["max_seq_length"]
+        self.input_names = settings["input_names"]
+        return self._encode_sorted(["dimension"]).shape[1]
+
+    def _encode_sorted(self, texts: list[str]) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            inputs = self.tokenizer(batch, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: inputs[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            batches.append(pool_embeddings(hidden, inputs["attention_mask"], self.pooling))
+        return np.concatenate(batches)
+
 
 class Embeddings:
-    def __init__(self, model_name: str):
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        processes: int = 1,
+        cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE,
+        backend: str = DEFAULT_EMBEDDING_BACKEND,
+    ):
         self.model_name = model_name
-        self.model_kwargs = {"device": DEVICE}
         self.cache_folder = str(HF_MODEL_PATH)
+        self.batch_size = batch_size
+        self.processes = processes
+        self.cache_size = cache_size
+        self.backend = backend
 
     def get_embedding_function(self):
-        logger.info(f"Using embedding model {self.model_name}")
-        embedding_function = HuggingFaceEmbeddings(
-            model_name=self.model_name, model_kwargs=self.model_kwargs, cache_folder=self.cache_folder, show_progress=True
+        logger.info(f"Using embedding model {self.model_name} ({self.backend})")
+        if self.backend in ("onnx", "onnx-int8"):
+            if self.processes > 1:
+                logger.warning("The ONNX backend uses ONNX Runtime threads instead of processes. Ignoring embedding processes.")
+            return OnnxEmbeddingEngine(
+                model_name=self.model_name,
+                cache_folder=self.cache_folder,
+                batch_size=self.batch_size,
+                cache_size=self.cache_size,
+                quantize=self.backend == "onnx-int8",
+            )
+        if self.backend != "torch":
+            raise ValueError(f"Unknown embedding backend: {self.backend}")
+        embedding_function = EmbeddingEngine(
+            model_name=self.model_name,
+            device=get_device(),
+            cache_folder=self.cache_folder,
+            batch_size=self.batch_size,
+            processes=self.processes,
+            cache_size=self.cache_size,
         )
         return embedding_function
@@ -0,0 +1,126 @@
+import csv
+import logging
+from typing import Iterable, Iterator
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Spreadsheet rows combined into one document. Batches longer than the chunk size are split on row boundaries.
+ROWS_PER_DOCUMENT = 20
+
+
+def format_row(header: list[str], values: Iterable) -> str:
+    """Render a row as "column: value" lines, leaving out empty cells."""
+    return "\n".join(f"{name}: {value}" for name, value in zip(header, values) if value is not None and str(value).strip() != "")
+
+
+def row_documents(
+    rows: Iterator[tuple[int, list]], header: list[str], metadata: dict, location: str, rows_per_document: int = ROWS_PER_DOCUMENT
+) -> Iterator[Document]:
+    """Group numbered rows into documents of up to rows_per_document rows.
+
+    Each document's loc is location followed by an RFC 7111 style row range, e.g. data.csv#row=2-21.
+    """
+    texts = []
+    first = last = None
+    for number, values in rows:
+        text = format_row(header, values)
+        if not text:
+            continue
+        if first is None:
+            first = number
+        texts.append(text)
+        last = number
+        if len(texts) == rows_per_document:
+            yield Document(page_content="\n\n".join(texts), metadata={**metadata, "loc": f"{location}row={first}-{last}"})
+            texts = []
+            first = None
+    if texts:
+        yield Document(page_content="\n\n".join(texts), metadata={**metadata, "loc": f"{location}row={first}-{last}"})
+
+
+def make_header(values: Iterable) -> list[str]:
+    return [str(value).strip() if value is not None and str(value).strip() else f"column {i + 1}" for i, value in enumerate(values)]
+
+
+class CSVRowLoader(BaseLoader):
+    """Stream a CSV file as documents of ROWS_PER_DOCUMENT rows, reading one row at a time. The first row is the header."""
+
+    def __init__(self, file_path: str, encoding: str = "utf-8-sig", rows_per_document: int = ROWS_PER_DOCUMENT):
+        """Initialize."""
+        self.file_path = file_path
+        self.encoding = encoding
+        self.rows_per_document = rows_per_document
+
+    def lazy_load(self) -> Iterator[Document]:
+        with open(self.file_path, newline="", encoding=self.encoding, errors="replace") as f:
+            reader = csv.reader(f)
+            header = make_header(next(reader, []))
+            # Row 1 is the header, so data rows are numbered from 2
+            rows = enumerate(reader, start=2)
+            yield from row_documents(rows, header, {"source": self.file_path}, f"{self.file_path}#", self.rows_per_document)
+
+
+class ExcelRowLoader(BaseLoader):
+    """Stream every sheet of an .xlsx or .xls workbook as documents of ROWS_PER_DOCUMENT rows.
+
+    .xlsx files are read with openpyxl in read-only mode, which parses rows as they are iterated. .xls files are read
+    with xlrd one sheet at a time. The first row of each sheet is its header.
+    """
+
+    def __init__(self, file_path: str, rows_per_document: int = ROWS_PER_DOCUMENT):
+        """Initialize."""
+        self.file_path = file_path
+        self.rows_per_document = rows_per_document
+
+    def lazy_load(self) -> Iterator[Document]:
+        for sheet, rows in self._iter_sheets():
+            rows = enumerate(rows, start=1)
+            header = make_header(next(rows, (1, []))[1])
+            metadata = {"source": self.file_path, "sheet": sheet}
+            yield from row_documents(rows, header, metadata, f"{self.file_path}#sheet={sheet}&", self.rows_per_document)
+
+    def _iter_sheets(self) -> Iterator[tuple[str, Iterator]]:
+        if self.file_path.endswith(".xls"):
+            import xlrd
+
+            book = xlrd.open_workbook(self.file_path, on_demand=True)
+            try:
+                for name in book.sheet_names():
+                    sheet = book.sheet_by_name(name)
+                    yield name, (sheet.row_values(i) for i in range(sheet.nrows))
+                    book.unload_sheet(name)
+            finally:
+                book.release_resources()
+        else:
+            import openpyxl
+
+            book = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+            try:
+                for sheet in book.worksheets:
+                    yield sheet.title, sheet.iter_rows(values_only=True)
+            finally:
+                book.close()
+
+
+class PDFPageLoader(BaseLoader):
+    """Stream a PDF as one document per page, extracting text a page at a time. Pages without text are skipped."""
+
+    def __init__(self, file_path: str):
+        """Initialize."""
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        from pypdf import PdfReader
+
+        with open(self.file_path, "rb") as f:
+            reader = PdfReader(f)
+            for number, page in enumerate(reader.pages, start=1):
+                text = page.extract_text()
+                if not text or not text.strip():
+                    logger.debug(f"Skipping page {number} of {self.file_path}: no text")
+                    continue
+                metadata = {"source": self.file_path, "page": number, "loc": f"{self.file_path}#page={number}"}
+                yield Document(page_content=text, metadata=metadata)
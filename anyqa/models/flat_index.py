@@ -0,0 +1,334 @@
+import contextlib
+import json
+import logging
+import operator
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+
+from anyqa.constants import FLAT_INDEX_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 1024
+QUERY_BLOCK_SIZE = 256
+
+WHERE_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, values: value in values,
+    "$nin": lambda value, values: value not in values,
+}
+
+
+def matches_where(metadata: dict, where: dict | None) -> bool:
+    """Evaluate a Chroma-style where filter against one record's metadata.
+
+    Supports equality shorthand ({"source": "a.md"}), the comparison operators in WHERE_OPERATORS, and $and/$or.
+    Records without a key never match a condition on that key.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            conditions = condition.items() if isinstance(condition, dict) else [("$eq", condition)]
+            for name, value in conditions:
+                if name not in WHERE_OPERATORS:
+                    raise ValueError(f"Unsupported where operator: {name}")
+                if not WHERE_OPERATORS[name](metadata[key], value):
+                    return False
+    return True
+
+
+def _write_json(path, value: dict):
+    # Write to a temporary file and rename it into place, so that a crash never leaves a partial file
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(value))
+    os.replace(tmp_path, path)
+
+
+class FlatCollection:
+    """In-process vector collection with exact search, exposing the subset of Chroma's Collection API that ChromaDB uses.
+
+    Normalized embeddings live in a memory-mapped float32 matrix that grows in place, and an SQLite table maps each
+    row to its id, document and metadata. Deleted rows are reused by later adds. Queries score every live row with
+    one matrix multiplication per block of queries and select the top k with argpartition, so results are exact and
+    opening a collection costs no more than mapping a file.
+
+    Writes run in SQLite immediate transactions, so several processes can add to one collection without taking the
+    same rows, and every operation first picks up records and growth committed by other processes.
+    """
+
+    def __init__(self, name: str):
+        """Initialize."""
+        self.name = name
+        self.directory = FLAT_INDEX_DIRECTORY / name
+        if not self.exists(name):
+            raise ValueError(f"Flat collection {name} does not exist")
+        self.lock = threading.RLock()
+        self.vectors_path = self.directory / "vectors.f32"
+        self.info_path = self.directory / "collection.json"
+        self.connection = sqlite3.connect(self.directory / "records.sqlite", timeout=60, check_same_thread=False)
+        self.dim = None
+        self.capacity = 0
+        self.vectors = None
+
+        # Rows in use, and their parsed metadata for filtering, are kept in memory and reloaded when another
+        # process changes the records or the collection info
+        self.alive = np.zeros(0, dtype=bool)
+        self._metadatas = None
+        self._data_version = None
+        self._info_mtime = None
+        self._refresh()
+
+    @staticmethod
+    def exists(name: str) -> bool:
+        return (FLAT_INDEX_DIRECTORY / name / "collection.json").exists()
+
+    @classmethod
+    def create(cls, name: str, metadata: dict) -> "FlatCollection":
+        directory = FLAT_INDEX_DIRECTORY / name
+        if cls.exists(name):
+            raise ValueError(f"Flat collection {name} already exists")
+        directory.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(directory / "records.sqlite")
+        connection.execute("CREATE TABLE IF NOT EXISTS records (row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT)")
+        connection.commit()
+        connection.close()
+        _write_json(directory / "collection.json", {"metadata": metadata})
+        return cls(name)
+
+    @staticmethod
+    def list_names() -> list[str]:
+        if not FLAT_INDEX_DIRECTORY.exists():
+            return []
+        return sorted(path.parent.name for path in FLAT_INDEX_DIRECTORY.glob("*/collection.json"))
+
+    def drop(self):
+        """Delete the collection from disk."""
+        with self.lock:
+            self.connection.close()
+            self.vectors = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def count(self) -> int:
+        with self.lock:
+            self._refresh()
+            return int(self.alive.sum())
+
+    def _save_info(self):
+        info = {"metadata": self.metadata, "dim": self.dim, "capacity": self.capacity}
+        _write_json(self.info_path, info)
+        self._info_mtime = self.info_path.stat().st_mtime_ns
+
+    def _refresh(self):
+        # Reload state that another process may have changed since it was last read
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        info_mtime = self.info_path.stat().st_mtime_ns
+        if data_version == self._data_version and info_mtime == self._info_mtime:
+            return
+        info = json.loads(self.info_path.read_text())
+        self.metadata = info["metadata"]
+        self.dim = info.get("dim")
+        capacity = info.get("capacity", 0)
+        if self.dim is not None and capacity and (self.vectors is None or capacity != self.capacity):
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.capacity = capacity
+        self.alive = np.zeros(self.capacity, dtype=bool)
+        rows = [row for (row,) in self.connection.execute("SELECT row FROM records")]
+        self.alive[rows] = True
+        self._metadatas = None
+        self._data_version = data_version
+        self._info_mtime = info_mtime
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes SQLite's write lock up front, so row allocation is serialized with other processes
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._refresh()
+            yield
+        except BaseException:
+            self.connection.rollback()
+            # Rows marked alive before the rollback must be reloaded
+            self._data_version = None
+            raise
+        else:
+            self.connection.commit()
+
+    def _grow(self, needed: int):
+        # Extend the file in place and remap it, doubling capacity
+        capacity = max(self.capacity, INITIAL_CAPACITY)
+        while capacity < needed:
+            capacity *= 2
+        if self.vectors is not None:
+            self.vectors.flush()
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.alive = np.concatenate([self.alive, np.zeros(capacity - self.capacity, dtype=bool)])
+        self.capacity = capacity
+        self._save_info()
+
+    def add(self, ids: list[str], embeddings, documents: list[str] | None = None, metadatas: list[dict] | None = None):
+        """Add records. Ids must not already exist."""
+        if not ids:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self.lock, self._transaction():
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._save_info()
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match collection dimension {self.dim}")
+
+            free = np.flatnonzero(~self.alive)
+            if len(free) < len(ids):
+                self._grow(self.capacity + len(ids) - len(free))
+                free = np.flatnonzero(~self.alive)
+            rows = free[: len(ids)]
+
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            self.vectors[rows] = embeddings / np.maximum(norms, 1e-12)
+            self.vectors.flush()
+            self.connection.executemany(
+                "INSERT INTO records (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(int(row), id, document, json.dumps(metadata or {})) for row, id, document, metadata in zip(rows, ids, documents, metadatas)],
+            )
+            self.alive[rows] = True
+            self._metadatas = None
+
+    def _rows_for_ids(self, ids: list[str]) -> dict[str, int]:
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(self.connection.execute(f"SELECT id, row FROM records WHERE id IN ({placeholders})", batch).fetchall())
+        return found
+
+    def _get_metadatas(self) -> dict[int, dict]:
+        if self._metadatas is None:
+            self._metadatas = {row: json.loads(metadata) for row, metadata in self.connection.execute("SELECT row, metadata FROM records")}
+        return self._metadatas
+
+    def _filter_rows(self, where: dict | None) -> np.ndarray:
+        # Boolean mask over rows that are alive and match the filter
+        if not where:
+            return self.alive.copy()
+        mask = np.zeros(self.capacity, dtype=bool)
+        for row, metadata in self._get_metadatas().items():
+            if matches_where(metadata, where):
+                mask[row] = True
+        return mask
+
+    def get(
+        self,
+        ids: list[str] | None = None,
+        where: dict | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        include: list[str] | None = None,
+    ) -> dict:
+        """Records by id or filter, in row order, with the fields named in include."""
+        include = ["documents", "metadatas"] if include is None else include
+        with self.lock:
+            self._refresh()
+            if ids is not None:
+                found = self._rows_for_ids(ids)
+                rows = [found[id] for id in ids if id in found]
+            else:
+                rows = np.flatnonzero(self._filter_rows(where)).tolist()
+            if where and ids is not None:
+                metadatas = self._get_metadatas()
+                rows = [row for row in rows if matches_where(metadatas[row], where)]
+            rows = rows[offset or 0 :]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._records(rows, include)
+
+    def _records(self, rows: list[int], include: list[str]) -> dict:
+        by_row = {}
+        for start in range(0, len(rows), 500):
+            batch = rows[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for row, id, document, metadata in self.connection.execute(
+                f"SELECT row, id, document, metadata FROM records WHERE row IN ({placeholders})", batch
+            ):
+                by_row[row] = (id, document, metadata)
+        result = {"ids": [by_row[row][0] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [by_row[row][1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(by_row[row][2]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[rows]) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return result
+
+    def delete(self, ids: list[str] | None = None, where: dict | None = None):
+        """Delete records by id, by filter, or both."""
+        with self.lock, self._transaction():
+            if ids is not None:
+                rows = list(self._rows_for_ids(ids).values())
+                if where:
+                    metadatas = self._get_metadatas()
+                    rows = [row for row in rows if matches_where(metadatas[row], where)]
+            elif where:
+                rows = np.flatnonzero(self._filter_rows(where)).tolist()
+            else:
+                raise ValueError("One of ids or where must be given")
+            for start in range(0, len(rows), 500):
+                batch = rows[start : start + 500]
+                self.connection.execute(f"DELETE FROM records WHERE row IN ({','.join('?' * len(batch))})", batch)
+            self.alive[rows] = False
+            self._metadatas = None
+
+    def query(self, query_embeddings, n_results: int = 4, where: dict | None = None, include: list[str] | None = None) -> dict:
+        """Exact top n_results by cosine similarity for each query, in Chroma's result layout with cosine distances."""
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        query_embeddings = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        query_embeddings = query_embeddings / np.maximum(np.linalg.norm(query_embeddings, axis=1, keepdims=True), 1e-12)
+        keys = ["ids", *[key for key in ("documents", "metadatas", "distances") if key in include]]
+        results = {key: [] for key in keys}
+        with self.lock:
+            self._refresh()
+            mask = self._filter_rows(where)
+            candidates = np.flatnonzero(mask)
+            k = min(n_results, len(candidates))
+            if k == 0:
+                for key in keys:
+                    results[key] = [[] for _ in query_embeddings]
+                return results
+            # Score the contiguous block of rows up to the last candidate, then rule out rows that are free or filtered out
+            end = candidates[-1] + 1
+            excluded = ~mask[:end]
+            for start in range(0, len(query_embeddings), QUERY_BLOCK_SIZE):
+                scores = query_embeddings[start : start + QUERY_BLOCK_SIZE] @ self.vectors[:end].T
+                if excluded.any():
+                    scores[:, excluded] = -np.inf
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                for query_scores, rows in zip(scores, top):
+                    rows = rows[np.argsort(-query_scores[rows])]
+                    records = self._records(rows.tolist(), include)
+                    for key in keys:
+                        if key != "distances":
+                            results[key].append(records[key])
+                    if "distances" in include:
+                        results["distances"].append((1.0 - query_scores[rows]).tolist())
+        return results
@@ -0,0 +1,162 @@
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from anyqa.constants import CATALOG_PAGE_SIZE, LEXICAL_INDEX_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens. Identifiers like snake_case names are kept whole and also split into their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if part)
+    return tokens
+
+
+class BM25Index:
+    """On-disk BM25 inverted index for one collection, stored in SQLite next to the Chroma database."""
+
+    def __init__(self, collection_name: str, k1: float = 1.5, b: float = 0.75):
+        """Initialize."""
+        self.collection_name = collection_name
+        self.k1 = k1
+        self.b = b
+        self.path = LEXICAL_INDEX_DIRECTORY / f"{collection_name}.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS postings_term ON postings (term)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS postings_id ON postings (id)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.connection.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('n_docs', 0), ('total_length', 0)")
+        self.connection.commit()
+
+    def add(self, ids: list[str], texts: list[str]):
+        """Index texts under their ids. Ids that are already indexed are skipped."""
+        with self.lock:
+            existing = set(self._select_existing(ids))
+            docs = []
+            postings = []
+            for id, text in zip(ids, texts):
+                if id in existing:
+                    continue
+                existing.add(id)
+                tokens = tokenize(text)
+                docs.append((id, len(tokens)))
+                postings.extend((term, id, tf) for term, tf in Counter(tokens).items())
+            if not docs:
+                return
+            self.connection.executemany("INSERT INTO docs (id, length) VALUES (?, ?)", docs)
+            self.connection.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)", postings)
+            self._update_stats(n_docs=len(docs), total_length=sum(length for _, length in docs))
+            self.connection.commit()
+
+    def delete(self, ids: list[str]):
+        """Remove ids from the index."""
+        with self.lock:
+            rows = []
+            for part in _parts(ids):
+                placeholders = ",".join("?" * len(part))
+                rows.extend(self.connection.execute(f"SELECT id, length FROM docs WHERE id IN ({placeholders})", part).fetchall())
+                self.connection.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", part)
+                self.connection.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", part)
+            self._update_stats(n_docs=-len(rows), total_length=-sum(length for _, length in rows))
+            self.connection.commit()
+
+    def drop(self):
+        """Delete the index from disk."""
+        with self.lock:
+            self.connection.close()
+            self.path.unlink(missing_ok=True)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Top k (id, score) pairs for a query, best first.
+
+        Scores are summed and ranked inside SQLite, so only the top k rows reach Python however common the terms are.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self.lock:
+            stats = dict(self.connection.execute("SELECT key, value FROM stats").fetchall())
+            n_docs = stats["n_docs"]
+            if n_docs == 0:
+                return []
+            average_length = stats["total_length"] / n_docs
+
+            frequencies = self.connection.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall()
+            if not frequencies:
+                return []
+            idf = {term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for term, df in frequencies}
+            weight = "CASE postings.term " + " ".join("WHEN ? THEN ?" for _ in idf) + " END"
+            params = [value for item in idf.items() for value in item]
+            params += [self.k1 + 1, self.k1, 1 - self.b, self.b / average_length, *idf, k]
+            rows = self.connection.execute(
+                f"SELECT postings.id, SUM({weight} * postings.tf * ? / (postings.tf + ? * (? + ? * docs.length))) AS score "
+                f"FROM postings JOIN docs ON docs.id = postings.id WHERE postings.term IN ({','.join('?' * len(idf))}) "
+                "GROUP BY postings.id ORDER BY score DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [(id, score) for id, score in rows]
+
+    def count(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT value FROM stats WHERE key = 'n_docs'").fetchone()[0]
+
+    def sync(self, collection, page_size: int = CATALOG_PAGE_SIZE) -> bool:
+        """Bring the index in line with a collection whose count differs, returning whether it changed.
+
+        Collections created before the index existed, or whose chunks were skipped as already present when reloading,
+        have records missing from the index. Records are read a page at a time and only missing ones are indexed;
+        ids no longer in the collection are removed.
+        """
+        n_records = collection.count()
+        if self.count() == n_records:
+            return False
+        logger.info(f"Rebuilding the keyword index for collection '{self.collection_name}' ({self.count()} of {n_records} records indexed)")
+        ids = set()
+        for offset in range(0, n_records, page_size):
+            page = collection.get(include=["documents"], limit=page_size, offset=offset)
+            ids.update(page["ids"])
+            self.add(page["ids"], [document or "" for document in page["documents"]])
+        if self.count() > len(ids):
+            with self.lock:
+                stale = [id for (id,) in self.connection.execute("SELECT id FROM docs") if id not in ids]
+            self.delete(stale)
+        return True
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _select_existing(self, ids: list[str]) -> list[str]:
+        existing = []
+        for part in _parts(ids):
+            placeholders = ",".join("?" * len(part))
+            existing.extend(row[0] for row in self.connection.execute(f"SELECT id FROM docs WHERE id IN ({placeholders})", part))
+        return existing
+
+    def _update_stats(self, n_docs: int, total_length: int):
+        self.connection.execute("UPDATE stats SET value = value + ? WHERE key = 'n_docs'", (n_docs,))
+        self.connection.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (total_length,))
+
+
+def _parts(ids: list[str], size: int = 500):
+    # SQLite limits the number of parameters in a single statement
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
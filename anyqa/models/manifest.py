@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+
+from anyqa.constants import MANIFEST_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """Compute the sha256 hash of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """Persisted record of the files ingested into a collection and the chunk ids they produced."""
+
+    def __init__(self, collection_name: str):
+        """Initialize."""
+        self.collection_name = collection_name
+        self.path = MANIFEST_DIRECTORY / f"{collection_name}.json"
+        self.entries: dict[str, dict] = {}
+
+    def load(self):
+        """Load the manifest from disk, if it exists."""
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text())
+        else:
+            self.entries = {}
+        return self.entries
+
+    def save(self):
+        """Save the manifest to disk atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(self.entries))
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved manifest for collection '{self.collection_name}' ({len(self.entries)} files)")
+
+    def delete(self):
+        """Delete the manifest from disk."""
+        self.entries = {}
+        self.path.unlink(missing_ok=True)
+
+    def diff(self, paths: list[str], root: str) -> tuple[list[str], list[str]]:
+        """Split paths into changed files and files under root that are no longer present.
+
+        Files whose size and mtime match the manifest are skipped without being read. Files whose stat changed but
+        whose content hash did not are refreshed in place and also skipped.
+        """
+        changed = []
+        for path in paths:
+            key = os.path.abspath(path)
+            stat = os.stat(path)
+            entry = self.entries.get(key)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            content_hash = hash_file(path)
+            if entry is not None and entry["hash"] == content_hash:
+                entry["size"] = stat.st_size
+                entry["mtime"] = stat.st_mtime
+                continue
+            changed.append(path)
+
+        present = {os.path.abspath(path) for path in paths}
+        prefix = os.path.join(os.path.abspath(root), "")
+        removed = [key for key in self.entries if key.startswith(prefix) and key not in present]
+        return changed, removed
+
+    def update(self, path: str, ids: list[str]):
+        """Record the current state of a file and the chunk ids it produced."""
+        stat = os.stat(path)
+        self.entries[os.path.abspath(path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": hash_file(path),
+            "ids": ids,
+        }
+
+    def ids(self, path: str) -> list[str]:
+        """Chunk ids recorded for a file."""
+        entry = self.entries.get(os.path.abspath(path))
+        return entry["ids"] if entry is not None else []
+
+    def remove(self, path: str) -> list[str]:
+        """Remove a file from the manifest, returning its chunk ids."""
+        entry = self.entries.pop(os.path.abspath(path), None)
+        return entry["ids"] if entry is not None else []
+
+    def forget_ids(self, ids: list[str]):
+        """Drop any file whose chunks were deleted outside of an incremental load."""
+        deleted = set(ids)
+        stale = [key for key, entry in self.entries.items() if deleted.intersection(entry["ids"])]
+        for key in stale:
+            del self.entries[key]
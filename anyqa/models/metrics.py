@@ -0,0 +1,10 @@
+import math
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of values, with q between 0 and 100."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
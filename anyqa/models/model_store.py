@@ -0,0 +1,217 @@
+import datetime
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pathlib
+import struct
+import threading
+import time
+from typing import Callable
+
+from anyqa.constants import HF_MODEL_PATH, get_device
+from anyqa.models.profiling import span
+
+logger = logging.getLogger(__name__)
+
+PINS_FILE = "pins.json"
+
+# Files that are not needed to run a sentence-transformers model with PyTorch
+IGNORE_PATTERNS = ["*.h5", "*.msgpack", "*.ot", "*.onnx", "onnx/*", "openvino/*", "flax_model*", "tf_model*", "rust_model*"]
+
+SAFETENSORS_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+
+_models = {}
+_lock = threading.Lock()
+
+# Seconds taken by the first load of each model in this process, by cache key
+load_seconds: dict[tuple, float] = {}
+
+
+def read_pins(cache_folder: str = str(HF_MODEL_PATH)) -> dict[str, dict]:
+    """Pinned snapshots by model name, each with its revision, path relative to cache_folder and pull time."""
+    path = pathlib.Path(cache_folder) / PINS_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def _write_pins(pins: dict[str, dict], cache_folder: str):
+    path = pathlib.Path(cache_folder) / PINS_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(pins, indent=2, sort_keys=True))
+    os.replace(tmp_path, path)
+
+
+def pull_model(model_name: str, revision: str | None = None, cache_folder: str = str(HF_MODEL_PATH)) -> dict:
+    """Download a snapshot of a model from the Hugging Face Hub and pin it, returning the pin.
+
+    Only the files needed to run the model with PyTorch are downloaded, preferring safetensors weights over pickled
+    ones. The snapshot is stored in the Hub cache layout under cache_folder, so the whole folder can be copied to a
+    machine without network access.
+    """
+    from huggingface_hub import HfApi, snapshot_download
+
+    info = HfApi().model_info(model_name, revision=revision)
+    ignore_patterns = list(IGNORE_PATTERNS)
+    if any(sibling.rfilename.endswith(".safetensors") for sibling in info.siblings):
+        ignore_patterns.append("*.bin")
+    logger.info(f"Pulling {model_name} at revision {info.sha}")
+    path = snapshot_download(model_name, revision=info.sha, cache_dir=cache_folder, ignore_patterns=ignore_patterns)
+    pin = {
+        "revision": info.sha,
+        "path": str(pathlib.Path(path).relative_to(cache_folder)),
+        "pulled": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    pins = read_pins(cache_folder)
+    pins[model_name] = pin
+    _write_pins(pins, cache_folder)
+    return pin
+
+
+def resolve_model(model_name: str, cache_folder: str = str(HF_MODEL_PATH)) -> pathlib.Path:
+    """Local directory of a model, without contacting the Hugging Face Hub.
+
+    Uses the pinned snapshot if there is one, and otherwise the latest snapshot already in cache_folder. Models that
+    are not available locally must be pulled first with `anyqa models pull`.
+    """
+    if os.path.isdir(model_name):
+        return pathlib.Path(model_name)
+    pin = read_pins(cache_folder).get(model_name)
+    if pin is not None:
+        path = pathlib.Path(cache_folder) / pin["path"]
+        if not path.is_dir():
+            raise FileNotFoundError(f"The pinned snapshot of {model_name} is missing from {path}. Run `anyqa models pull {model_name}`.")
+        return path
+
+    from huggingface_hub import snapshot_download
+    from huggingface_hub.utils import LocalEntryNotFoundError, OfflineModeIsEnabled
+
+    try:
+        return pathlib.Path(snapshot_download(model_name, cache_dir=cache_folder, local_files_only=True))
+    except (LocalEntryNotFoundError, OfflineModeIsEnabled) as e:
+        raise FileNotFoundError(
+            f"{model_name} is not available locally. Run `anyqa models pull {model_name}`, or on a machine without network access, "
+            f"run it elsewhere and copy {cache_folder} here."
+        ) from e
+
+
+def get_model_revision(model_name: str, cache_folder: str = str(HF_MODEL_PATH)) -> str:
+    """Revision of the local copy of a model: the commit hash of its Hub snapshot, or for a plain directory a hash of
+    its files' names, sizes and modification times."""
+    path = resolve_model(model_name, cache_folder)
+    if path.parent.name == "snapshots":
+        return path.name
+    files = sorted(
+        (str(file.relative_to(path)), stat.st_size, stat.st_mtime_ns) for file in path.rglob("*") if file.is_file() for stat in [file.stat()]
+    )
+    return hashlib.sha256(json.dumps(files).encode()).hexdigest()[:16]
+
+
+def get_model(key: tuple, load: Callable[[], object]):
+    """Process-wide model instance for key, loaded with load the first time it is requested.
+
+    Every collection using the same model shares one instance, and the duration of the first load is recorded in
+    load_seconds and logged.
+    """
+    with _lock:
+        if key not in _models:
+            start = time.perf_counter()
+            with span("model.load", model=str(key)):
+                _models[key] = load()
+            load_seconds[key] = time.perf_counter() - start
+            logger.info(f"Loaded {' '.join(key)} in {load_seconds[key]:.2f}s")
+        return _models[key]
+
+
+def mmap_safetensors(path: str) -> dict:
+    """Tensors of a .safetensors file, backed by a copy-on-write memory map of the file instead of the heap.
+
+    Pages are read from disk as they are first used and are shared with every other process mapping the same file.
+    """
+    import numpy as np
+    import torch
+
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    buffer = np.memmap(path, dtype=np.uint8, mode="c", offset=8 + header_size)
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        if start == end:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+        else:
+            tensors[name] = torch.frombuffer(buffer[start:end], dtype=dtype).reshape(info["shape"])
+    return tensors
+
+
+def _mmap_weights(transformer, path: pathlib.Path) -> bool:
+    # Point the parameters of a sentence-transformers Transformer module at a memory map of its safetensors file,
+    # freeing the heap copies. Skipped unless the file holds every parameter with a matching shape and dtype.
+    weights_path = path / "model.safetensors"
+    if not weights_path.exists():
+        return False
+    model = transformer.auto_model
+    # Assigning tensors instead of copying them into the parameters needs torch 2.1 or later
+    if "assign" not in inspect.signature(model.load_state_dict).parameters:
+        logger.debug(f"Not memory-mapping {weights_path}: this version of torch cannot assign loaded tensors")
+        return False
+    tensors = mmap_safetensors(str(weights_path))
+    prefix = f"{model.base_model_prefix}."
+    tensors = {name.removeprefix(prefix): tensor for name, tensor in tensors.items()}
+    state = model.state_dict()
+    if any(name not in tensors or tensors[name].shape != value.shape or tensors[name].dtype != value.dtype for name, value in state.items()):
+        logger.debug(f"Not memory-mapping {weights_path}: its tensors do not match the model's parameters")
+        return False
+    model.load_state_dict({name: tensors[name] for name in state}, assign=True)
+    return True
+
+
+def load_sentence_transformer(model_name: str, device: str, cache_folder: str = str(HF_MODEL_PATH)):
+    """Load a sentence-transformers model from its local snapshot. On CPU, safetensors weights are memory-mapped."""
+    from sentence_transformers import SentenceTransformer, models
+
+    path = resolve_model(model_name, cache_folder)
+    model = SentenceTransformer(str(path), device=device)
+    if device == "cpu":
+        transformer = model[0]
+        if isinstance(transformer, models.Transformer) and _mmap_weights(transformer, path):
+            logger.debug(f"Memory-mapped the weights of {model_name}")
+    return model
+
+
+def warm_model(model_name: str, backend: str, cache_folder: str = str(HF_MODEL_PATH)) -> float:
+    """Load a model into this process, exporting it first if needed, and return the load time in seconds.
+
+    Reading the weights also brings them into the OS page cache, so that the next process to load the model starts
+    faster.
+    """
+    from anyqa.models.embeddings import OnnxEmbeddingEngine, export_onnx, load_onnx_runtime
+
+    resolve_model(model_name, cache_folder)
+    if backend == "torch":
+        device = get_device()
+        key = ("torch", model_name, device)
+        get_model(key, lambda: load_sentence_transformer(model_name, device, cache_folder))
+    else:
+        quantize = backend == "onnx-int8"
+        export_onnx(model_name, quantize=quantize, cache_folder=cache_folder)
+        key = OnnxEmbeddingEngine.model_key(model_name, quantize)
+        get_model(key, lambda: load_onnx_runtime(model_name, quantize, cache_folder))
+    return load_seconds[key]
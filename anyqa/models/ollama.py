@@ -0,0 +1,29 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class OllamaClient:
+    """Minimal Ollama client that reuses pooled HTTP connections across calls and threads."""
+
+    def __init__(self, model: str, base_url: str = "http://localhost:11434", pool_size: int = 10, timeout: float | None = None):
+        """Initialize."""
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def generate(self, prompt: str) -> str:
+        """Generate a complete response for a prompt."""
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model, "prompt": prompt, "stream": False},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def close(self):
+        self.session.close()
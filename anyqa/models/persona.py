@@ -0,0 +1,7 @@
+class Persona:
+    def __init__(self, name: str, template: str):
+        self.name = name
+        self.template = template
+
+    def to_dict(self):
+        return {"name": self.name, "template": self.template}
@@ -0,0 +1,75 @@
+import itertools
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from anyqa.models.profiling import profiler
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    """Group an iterable into lists of at most batch_size items."""
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def stream_from_thread(produce: Callable[[Callable[[T], bool]], None], max_items: int) -> Iterator[T]:
+    """Run produce in a background thread and yield the items it hands over, buffering at most max_items.
+
+    produce is called with a put function that blocks while the buffer is full and returns False once the consumer
+    has gone away, after which produce should return. Exceptions raised by produce are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=max_items)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        # Block until there is room in the buffer, giving up if the consumer has gone away
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            with profiler.profile_thread():
+                produce(lambda item: put((item, None)))
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def prefetch(items: Iterable[T], max_items: int) -> Iterator[T]:
+    """Produce items from a background thread, buffering at most max_items ahead of the consumer.
+
+    The bounded buffer provides backpressure: when the consumer falls behind, the producer blocks instead of
+    reading more input into memory. Exceptions raised by the producer are re-raised in the consumer.
+    """
+
+    def produce(put: Callable[[T], bool]):
+        for item in items:
+            if not put(item):
+                return
+
+    return stream_from_thread(produce, max_items)
@@ -0,0 +1,219 @@
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import logging
+import os
+import pathlib
+import pstats
+import threading
+import time
+
+from anyqa.constants import TRACE_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+# Returned by span() while profiling is off, so that instrumented code only pays for one attribute check
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class StageStats:
+    """Aggregated timings of every span with the same name."""
+
+    def __init__(self, name: str):
+        """Initialize."""
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.self_total = 0.0
+
+    def to_dict(self):
+        return {"name": self.name, "count": self.count, "seconds": self.total, "self_seconds": self.self_total}
+
+
+class Profiler:
+    """Records named, nested timing spans across threads.
+
+    Each span is kept as a trace event and aggregated per name. Self time excludes the time spent in child spans on
+    the same thread, so stages that call each other (e.g. Chroma writes that embed) are not double counted. Work done
+    in worker processes is not traced; the parent records the time it waits for their results instead.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.events: list[dict] = []
+        self.stages: dict[str, StageStats] = {}
+        # cProfile profiles of background threads, collected while function profiling is on
+        self.thread_profiles: list[cProfile.Profile] | None = None
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.events = []
+            self.stages = {}
+
+    def span(self, name: str, **attributes):
+        """Context manager timing a stage. Does nothing unless the profiler is enabled."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, attributes)
+
+    def record(self, name: str, start: float, duration: float, **attributes):
+        """Record a stage timed by the caller, for work that cannot be wrapped in a span, such as a generator."""
+        if self.enabled:
+            self._record(name, start, duration, duration, attributes)
+
+    @contextlib.contextmanager
+    def profile_thread(self):
+        """Run cProfile in the current thread while function profiling is on.
+
+        cProfile only sees the thread that enabled it, so background threads, such as the one prefetching documents
+        during a load, wrap their work in this to have their functions included in the session's stats.
+        """
+        profiles = self.thread_profiles
+        if profiles is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                profiles.append(profile)
+
+    @contextlib.contextmanager
+    def _span(self, name: str, attributes: dict):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        # Each frame accumulates the time spent in its children
+        frame = [0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += duration
+            self._record(name, start, duration, duration - frame[0], attributes)
+
+    def _record(self, name: str, start: float, duration: float, self_duration: float, attributes: dict):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if attributes:
+            event["args"] = attributes
+        with self.lock:
+            self.events.append(event)
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageStats(name)
+            stage.count += 1
+            stage.total += duration
+            stage.self_total += self_duration
+
+    def summary(self) -> list[dict]:
+        """Per-stage totals, slowest first."""
+        with self.lock:
+            return self._summary()
+
+    def _summary(self) -> list[dict]:
+        return sorted((stage.to_dict() for stage in self.stages.values()), key=lambda stage: stage["seconds"], reverse=True)
+
+    def report(self, wall_seconds: float | None = None) -> str:
+        """Per-stage breakdown as a text table."""
+        lines = [f"{'stage':<24} {'calls':>8} {'total s':>10} {'self s':>10} {'mean ms':>10}" + ("  % wall" if wall_seconds else "")]
+        for stage in self.summary():
+            mean_ms = stage["seconds"] / stage["count"] * 1000
+            line = f"{stage['name']:<24} {stage['count']:>8} {stage['seconds']:>10.3f} {stage['self_seconds']:>10.3f} {mean_ms:>10.2f}"
+            if wall_seconds:
+                line += f"  {stage['self_seconds'] / wall_seconds:>6.1%}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def trace(self) -> dict:
+        """Trace in the Chrome trace event format, viewable in chrome://tracing or Perfetto."""
+        with self.lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms", "stages": self._summary()}
+
+
+profiler = Profiler()
+
+
+def span(name: str, **attributes):
+    """Time a stage with the process-wide profiler."""
+    return profiler.span(name, **attributes)
+
+
+class ProfilingSession:
+    """Enables the profiler, and optionally cProfile, for the duration of a command."""
+
+    def __init__(self, command: str, trace_path: str | None = None, functions: bool = False, top: int = 25):
+        """Initialize.
+
+        The stage breakdown is logged and the trace written to trace_path when the session stops. With functions set,
+        cProfile also runs, in this thread and in background threads that use profiler.profile_thread, and the hottest
+        functions are logged and their stats dumped next to the trace. Threads still running when the session stops
+        are left out.
+        """
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.command = command
+        self.trace_path = pathlib.Path(trace_path) if trace_path else TRACE_DIRECTORY / f"{command}-{timestamp}.json"
+        self.top = top
+        self.cprofile = cProfile.Profile() if functions else None
+        self.start = None
+
+    def begin(self) -> "ProfilingSession":
+        profiler.enable()
+        self.start = time.perf_counter()
+        if self.cprofile is not None:
+            profiler.thread_profiles = []
+            self.cprofile.enable()
+        return self
+
+    def stop(self):
+        thread_profiles = []
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            with profiler.lock:
+                thread_profiles, profiler.thread_profiles = profiler.thread_profiles, None
+        wall_seconds = time.perf_counter() - self.start
+        profiler.disable()
+
+        logger.info(f"Profile of '{self.command}' ({wall_seconds:.2f}s wall):\n{profiler.report(wall_seconds)}")
+        trace = profiler.trace()
+        trace["command"] = self.command
+        trace["wall_seconds"] = wall_seconds
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        self.trace_path.write_text(json.dumps(trace))
+        logger.info(f"Trace written to {self.trace_path}")
+
+        if self.cprofile is not None:
+            stats_path = self.trace_path.with_suffix(".prof")
+            output = io.StringIO()
+            stats = pstats.Stats(self.cprofile, *thread_profiles, stream=output)
+            stats.dump_stats(stats_path)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            threads = f", {len(thread_profiles)} background threads" if thread_profiles else ""
+            logger.info(f"Hottest functions (stats written to {stats_path}{threads}):\n{output.getvalue()}")
@@ -1,42 +1,258 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Iterator
+
 from langchain_community.llms.ollama import Ollama
 from langchain_core.prompts.prompt import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.documents import Document
-from langchain_core.runnables import RunnableParallel
 
+from anyqa.constants import DEFAULT_CONTEXT_TOKENS, DEFAULT_OLLAMA_URL
+from anyqa.models.answer_cache import AnswerCache
+from anyqa.models.context import ContextPacker
+from anyqa.models.ollama import OllamaClient
+from anyqa.models.persona import Persona
+from anyqa.models.profiling import profiler, span
 from anyqa.models.vector_db import ChromaDB
 
+logger = logging.getLogger(__name__)
+
 
 def format_docs(docs: list[Document]):
     return "\n\n".join(doc.page_content for doc in docs)
 
 
-class Persona:
-    def __init__(self, name: str, template: str):
-        self.name = name
-        self.template = template
+def get_source_names(docs: list[Document]) -> list[str]:
+    return [doc.metadata.get("loc") if doc.metadata.get("loc") else doc.metadata.get("source") for doc in docs]
+
+
+class QueryTimings:
+    """Timings of a streamed query, in seconds."""
+
+    def __init__(self):
+        self.retrieval: float | None = None
+        self.time_to_first_token: float | None = None
+        self.generation: float | None = None
+        self.total: float | None = None
 
     def to_dict(self):
-        return {"name": self.name, "template": self.template}
+        return {
+            "retrieval": self.retrieval,
+            "time_to_first_token": self.time_to_first_token,
+            "generation": self.generation,
+            "total": self.total,
+        }
 
 
 class RAG:
-    def __init__(self, collection: ChromaDB, persona: Persona, model_name: str, verbose: bool = False, search_kwargs: dict | None = None):
+    def __init__(
+        self,
+        collection: ChromaDB,
+        persona: Persona,
+        model_name: str,
+        verbose: bool = False,
+        search_kwargs: dict | None = None,
+        answer_cache: AnswerCache | None = None,
+        hybrid: bool = False,
+        context_tokens: int | None = DEFAULT_CONTEXT_TOKENS,
+        base_url: str = DEFAULT_OLLAMA_URL,
+    ):
         self.collection = collection
         self.persona = persona
         self.model_name = model_name
+        self.search_kwargs = search_kwargs or {}
+        self.answer_cache = answer_cache
+        self.hybrid = hybrid
+        self.packer = ContextPacker(max_tokens=context_tokens)
 
-        self.retriever = self.collection.as_retriever(search_kwargs=search_kwargs)
+        self.retriever = self.collection.as_retriever(search_kwargs=search_kwargs, hybrid=hybrid)
         self.template = self.persona.template
         self.prompt = PromptTemplate.from_template(template=self.template)
-        self.llm = Ollama(model=model_name, verbose=verbose)
+        # Answers are only reused for the same retrieval, context and prompt settings
+        self.cache_settings = AnswerCache.fingerprint(
+            search_kwargs=self.search_kwargs, hybrid=hybrid, context_tokens=context_tokens, template=self.template
+        )
+        self.llm = Ollama(model=model_name, verbose=verbose, base_url=base_url)
 
-        rag_chain_from_docs = RunnablePassthrough.assign(context=(lambda x: format_docs(x["context"]))) | self.prompt | self.llm | StrOutputParser()
+    def pack_context(self, docs: list[Document]):
+        """Merge, de-duplicate and budget retrieved documents into a prompt context."""
+        with span("query.pack"):
+            context, stats = self.packer.pack(docs)
+        logger.info(
+            f"Context: {stats.packed_tokens} tokens from {stats.n_docs} documents "
+            f"({stats.deduplicated_tokens} tokens deduplicated, {stats.truncated_tokens} truncated)"
+        )
+        return context, stats
 
-        self.rag = RunnableParallel({"context": self.retriever, "question": RunnablePassthrough()}).assign(answer=rag_chain_from_docs)
+    def format_context(self, docs: list[Document]) -> str:
+        context, _ = self.pack_context(docs)
+        return context
 
     def query(self, question: str):
-        result = self.rag.invoke(question)
-        response, sources = result["answer"], result["context"]
+        embedding = None
+        if self.answer_cache is not None:
+            embedding, cached = self._lookup_answer(question)
+            if cached is not None:
+                return cached
+
+        with span("query.retrieve"):
+            sources = self.retriever.invoke(question)
+        prompt = self.prompt.format(context=self.format_context(sources), question=question)
+        with span("query.generate"):
+            response = self.llm.invoke(prompt)
+        if self.answer_cache is not None:
+            self._put_cached_answer(question, embedding, response, sources)
         return response, sources
+
+    def _lookup_answer(self, question: str):
+        with span("query.answer_cache"):
+            embedding = self.collection.embedding_function.embed_query(question)
+            return embedding, self._get_cached_answer(question, embedding)
+
+    def _get_cached_answer(self, question: str, embedding: list[float]):
+        return self.answer_cache.get(self.collection.collection_name, self.persona.name, self.model_name, self.cache_settings, question, embedding)
+
+    def _put_cached_answer(self, question: str, embedding: list[float], response: str, sources: list[Document]):
+        self.answer_cache.put(
+            self.collection.collection_name, self.persona.name, self.model_name, self.cache_settings, question, embedding, response, sources
+        )
+
+    def stream(self, question: str) -> Iterator[tuple[str, object]]:
+        """Answer a question incrementally.
+
+        Yields ("sources", docs) as soon as retrieval finishes, then ("context", ContextStats) once the prompt context
+        is packed, then ("token", text) for each chunk of the answer, and finally ("timings", QueryTimings). Cached
+        answers skip the context event.
+        """
+        timings = QueryTimings()
+        start = time.perf_counter()
+        embedding = None
+        if self.answer_cache is not None:
+            embedding, cached = self._lookup_answer(question)
+            if cached is not None:
+                # Cached answers are emitted whole, with no generation time
+                response, sources = cached
+                timings.retrieval = time.perf_counter() - start
+                yield "sources", sources
+                timings.time_to_first_token = timings.generation = 0.0
+                yield "token", response
+                timings.total = time.perf_counter() - start
+                yield "timings", timings
+                return
+
+        with span("query.retrieve"):
+            sources = self.retriever.invoke(question)
+        timings.retrieval = time.perf_counter() - start
+        yield "sources", sources
+
+        context, stats = self.pack_context(sources)
+        yield "context", stats
+        prompt = self.prompt.format(context=context, question=question)
+        generation_start = time.perf_counter()
+        tokens = []
+        for token in self.llm.stream(prompt):
+            if timings.time_to_first_token is None:
+                timings.time_to_first_token = time.perf_counter() - generation_start
+            tokens.append(token)
+            yield "token", token
+        timings.generation = time.perf_counter() - generation_start
+        timings.total = time.perf_counter() - start
+        # Generation spans the yields above, so it is recorded after the fact
+        profiler.record("query.generate", generation_start, timings.generation, tokens=len(tokens))
+        if self.answer_cache is not None:
+            self._put_cached_answer(question, embedding, "".join(tokens), sources)
+        yield "timings", timings
+
+    async def astream(self, question: str) -> AsyncIterator[tuple[str, object]]:
+        """Async version of stream."""
+        timings = QueryTimings()
+        start = time.perf_counter()
+        embedding = None
+        if self.answer_cache is not None:
+            embedding, cached = self._lookup_answer(question)
+            if cached is not None:
+                response, sources = cached
+                timings.retrieval = time.perf_counter() - start
+                yield "sources", sources
+                timings.time_to_first_token = timings.generation = 0.0
+                yield "token", response
+                timings.total = time.perf_counter() - start
+                yield "timings", timings
+                return
+
+        retrieval_start = time.perf_counter()
+        sources = await self.retriever.ainvoke(question)
+        timings.retrieval = time.perf_counter() - start
+        # Spans are per thread, so time awaited work explicitly rather than letting other tasks nest inside it
+        profiler.record("query.retrieve", retrieval_start, time.perf_counter() - retrieval_start)
+        yield "sources", sources
+
+        context, stats = self.pack_context(sources)
+        yield "context", stats
+        prompt = self.prompt.format(context=context, question=question)
+        generation_start = time.perf_counter()
+        tokens = []
+        async for token in self.llm.astream(prompt):
+            if timings.time_to_first_token is None:
+                timings.time_to_first_token = time.perf_counter() - generation_start
+            tokens.append(token)
+            yield "token", token
+        timings.generation = time.perf_counter() - generation_start
+        timings.total = time.perf_counter() - start
+        # Generation spans the yields above, so it is recorded after the fact
+        profiler.record("query.generate", generation_start, timings.generation, tokens=len(tokens))
+        if self.answer_cache is not None:
+            self._put_cached_answer(question, embedding, "".join(tokens), sources)
+        yield "timings", timings
+
+    def batch_query(self, questions: list[str], concurrency: int = 4) -> Iterator[tuple[int, str | None, list[Document], float, str | None]]:
+        """Answer many questions, yielding (index, response, sources, seconds, error) as each answer completes.
+
+        Questions are embedded in one batch and, unless hybrid search is used, retrieved with a single collection
+        query. Cached answers are yielded first, with no generation time. Other prompts are then sent to Ollama from a
+        bounded thread pool that shares one pooled HTTP session. A question whose generation fails is yielded with no
+        response and the error message, and the remaining questions are still answered.
+        """
+        cached = [None] * len(questions)
+        embeddings = None
+        if self.answer_cache is not None:
+            with span("query.answer_cache", questions=len(questions)):
+                embeddings = self.collection.embedding_function.encode(questions).tolist()
+                cached = [self._get_cached_answer(question, embedding) for question, embedding in zip(questions, embeddings)]
+        for index, answer in enumerate(cached):
+            if answer is not None:
+                yield index, answer[0], answer[1], 0.0, None
+
+        pending = [index for index, answer in enumerate(cached) if answer is None]
+        if not pending:
+            return
+        with span("query.retrieve", questions=len(pending)):
+            if self.hybrid:
+                found = self.retriever.batch([questions[index] for index in pending], config={"max_concurrency": concurrency})
+            else:
+                k = self.search_kwargs.get("k", 4)
+                found = self.collection.similarity_search_many([questions[index] for index in pending], k=k, where=self.search_kwargs.get("filter"))
+        sources = dict(zip(pending, found))
+        client = OllamaClient(model=self.model_name, base_url=self.llm.base_url, pool_size=concurrency)
+
+        def answer(index: int) -> tuple[int, str | None, float, str | None]:
+            start = time.perf_counter()
+            try:
+                prompt = self.prompt.format(context=self.format_context(sources[index]), question=questions[index])
+                with span("query.generate"):
+                    response = client.generate(prompt)
+            except Exception as e:
+                logger.warning(f"Failed to answer question {index}: {e}")
+                return index, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+            if self.answer_cache is not None:
+                self._put_cached_answer(questions[index], embeddings[index], response, sources[index])
+            return index, response, time.perf_counter() - start, None
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(answer, i) for i in pending]
+                for future in as_completed(futures):
+                    index, response, seconds, error = future.result()
+                    yield index, response, sources[index], seconds, error
+        finally:
+            client.close()
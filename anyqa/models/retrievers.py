@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.pydantic_v1 import Field
+from langchain_core.retrievers import BaseRetriever
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """Merge ranked lists of ids, scoring each id by the sum of 1 / (k + rank) over the lists it appears in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class VectorRetriever(BaseRetriever):
+    """Retriever that runs vector search through a ChromaDB instance, whichever vector store backs its collection."""
+
+    collection: Any
+    k: int = 4
+    search_kwargs: dict = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        return self.collection.similarity_search(query, k=self.k, **self.search_kwargs)
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever that runs vector and BM25 search in parallel and merges them with reciprocal rank fusion."""
+
+    collection: Any
+    k: int = 4
+    fetch_k: int = 20
+    search_kwargs: dict = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            vector_future = executor.submit(self.collection.similarity_search_with_ids, query, k=self.fetch_k, **self.search_kwargs)
+            lexical_future = executor.submit(self.collection.lexical_index.search, query, self.fetch_k)
+            vector_ids, vector_docs = vector_future.result()
+            lexical_ids = [id for id, _ in lexical_future.result()]
+
+        # The keyword index knows nothing of metadata, so its hits are held to the same filter as vector search
+        where = self.search_kwargs.get("filter")
+        if where and lexical_ids:
+            matching = set(self.collection.collection.get(ids=lexical_ids, where=where, include=[])["ids"])
+            lexical_ids = [id for id in lexical_ids if id in matching]
+
+        docs_by_id = dict(zip(vector_ids, vector_docs))
+        ranking = reciprocal_rank_fusion([vector_ids, lexical_ids])[: self.k]
+
+        # Fetch documents that were only found by the lexical index
+        missing = [id for id in ranking if id not in docs_by_id]
+        if missing:
+            result = self.collection.collection.get(ids=missing, include=["documents", "metadatas"])
+            for id, content, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+                docs_by_id[id] = Document(page_content=content, metadata=metadata or {})
+        return [docs_by_id[id] for id in ranking if id in docs_by_id]
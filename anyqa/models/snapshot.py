@@ -0,0 +1,203 @@
+import datetime
+import json
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+
+import numpy as np
+
+from anyqa.constants import CATALOG_PAGE_SIZE, DEFAULT_EMBEDDING_BACKEND
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "float16")
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.sqlite"
+# Rows scored per block when searching, bounding the float32 copy made of float16 vectors
+SEARCH_BLOCK_ROWS = 65536
+
+
+def export_collection(db, path: str, dtype: str = "float32", chunk_size: int | None = None, chunk_overlap: int | None = None) -> dict:
+    """Write a collection to a snapshot directory, returning its manifest.
+
+    A snapshot holds the vectors as one contiguous .npy matrix, the ids, documents and metadata as an SQLite table
+    whose rows line up with the matrix, and a manifest with the embedding model, backend and chunk settings. It is
+    written to a temporary directory that is renamed into place once complete.
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Snapshot dtype must be one of {SNAPSHOT_DTYPES}, not {dtype}")
+    path = pathlib.Path(path)
+    if path.exists():
+        raise FileExistsError(f"Snapshot path {path} already exists")
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    try:
+        count = db.collection.count()
+        connection = sqlite3.connect(tmp_path / RECORDS_FILE)
+        connection.execute("CREATE TABLE records (row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT)")
+        vectors = None
+        row = 0
+        try:
+            while row < count:
+                page = db.collection.get(include=["embeddings", "documents", "metadatas"], limit=CATALOG_PAGE_SIZE, offset=row)
+                if not page["ids"]:
+                    break
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                if vectors is None:
+                    vectors = np.lib.format.open_memmap(tmp_path / VECTORS_FILE, mode="w+", dtype=dtype, shape=(count, embeddings.shape[1]))
+                vectors[row : row + len(embeddings)] = embeddings
+                connection.executemany(
+                    "INSERT INTO records (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (row + i, id, document, json.dumps(metadata or {}))
+                        for i, (id, document, metadata) in enumerate(zip(page["ids"], page["documents"], page["metadatas"]))
+                    ],
+                )
+                row += len(page["ids"])
+            if row != count:
+                raise RuntimeError(f"Collection '{db.collection_name}' changed during export: expected {count} records, read {row}")
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(tmp_path / VECTORS_FILE, mode="w+", dtype=dtype, shape=(0, 0))
+            vectors.flush()
+            dimension = vectors.shape[1]
+            del vectors
+            connection.commit()
+        finally:
+            connection.close()
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "collection": db.collection_name,
+            "embedding_model": db.embedding_model,
+            "embedding_backend": db.embedding_backend,
+            "dtype": dtype,
+            "dimension": dimension,
+            "count": count,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        (tmp_path / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp_path, path)
+    finally:
+        # Only left behind when the export failed
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return manifest
+
+
+class Snapshot:
+    """Read-only view of a snapshot directory.
+
+    The vector matrix is memory-mapped and records are read from SQLite on demand, so opening a snapshot is
+    instant and its pages are shared between processes serving the same file.
+    """
+
+    def __init__(self, path: str):
+        """Initialize."""
+        self.path = pathlib.Path(path)
+        manifest_path = self.path / MANIFEST_FILE
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"{self.path} is not a snapshot: {MANIFEST_FILE} is missing")
+        self.manifest = json.loads(manifest_path.read_text())
+        if self.manifest["format_version"] > SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Snapshot format {self.manifest['format_version']} is newer than supported ({SNAPSHOT_FORMAT_VERSION})")
+        self.vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+        self.connection = sqlite3.connect(f"file:{self.path / RECORDS_FILE}?mode=ro", uri=True, check_same_thread=False)
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+    @property
+    def embedding_backend(self) -> str:
+        return self.manifest.get("embedding_backend", DEFAULT_EMBEDDING_BACKEND)
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def records(self, rows: list[int]) -> list[tuple[str, str, dict]]:
+        """(id, document, metadata) for each row, in the order given."""
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: (id, document, json.loads(metadata))
+            for row, id, document, metadata in self.connection.execute(
+                f"SELECT row, id, document, metadata FROM records WHERE row IN ({placeholders})", [int(row) for row in rows]
+            )
+        }
+        return [found[int(row)] for row in rows]
+
+    def iter_batches(self, batch_size: int = CATALOG_PAGE_SIZE):
+        """Yield (ids, vectors, documents, metadatas) batches in row order, with float32 vectors."""
+        for start in range(0, len(self), batch_size):
+            cursor = self.connection.execute(
+                "SELECT id, document, metadata FROM records WHERE row >= ? AND row < ? ORDER BY row", (start, start + batch_size)
+            )
+            ids, documents, metadatas = [], [], []
+            for id, document, metadata in cursor:
+                ids.append(id)
+                documents.append(document)
+                metadatas.append(json.loads(metadata))
+            yield ids, np.asarray(self.vectors[start : start + len(ids)], dtype=np.float32), documents, metadatas
+
+    def search(self, query_vectors: np.ndarray, k: int = 4) -> list[list[tuple[int, float]]]:
+        """Exact top k (row, score) pairs for each query vector, scored by dot product, best first."""
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in query_vectors]
+        # Float16 vectors are cast one block at a time, so a query never copies the whole matrix
+        scores = np.empty((len(query_vectors), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = self.vectors[start : start + SEARCH_BLOCK_ROWS].astype(np.float32, copy=False)
+            scores[:, start : start + len(block)] = query_vectors @ block.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, rows in zip(scores, top):
+            rows = rows[np.argsort(-query_scores[rows])]
+            results.append([(int(row), float(query_scores[row])) for row in rows])
+        return results
+
+    def close(self):
+        self.connection.close()
+
+
+def import_snapshot(path: str, collection_name: str | None = None, vector_store: str | None = None, batch_size: int = CATALOG_PAGE_SIZE):
+    """Bulk-load a snapshot into a collection without re-embedding, returning the ChromaDB instance and records added.
+
+    The collection is created with the snapshot's embedding model and backend, which are not loaded: records are
+    written to the collection with their stored vectors. Importing into an existing collection requires the same
+    model and backend, and ids already in it are skipped.
+    """
+    from anyqa.models.vector_db import ChromaDB
+
+    snapshot = Snapshot(path)
+    collection_name = collection_name or snapshot.manifest["collection"]
+    try:
+        db = ChromaDB(
+            collection_name=collection_name,
+            embedding_model=snapshot.embedding_model,
+            embedding_backend=snapshot.embedding_backend,
+            vector_store=vector_store,
+            embed=False,
+        )
+        if (db.embedding_model, db.embedding_backend) != (snapshot.embedding_model, snapshot.embedding_backend):
+            raise ValueError(
+                f"Collection '{collection_name}' uses {db.embedding_model} ({db.embedding_backend}), but the snapshot was embedded with "
+                f"{snapshot.embedding_model} ({snapshot.embedding_backend})"
+            )
+        added = 0
+        for ids, vectors, documents, metadatas in snapshot.iter_batches(batch_size):
+            added += len(db.add_embeddings(ids, vectors, documents, metadatas))
+            logger.info(f"Imported {added} of {len(snapshot)} records into collection '{collection_name}'")
+        db.invalidate_answers()
+    finally:
+        snapshot.close()
+    return db, added
@@ -1,96 +1,378 @@
 import logging
 
 import chromadb
+import numpy as np
 from langchain_community.vectorstores.chroma import Chroma
 from langchain_core.documents import Document
 import hashlib
 
+from anyqa.models.answer_cache import AnswerCache
+from anyqa.models.catalog import SourceCatalog
 from anyqa.models.embeddings import Embeddings
-from anyqa.constants import PERSIST_DIRECTORY
+from anyqa.models.flat_index import FlatCollection
+from anyqa.models.lexical_index import BM25Index
+from anyqa.models.profiling import span
+from anyqa.models.retrievers import HybridRetriever, VectorRetriever
+from anyqa.constants import (
+    CATALOG_PAGE_SIZE,
+    DEFAULT_EMBEDDING_BACKEND,
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_EMBEDDING_CACHE_SIZE,
+    DEFAULT_VECTOR_STORE,
+    PERSIST_DIRECTORY,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+def hash_document(doc: Document) -> str:
+    """Deterministic id for a chunk, derived from its content, source and location within the source."""
+    h = hashlib.sha256()
+    h.update(doc.page_content.encode("UTF-8"))
+    h.update(doc.metadata["source"].encode("UTF-8"))
+    # Rows and pages of one file can repeat the same text, so their location keeps them apart. Web pages use their
+    # URL as both source and location, so it is only mixed in when it differs from the source.
+    location = doc.metadata.get("loc")
+    if location and location != doc.metadata["source"]:
+        h.update(location.encode("UTF-8"))
+    return h.hexdigest()
+
+
+def iter_metadatas(collection, ids: list[str] | None = None, page_size: int = CATALOG_PAGE_SIZE):
+    """Yield the metadata of every record in a Chroma collection, or of the given ids, reading one page at a time."""
+    if ids is not None:
+        for start in range(0, len(ids), page_size):
+            yield from collection.get(ids=ids[start : start + page_size], include=["metadatas"])["metadatas"]
+        return
+    offset = 0
+    while True:
+        metadatas = collection.get(include=["metadatas"], limit=page_size, offset=offset)["metadatas"]
+        if not metadatas:
+            return
+        yield from metadatas
+        offset += len(metadatas)
+
+
+def count_sources(collection, ids: list[str] | None = None) -> dict[str, tuple[int, int]]:
+    """Chunks and bytes per source in a Chroma collection, or for the given ids."""
+    counts = {}
+    for metadata in iter_metadatas(collection, ids=ids):
+        metadata = metadata or {}
+        source = metadata.get("source")
+        chunks, size = counts.get(source, (0, 0))
+        counts[source] = (chunks + 1, size + metadata.get("bytes", 0))
+    return counts
+
+
 class ChromaDB:
-    """Instance of a ChromaDB database."""
+    """Instance of a ChromaDB database.
+
+    Each collection is stored either in Chroma or in an in-process FlatCollection, chosen when the collection is
+    created. Both expose the same subset of Chroma's Collection API through self.collection, and the Chroma client is
+    only opened for collections stored in Chroma.
+    """
+
+    def __init__(
+        self,
+        collection_name: str | None = None,
+        embedding_model: str | None = None,
+        embedding_batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_processes: int = 1,
+        embedding_cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE,
+        embedding_backend: str | None = None,
+        vector_store: str | None = None,
+        embed: bool = True,
+    ):
+        """Initialize ChromaDB object.
 
-    def __init__(self, collection_name: str | None = None, embedding_model: str | None = None):
-        """Initialize ChromaDB object."""
+        The embedding backend and vector store are stored in the collection metadata when the collection is created,
+        so that queries encode with the same backend that loaded it. Collections created before these options existed
+        use torch and Chroma. When embed is False, the embedding model is not loaded, and the instance can only store
+        records with precomputed embeddings through add_embeddings.
+        """
         self.persist_directory = str(PERSIST_DIRECTORY)
-        self.client = chromadb.PersistentClient(path=self.persist_directory)
+        self._client = None
+        self.catalog = SourceCatalog()
 
         self.collection_name = collection_name
         self.collection = None
         self.embeddings = None
         self.embedding_function = None
         self.db = None
+        self.lexical_index = None
+        self.vector_store = None
+        # Whether records were added or deleted since cached answers were last invalidated
+        self.changed = False
 
         if self.collection_name is not None:
             try:
-                self.collection = self.client.get_collection(name=self.collection_name)
+                self.collection = self._get_collection(self.collection_name)
+                self.vector_store = self.collection.metadata.get("vector_store", DEFAULT_VECTOR_STORE)
+                if vector_store is not None and vector_store != self.vector_store:
+                    logger.warning(f"Collection '{self.collection_name}' is stored in {self.vector_store}. Ignoring {vector_store}.")
                 self.embedding_model = self.collection.metadata["embedding_model"]
+                self.embedding_backend = self.collection.metadata.get("embedding_backend", DEFAULT_EMBEDDING_BACKEND)
+                if embedding_backend is not None and embedding_backend != self.embedding_backend:
+                    logger.warning(
+                        f"Collection '{self.collection_name}' uses the {self.embedding_backend} embedding backend. Ignoring {embedding_backend}."
+                    )
                 logger.info(f"Using existing collection '{self.collection_name}'")
             except ValueError:
                 if embedding_model is None:
                     raise ValueError(f"Collection: {self.collection_name} does not exist. You must create a collection with 'load' first.")
                 self.embedding_model = embedding_model
-                metadata = {"embedding_model": self.embedding_model}
-                self.collection = self.client.create_collection(name=self.collection_name, metadata=metadata)
+                self.embedding_backend = embedding_backend or DEFAULT_EMBEDDING_BACKEND
+                self.vector_store = vector_store or DEFAULT_VECTOR_STORE
+                metadata = {
+                    "embedding_model": self.embedding_model,
+                    "embedding_backend": self.embedding_backend,
+                    "vector_store": self.vector_store,
+                }
+                if self.vector_store == "flat":
+                    self.collection = FlatCollection.create(self.collection_name, metadata=metadata)
+                elif self.vector_store == "chroma":
+                    self.collection = self.client.create_collection(name=self.collection_name, metadata=metadata)
+                else:
+                    raise ValueError(f"Unknown vector store: {self.vector_store}")
                 logger.info(f"Created collection '{self.collection_name}'")
 
-            self.embeddings = Embeddings(model_name=self.embedding_model)
-            self.embedding_function = self.embeddings.get_embedding_function()
-            self.db = Chroma(
-                client=self.client,
-                collection_name=self.collection_name,
-                embedding_function=self.embedding_function,
-            )
+            if embed:
+                self.embeddings = Embeddings(
+                    model_name=self.embedding_model,
+                    batch_size=embedding_batch_size,
+                    processes=embedding_processes,
+                    cache_size=embedding_cache_size,
+                    backend=self.embedding_backend,
+                )
+                self.embedding_function = self.embeddings.get_embedding_function()
+                if self.vector_store == "chroma":
+                    self.db = Chroma(
+                        client=self.client,
+                        collection_name=self.collection_name,
+                        embedding_function=self.embedding_function,
+                    )
+            self.lexical_index = BM25Index(collection_name=self.collection_name)
 
-    def as_retriever(self, search_kwargs: dict | None = None):
-        """Create a Langchain retriever object for the collection."""
+    @property
+    def client(self):
+        """Chroma client, opened on first use."""
+        if self._client is None:
+            self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    def _get_collection(self, name: str):
+        # Flat collections are checked first so that opening them never starts Chroma
+        if FlatCollection.exists(name):
+            return FlatCollection(name)
+        return self.client.get_collection(name=name)
+
+    def as_retriever(self, search_kwargs: dict | None = None, hybrid: bool = False):
+        """Create a Langchain retriever object for the collection.
+
+        When hybrid is set, vector search is combined with the collection's BM25 index using reciprocal rank fusion. The
+        index is first filled in from the collection if it is missing records, as it is for collections that predate it.
+        """
+        search_kwargs = dict(search_kwargs or {})
+        if hybrid:
+            self.lexical_index.sync(self.collection)
+            k = search_kwargs.pop("k", 4)
+            return HybridRetriever(collection=self, k=k, fetch_k=max(4 * k, 20), search_kwargs=search_kwargs)
+        if self.db is None:
+            return VectorRetriever(collection=self, k=search_kwargs.pop("k", 4), search_kwargs=search_kwargs)
         return self.db.as_retriever(search_kwargs=search_kwargs)
 
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None) -> list[Document]:
+        """Retrieve the top k documents for a query, optionally restricted by a metadata filter."""
+        return self.similarity_search_many([query], k=k, where=filter)[0]
+
+    def similarity_search_with_ids(self, query: str, k: int = 4, filter: dict | None = None) -> tuple[list[str], list[Document]]:
+        """Retrieve the top k documents for a query along with their stored ids."""
+        ids, docs = self._search([query], k=k, where=filter)
+        return ids[0], docs[0]
+
+    def similarity_search_many(self, queries: list[str], k: int = 4, where: dict | None = None) -> list[list[Document]]:
+        """Retrieve the top k documents for each query, embedding all queries in one batch."""
+        return self._search(queries, k=k, where=where)[1]
+
+    def _search(self, queries: list[str], k: int, where: dict | None) -> tuple[list[list[str]], list[list[Document]]]:
+        if not queries:
+            return [], []
+        query_embeddings = self.embedding_function.encode(queries).tolist()
+        with span("retrieve.search", queries=len(queries)):
+            result = self.collection.query(query_embeddings=query_embeddings, n_results=k, where=where, include=["documents", "metadatas"])
+        docs = [
+            [Document(page_content=content, metadata=metadata or {}) for content, metadata in zip(contents, metadatas)]
+            for contents, metadatas in zip(result["documents"], result["metadatas"])
+        ]
+        return result["ids"], docs
+
     def get_ids(self, where: dict | None = None):
-        result = self.collection.get(where=where)
+        result = self.collection.get(where=where, include=[])
         ids = result["ids"]
         return ids
 
+    def count_sources(self, ids: list[str] | None = None) -> dict[str, tuple[int, int]]:
+        """Chunks and bytes per source for the collection, or for the given ids, from metadata only."""
+        return count_sources(self.collection, ids=ids)
+
+    def collection_names(self) -> set[str]:
+        """Names of every collection in the database, whether stored in Chroma or flat."""
+        return {collection.name for collection in self.client.list_collections()} | set(FlatCollection.list_names())
+
+    def verify_catalog(self) -> list[str]:
+        """Reconcile the catalog with every collection in the database, returning the names of collections that changed."""
+        changed = []
+        names = set()
+        for collection in [*self.client.list_collections(), *map(FlatCollection, FlatCollection.list_names())]:
+            names.add(collection.name)
+            counts = count_sources(collection)
+            known = {row["source"]: (row["chunks"], row["bytes"]) for row in self.catalog.sources(collection.name)}
+            if counts != known:
+                changed.append(collection.name)
+            self.catalog.replace(collection.name, (collection.metadata or {}).get("embedding_model"), counts)
+        for summary in self.catalog.collections():
+            if summary["name"] not in names:
+                changed.append(summary["name"])
+                self.catalog.clear(summary["name"], drop=True)
+        return changed
+
+    def get_existing_ids(self, ids: list[str]) -> set[str]:
+        """Subset of ids that are already stored in the collection."""
+        if not ids:
+            return set()
+        result = self.collection.get(ids=ids, include=[])
+        return set(result["ids"])
+
+    def invalidate_answers(self):
+        """Drop cached answers for the collection if its contents changed since the last call.
+
+        Commands that change the collection call this once, after all of their changes, rather than once per batch.
+        """
+        if not self.changed:
+            return
+        answer_cache = AnswerCache()
+        answer_cache.invalidate(self.collection_name)
+        answer_cache.close()
+        self.changed = False
+
+    def delete_ids(self, ids: list[str]):
+        """Delete records from the collection by id."""
+        if ids:
+            counts = self.count_sources(ids=ids)
+            self.collection.delete(ids=ids)
+            self.lexical_index.delete(ids)
+            self.catalog.remove(self.collection_name, counts)
+            self.changed = True
+        return ids
+
+    def delete_stale_ids(self, source: str, ids: list[str]) -> list[str]:
+        """Delete the records of a source that are not among its current ids, returning the deleted ids.
+
+        Used after a source is read again, so that chunks it no longer produces, including those stored under ids
+        from before locations were part of chunk ids, do not linger as duplicates.
+        """
+        current = set(ids)
+        return self.delete_ids([id for id in self.get_ids(where={"source": source}) if id not in current])
+
     def delete_where(self, where: dict):
         """Delete records from the collection meeting some conditions."""
         ids = self.get_ids(where=where)
+        counts = self.count_sources(ids=ids)
         self.collection.delete(where=where)
+        self.lexical_index.delete(ids)
+        self.catalog.remove(self.collection_name, counts)
+        self.changed = True
         return ids
 
     def delete_collection(self):
         """Delete the collection."""
-        try:
-            self.client.delete_collection(self.collection_name)
-            return True
-        except ValueError:
-            return False
+        if self.vector_store == "flat":
+            self.collection.drop()
+        else:
+            try:
+                self.client.delete_collection(self.collection_name)
+            except ValueError:
+                return False
+        self.lexical_index.drop()
+        self.catalog.clear(self.collection_name, drop=True)
+        self.changed = True
+        return True
 
     def delete_all_records(self):
         """Delete all records from the collection, but keep the collection."""
         ids = self.get_ids()
         self.collection.delete(ids=ids)
+        self.lexical_index.delete(ids)
+        self.catalog.clear(self.collection_name)
+        self.changed = True
         return ids
 
     def load_documents(self, documents: list[Document]):
-        """Load documents into the collection."""
+        """Load documents into the collection. Chunks whose ids are already in the collection are skipped."""
         # Hash each document into an id to prevent duplication
         ids = []
         docs = []
+        seen = set()
         for doc in documents:
-            h = hashlib.sha256()
-            content = doc.page_content
-            h.update(content.encode("UTF-8"))
-            source = doc.metadata["source"]
-            h.update(source.encode("UTF-8"))
-            id = h.hexdigest()
-            if id not in ids:
+            id = hash_document(doc)
+            if id not in seen:
+                seen.add(id)
                 ids.append(id)
                 docs.append(doc)
+
+        with span("store.dedupe"):
+            existing = self.get_existing_ids(ids)
+        if existing:
+            new = [(id, doc) for id, doc in zip(ids, docs) if id not in existing]
+            logger.info(f"Skipping {len(existing)} chunks already in collection '{self.collection_name}'")
+            ids = [id for id, _ in new]
+            docs = [doc for _, doc in new]
+
         # Save documents
-        saved_ids = self.db.add_documents(documents=docs, ids=ids)
+        if not docs:
+            return []
+        counts = {}
+        for doc in docs:
+            # Chunk sizes are kept in metadata so that the catalog can be rebuilt without reading documents
+            doc.metadata["bytes"] = len(doc.page_content.encode("UTF-8"))
+            chunks, size = counts.get(doc.metadata["source"], (0, 0))
+            counts[doc.metadata["source"]] = (chunks + 1, size + doc.metadata["bytes"])
+        # Documents are embedded as part of the write, so store.write includes embed.* spans
+        with span("store.write", chunks=len(docs)):
+            texts = [doc.page_content for doc in docs]
+            embeddings = self.embedding_function.embed_documents(texts)
+            self.collection.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=[doc.metadata for doc in docs])
+            saved_ids = ids
+        with span("store.lexical"):
+            self.lexical_index.add(ids, [doc.page_content for doc in docs])
+        with span("store.catalog"):
+            self.catalog.add(self.collection_name, self.embedding_model, counts)
+        self.changed = True
         return saved_ids
+
+    def add_embeddings(self, ids: list[str], embeddings: np.ndarray, documents: list[str], metadatas: list[dict]):
+        """Bulk-load records with precomputed embeddings, e.g. from a snapshot. Ids already in the collection are skipped."""
+        with span("store.dedupe"):
+            existing = self.get_existing_ids(ids)
+        keep = [i for i, id in enumerate(ids) if id not in existing]
+        if existing:
+            logger.info(f"Skipping {len(existing)} chunks already in collection '{self.collection_name}'")
+        if not keep:
+            return []
+        ids = [ids[i] for i in keep]
+        documents = [documents[i] for i in keep]
+        metadatas = [metadatas[i] for i in keep]
+        counts = {}
+        for document, metadata in zip(documents, metadatas):
+            size = metadata.setdefault("bytes", len(document.encode("UTF-8")))
+            chunks, total = counts.get(metadata.get("source"), (0, 0))
+            counts[metadata.get("source")] = (chunks + 1, total + size)
+        with span("store.write", chunks=len(ids)):
+            self.collection.add(ids=ids, embeddings=np.asarray(embeddings, dtype=np.float32)[keep].tolist(), documents=documents, metadatas=metadatas)
+        with span("store.lexical"):
+            self.lexical_index.add(ids, documents)
+        with span("store.catalog"):
+            self.catalog.add(self.collection_name, self.embedding_model, counts)
+        self.changed = True
+        return ids
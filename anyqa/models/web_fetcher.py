@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, Iterator
+from urllib.parse import urlparse
+
+import aiohttp
+
+from anyqa.constants import HTTP_CACHE_FILE
+from anyqa.models.pipeline import stream_from_thread
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_NAMESPACE = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+class Page:
+    """A fetched web page."""
+
+    def __init__(self, url: str, content: str, lastmod: str | None, from_cache: bool):
+        self.url = url
+        self.content = content
+        self.lastmod = lastmod
+        self.from_cache = from_cache
+
+
+class TokenBucket:
+    """Async token bucket allowing rate requests per second, with bursts of up to capacity requests."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """Initialize."""
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HttpCache:
+    """On-disk cache of response bodies with their validators and sitemap lastmod values."""
+
+    def __init__(self, path=HTTP_CACHE_FILE):
+        """Initialize."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, lastmod TEXT, "
+            "body TEXT NOT NULL, fetched REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, url: str) -> dict | None:
+        with self.lock:
+            row = self.connection.execute("SELECT etag, last_modified, lastmod, body FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["etag", "last_modified", "lastmod", "body"], row))
+
+    def put(self, url: str, body: str, etag: str | None, last_modified: str | None, lastmod: str | None):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, lastmod, body, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, lastmod, body, time.time()),
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def parse_sitemap(xml: str) -> tuple[list[tuple[str, str | None]], list[str]]:
+    """Parse a sitemap into (loc, lastmod) page entries and the locations of nested sitemaps."""
+    root = ET.fromstring(xml)
+    pages = []
+    for url in root.iter(f"{SITEMAP_NAMESPACE}url"):
+        loc = url.findtext(f"{SITEMAP_NAMESPACE}loc")
+        if loc:
+            pages.append((loc.strip(), (url.findtext(f"{SITEMAP_NAMESPACE}lastmod") or "").strip() or None))
+    sitemaps = [loc.strip() for loc in (s.findtext(f"{SITEMAP_NAMESPACE}loc") for s in root.iter(f"{SITEMAP_NAMESPACE}sitemap")) if loc]
+    return pages, sitemaps
+
+
+class WebFetcher:
+    """Concurrent sitemap crawler with per-host rate limiting and conditional requests against an on-disk cache."""
+
+    def __init__(self, cache: HttpCache, concurrency: int = 8, requests_per_second: float = 2.0, timeout: float = 30.0):
+        """Initialize."""
+        self.cache = cache
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.timeout = timeout
+        self.buckets: dict[str, TokenBucket] = {}
+        self.stats = {"requests": 0, "not_modified": 0, "skipped": 0, "failed": 0}
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str, lastmod: str | None = None) -> Page:
+        """Fetch a URL, reusing the cached body when the server or the sitemap says it has not changed."""
+        cached = self.cache.get(url)
+        if cached is not None and lastmod is not None and cached["lastmod"] == lastmod:
+            self.stats["skipped"] += 1
+            return Page(url=url, content=cached["body"], lastmod=lastmod, from_cache=True)
+
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        host = urlparse(url).netloc
+        bucket = self.buckets.setdefault(host, TokenBucket(rate=self.requests_per_second))
+        await bucket.acquire()
+        self.stats["requests"] += 1
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                self.stats["not_modified"] += 1
+                self.cache.put(url, cached["body"], cached["etag"], cached["last_modified"], lastmod)
+                return Page(url=url, content=cached["body"], lastmod=lastmod, from_cache=True)
+            response.raise_for_status()
+            body = await response.text()
+            self.cache.put(url, body, response.headers.get("ETag"), response.headers.get("Last-Modified"), lastmod)
+            return Page(url=url, content=body, lastmod=lastmod, from_cache=False)
+
+    async def crawl(self, sitemap_url: str, patterns: list[str], max_depth: int = 1000) -> AsyncIterator[Page]:
+        """Yield pages listed in a sitemap, and in nested sitemaps, as they are fetched.
+
+        Only URLs on the sitemap's host that match one of the regex patterns are fetched. Pages and nested sitemaps
+        that fail, for any reason, are logged, counted in stats["failed"] and skipped.
+        """
+        host = urlparse(sitemap_url).netloc
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            entries = await self._read_sitemaps(session, sitemap_url, max_depth)
+            entries = [(loc, lastmod) for loc, lastmod in entries if urlparse(loc).netloc == host and any(re.match(p, loc) for p in patterns)]
+            logger.info(f"Found {len(entries)} pages in sitemap {sitemap_url}")
+
+            async def fetch_entry(loc: str, lastmod: str | None) -> Page | None:
+                try:
+                    return await self.fetch(session, loc, lastmod)
+                except Exception as e:
+                    # Anything that goes wrong with one page, e.g. an undecodable body, only loses that page
+                    self.stats["failed"] += 1
+                    logger.error(f"Failed to fetch {loc}: {type(e).__name__}: {e}")
+                    return None
+
+            # Keep a bounded window of fetches in flight, so that a slow consumer stops new requests
+            remaining = iter(entries)
+            pending = set()
+            try:
+                while True:
+                    while len(pending) < self.concurrency:
+                        entry = next(remaining, None)
+                        if entry is None:
+                            break
+                        pending.add(asyncio.ensure_future(fetch_entry(*entry)))
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        page = task.result()
+                        if page is not None:
+                            yield page
+            finally:
+                for task in pending:
+                    task.cancel()
+        logger.info(f"Crawl finished: {self.stats}")
+
+    async def _read_sitemaps(self, session: aiohttp.ClientSession, url: str, depth: int) -> list[tuple[str, str | None]]:
+        # Sitemaps are always revalidated, since they are what tells us which pages changed
+        page = await self.fetch(session, url)
+        pages, sitemaps = parse_sitemap(page.content)
+        if depth > 0:
+            for nested in sitemaps:
+                try:
+                    pages.extend(await self._read_sitemaps(session, nested, depth - 1))
+                except Exception as e:
+                    # A nested sitemap that cannot be fetched or parsed loses only its own pages
+                    self.stats["failed"] += 1
+                    logger.error(f"Failed to read sitemap {nested}: {type(e).__name__}: {e}")
+        return pages
+
+
+def iterate_async(agen: AsyncIterator, max_items: int = 16) -> Iterator:
+    """Drive an async iterator on an event loop in a background thread, yielding its items to synchronous code.
+
+    At most max_items are buffered ahead of the consumer. The event loop keeps running while the buffer is full, so
+    in-flight requests do not stall or time out while the consumer is busy.
+    """
+
+    def produce(put):
+        async def drain():
+            try:
+                async for item in agen:
+                    if not await asyncio.to_thread(put, item):
+                        return
+            finally:
+                await agen.aclose()
+
+        asyncio.run(drain())
+
+    return stream_from_thread(produce, max_items)
@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from anyqa.constants import DEFAULT_CONTEXT_TOKENS
+from anyqa.models.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class QueryService:
+    """Keeps ChromaDB and RAG instances resident so that queries only pay for retrieval and generation.
+
+    Each resident instance is tagged with the time its collection last changed according to the source catalog, and is
+    reopened once another process loads into or removes from the collection. Instances are built outside the service
+    lock, so that opening one collection does not hold up queries against the others.
+    """
+
+    def __init__(self, config: Config, verbose: bool = False, answer_cache: bool = True):
+        """Initialize."""
+        from anyqa.models.answer_cache import AnswerCache
+        from anyqa.models.catalog import SourceCatalog
+
+        self.config = config
+        self.verbose = verbose
+        self.answer_cache = AnswerCache() if answer_cache else None
+        self.catalog = SourceCatalog()
+        self.lock = threading.Lock()
+        self.build_locks = {}
+        self.collections = {}
+        self.rags = {}
+
+    def get_collection(self, collection: str):
+        """Get the resident ChromaDB instance for a collection, opening it on first use or after it changed."""
+        return self._resident(self.collections, collection, self.catalog.updated(collection), lambda: self._open_collection(collection))
+
+    def get_rag(
+        self,
+        collection: str,
+        persona: str,
+        llm: str,
+        k: int,
+        hybrid: bool = False,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        no_cache: bool = False,
+    ):
+        """Get the resident RAG instance for a collection and query settings, building it on first use or after it changed."""
+        key = (collection, persona, llm, k, hybrid, context_tokens, no_cache)
+        version = self.catalog.updated(collection)
+        db = self.get_collection(collection)
+        answer_cache = None if no_cache else self.answer_cache
+        return self._resident(self.rags, key, version, lambda: self._build_rag(db, persona, llm, k, hybrid, context_tokens, answer_cache))
+
+    def _resident(self, instances: dict, key, version, build):
+        # Instances are stored as (version, instance). Builds of the same key are serialized, so that concurrent
+        # queries against a new collection open it once.
+        with self.lock:
+            entry = instances.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            with self.lock:
+                entry = instances.get(key)
+                if entry is not None and entry[0] == version:
+                    return entry[1]
+            if entry is not None:
+                logger.info(f"Reopening {key}: the collection changed")
+            instance = build()
+            with self.lock:
+                instances[key] = (version, instance)
+            return instance
+
+    def _open_collection(self, collection: str):
+        from anyqa.models.vector_db import ChromaDB
+
+        return ChromaDB(collection_name=collection)
+
+    def _build_rag(self, db, persona: str, llm: str, k: int, hybrid: bool, context_tokens: int, answer_cache):
+        from anyqa.models.query import RAG
+
+        _persona = [p for p in self.config.personas if p.name == persona][0]
+        return RAG(
+            collection=db,
+            persona=_persona,
+            model_name=llm,
+            verbose=self.verbose,
+            search_kwargs={"k": k},
+            answer_cache=answer_cache,
+            hybrid=hybrid,
+            context_tokens=context_tokens,
+        )
+
+    def query(
+        self,
+        question: str,
+        collection: str = "default",
+        persona: str = "default",
+        llm: str | None = None,
+        k: int = 3,
+        hybrid: bool = False,
+        context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        no_cache: bool = False,
+    ) -> dict:
+        """Answer a question against a collection."""
+        from anyqa.models.query import get_source_names
+
+        if llm is None:
+            llm = self.config.default_llm
+        rag = self.get_rag(collection=collection, persona=persona, llm=llm, k=k, hybrid=hybrid, context_tokens=context_tokens, no_cache=no_cache)
+        response, sources = rag.query(question=question)
+        return {"question": question, "response": response, "sources": get_source_names(sources)}
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the query server."""
+
+    server: "QueryServer"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/query":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            result = self.server.service.query(**payload)
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            logger.exception("Query failed")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, result)
+
+    def log_message(self, format: str, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering queries from a shared QueryService."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, service: QueryService):
+        """Initialize."""
+        super().__init__((host, port), QueryRequestHandler)
+        self.service = service
+
+
+def request_query(url: str, payload: dict, timeout: float | None = None) -> dict:
+    """Send a query to a running server and return the decoded response."""
+    request = urllib.request.Request(
+        url.rstrip("/") + "/query",
+        data=json.dumps(payload).encode("UTF-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        error = json.loads(e.read()).get("error", str(e))
+        raise RuntimeError(f"Server error: {error}") from e
@@ -0,0 +1,51 @@
+"""Chunking throughput benchmark on a synthetic mixed corpus of Markdown, Python and HTML files."""
+
+import argparse
+import time
+
+from langchain_core.documents import Document
+
+from anyqa.constants import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
+from anyqa.models.chunkers import SPLITTER_MAP, Chunker, RecursiveCharacterTextSplitter
+from benchmarks.corpus import generate_texts
+
+
+def uncached_chunks(docs: list[Document], chunk_size: int, chunk_overlap: int) -> list[Document]:
+    # Baseline that builds a new splitter for every document
+    chunks = []
+    for doc in docs:
+        language = SPLITTER_MAP[doc.metadata["extension"]]
+        splitter = RecursiveCharacterTextSplitter.from_language(language=language, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks.extend(splitter.split_documents([doc]))
+    return chunks
+
+
+def measure(name: str, chunk, docs: list[Document]):
+    start = time.perf_counter()
+    chunks = chunk(docs)
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {len(chunks)} chunks in {elapsed:.2f}s ({len(chunks) / elapsed:.0f} chunks/sec)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=3000, help="Number of synthetic files.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of processes for the parallel run.")
+    parser.add_argument("--tokenizer", default=None, help="Also measure token-based chunking with this HuggingFace tokenizer.")
+    args = parser.parse_args()
+
+    docs = [
+        Document(page_content=text, metadata={"source": f"file_{i}{extension}", "extension": extension})
+        for i, (extension, text) in enumerate(generate_texts(args.files))
+    ]
+    print(f"Corpus: {len(docs)} files, {sum(len(doc.page_content) for doc in docs) / 1e6:.1f}M characters")
+
+    measure("uncached splitters", lambda d: uncached_chunks(d, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP), docs)
+    measure("cached splitters", Chunker(DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP).chunk_documents, docs)
+    measure(f"{args.workers} workers", Chunker(DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, workers=args.workers).chunk_documents, docs)
+    if args.tokenizer:
+        measure("token-based", Chunker(256, 32, tokenizer_name=args.tokenizer).chunk_documents, docs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Synthetic corpus generation shared by the benchmarks."""
+
+import random
+
+WORDS = (
+    "vector index query embedding chunk document source loader retrieval answer model token batch cache "
+    "collection persona prompt context latency throughput parse split merge store search rank score"
+).split()
+
+
+def sentence(rng: random.Random, n_words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def markdown_text(rng: random.Random, n_sections: int) -> str:
+    sections = []
+    for i in range(n_sections):
+        paragraphs = "\n\n".join(" ".join(sentence(rng) for _ in range(5)) for _ in range(3))
+        sections.append(f"## Section {i}\n\n{paragraphs}\n\n- {sentence(rng)}\n- {sentence(rng)}")
+    return "# Title\n\n" + "\n\n".join(sections)
+
+
+def python_text(rng: random.Random, n_functions: int) -> str:
+    functions = []
+    for i in range(n_functions):
+        body = "\n".join(f"    value_{j} = {rng.randint(0, 1000)}  # {sentence(rng, 6)}" for j in range(8))
+        functions.append(f'def function_{i}(argument):\n    """{sentence(rng)}"""\n{body}\n    return argument\n')
+    return "import os\n\n\n" + "\n\n".join(functions)
+
+
+def html_text(rng: random.Random, n_sections: int) -> str:
+    sections = "".join(f"<h2>Section {i}</h2><p>{' '.join(sentence(rng) for _ in range(8))}</p>" for i in range(n_sections))
+    return f"<html><body><h1>Title</h1>{sections}</body></html>"
+
+
+GENERATORS = {".md": markdown_text, ".py": python_text, ".html": html_text}
+
+
+def generate_texts(n_files: int, size: int = 20, seed: int = 0) -> list[tuple[str, str]]:
+    """Return (extension, text) pairs for a mixed corpus of Markdown, Python and HTML files."""
+    rng = random.Random(seed)
+    extensions = list(GENERATORS)
+    return [(extensions[i % len(extensions)], GENERATORS[extensions[i % len(extensions)]](rng, size)) for i in range(n_files)]
+
+
+def write_corpus(directory, n_files: int, size: int = 20, seed: int = 0) -> list[str]:
+    """Write a synthetic corpus to a directory, returning the file paths."""
+    paths = []
+    for i, (extension, text) in enumerate(generate_texts(n_files, size=size, seed=seed)):
+        path = directory / f"file_{i}{extension}"
+        path.write_text(text)
+        paths.append(str(path))
+    return paths
@@ -0,0 +1,54 @@
+"""Embedding throughput of the PyTorch, ONNX and int8-quantized ONNX backends, with cosine parity against PyTorch."""
+
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from anyqa.constants import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKENDS
+from anyqa.models.chunkers import Chunker
+from anyqa.models.embeddings import Embeddings
+from benchmarks.corpus import generate_texts
+
+
+def measure(backend: str, model_name: str, texts: list[str], batch_size: int) -> np.ndarray:
+    # The cache is disabled so that every chunk is encoded
+    engine = Embeddings(model_name=model_name, batch_size=batch_size, cache_size=0, backend=backend).get_embedding_function()
+    engine.encode(texts[:batch_size])  # warm up
+    start = time.perf_counter()
+    vectors = engine.encode(texts)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    print(f"{backend}: {len(texts)} chunks in {elapsed:.2f}s ({len(texts) / elapsed:.1f} chunks/sec)")
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100, help="Number of synthetic files.")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL, help="Embedding model.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per model call.")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS, help="Backends to compare.")
+    args = parser.parse_args()
+
+    docs = [
+        Document(page_content=text, metadata={"source": f"file_{i}{extension}", "extension": extension})
+        for i, (extension, text) in enumerate(generate_texts(args.files))
+    ]
+    texts = [chunk.page_content for chunk in Chunker(DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP).chunk_documents(docs)]
+    print(f"Corpus: {len(texts)} chunks")
+
+    reference = None
+    for backend in args.backends:
+        vectors = measure(backend, args.model, texts, args.batch_size)
+        if reference is None:
+            reference = vectors
+            continue
+        # Vectors are normalized, so the row-wise dot product is the cosine similarity
+        cosine = np.sum(reference * vectors, axis=1)
+        print(f"{backend}: cosine to {args.backends[0]} mean {cosine.mean():.5f}, min {cosine.min():.5f}")
+
+
+if __name__ == "__main__":
+    main()
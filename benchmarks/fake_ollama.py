@@ -0,0 +1,101 @@
+"""A local stand-in for the Ollama HTTP API that answers every prompt with a fixed response at a configurable token rate."""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = "The answer is in the retrieved context, which covers the requested topic in detail."
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Handles POST /api/generate in both streaming and non-streaming modes."""
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server: FakeOllamaServer = self.server
+        tokens = server.tokens
+        server.record_request()
+
+        if request.get("stream", True):
+            # Ollama streams one JSON object per line, finishing with a done message
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(server.token_delay)
+                self.wfile.write(json.dumps({"model": request.get("model"), "response": token, "done": False}).encode("UTF-8") + b"\n")
+                self.wfile.flush()
+            self.wfile.write(json.dumps({"model": request.get("model"), "response": "", "done": True}).encode("UTF-8") + b"\n")
+            self.close_connection = True
+            return
+
+        time.sleep(server.token_delay * len(tokens))
+        body = json.dumps({"model": request.get("model"), "response": "".join(tokens), "done": True}).encode("UTF-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Threaded fake Ollama server. Each response token is delayed by token_delay seconds."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token_delay: float = 0.01, response: str = DEFAULT_RESPONSE):
+        """Initialize."""
+        super().__init__((host, port), FakeOllamaHandler)
+        self.token_delay = token_delay
+        self.tokens = [word + " " for word in response.split()]
+        self.n_requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record_request(self):
+        with self.lock:
+            self.n_requests += 1
+
+    def start(self) -> "FakeOllamaServer":
+        """Serve from a daemon thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind to.")
+    parser.add_argument("--port", type=int, default=11434, help="Port to bind to.")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds to wait before each response token.")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(host=args.host, port=args.port, token_delay=args.token_delay)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
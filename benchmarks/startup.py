@@ -0,0 +1,76 @@
+"""Cold start benchmark for the CLI.
+
+Runs each command in a fresh interpreter and fails if it exceeds the time budget
+or imports any of the heavy ML modules. Commands run against a temporary config
+and persist directory, so that config reads and writes a real config file.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ["torch", "langchain", "langchain_community", "chromadb", "sentence_transformers", "unstructured"]
+
+COMMANDS = {
+    "--help": ["--help"],
+    "config": ["config"],
+    "models --help": ["models", "--help"],
+}
+
+PROBE = """
+import sys
+from anyqa.cli import cli
+try:
+    cli(sys.argv[1:], standalone_mode=False)
+finally:
+    heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+    print("HEAVY=" + ",".join(heavy), file=sys.stderr)
+"""
+
+
+def run_command(args: list[str], env: dict[str, str]) -> tuple[float, list[str]]:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES), *args], capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"Command {args} failed:\n{proc.stderr}")
+    heavy_line = [line for line in proc.stderr.splitlines() if line.startswith("HEAVY=")][-1]
+    heavy = [m for m in heavy_line[len("HEAVY=") :].split(",") if m]
+    return elapsed, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget", type=float, default=0.5, help="Maximum median wall time in seconds per command.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of cold runs per command.")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, "ANYQA_CONFIG_DIRECTORY": directory, "ANYQA_PERSIST_DIRECTORY": os.path.join(directory, "db")}
+        run_command(["setup"], env)
+        for name, command in COMMANDS.items():
+            timings = []
+            heavy = []
+            for _ in range(args.repeat):
+                elapsed, heavy = run_command(command, env)
+                timings.append(elapsed)
+            median = statistics.median(timings)
+            status = "ok"
+            if median > args.budget:
+                status = f"FAIL (over {args.budget:.2f}s budget)"
+                failed = True
+            if heavy:
+                status = f"FAIL (imported {', '.join(heavy)})"
+                failed = True
+            print(f"anyqa {name}: median {median * 1000:.0f}ms over {args.repeat} runs - {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
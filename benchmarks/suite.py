@@ -0,0 +1,220 @@
+"""End-to-end benchmark suite: loading, chunking, embedding and storing throughput, and query latency.
+
+Everything runs against a synthetic corpus and a throwaway database in a temporary directory, and queries are
+answered by a local fake Ollama server, so results depend only on this machine. Results are written as JSON and
+can be compared with an earlier run.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import write_corpus
+from benchmarks.fake_ollama import FakeOllamaServer
+
+RESULTS_DIRECTORY = pathlib.Path(__file__).parent / "results"
+
+# Metrics where a lower value is better, used when comparing runs
+LOWER_IS_BETTER = ("seconds", "p50", "p95", "p99", "mean")
+
+
+def throughput(n: int, seconds: float, unit: str) -> dict:
+    return {"n": n, "seconds": seconds, f"{unit}_per_second": n / seconds if seconds > 0 else float("inf")}
+
+
+def bench_load(corpus: pathlib.Path, workers: int):
+    from anyqa.models.document_loaders import DirectoryDocumentLoader
+
+    loader = DirectoryDocumentLoader(path=str(corpus), depth=-1, pattern=[".*"], workers=workers)
+    start = time.perf_counter()
+    docs = loader.load()
+    return docs, throughput(len(docs), time.perf_counter() - start, "docs")
+
+
+def bench_chunk(docs, workers: int):
+    from anyqa.constants import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
+    from anyqa.models.chunkers import Chunker
+
+    chunker = Chunker(chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP, workers=workers)
+    start = time.perf_counter()
+    chunks = chunker.chunk_documents(docs)
+    return chunks, throughput(len(chunks), time.perf_counter() - start, "chunks")
+
+
+def bench_embed(chunks, embedding_model: str, batch_size: int, backend: str):
+    from anyqa.models.embeddings import Embeddings
+
+    # The embedding cache is disabled so that every chunk is encoded
+    engine = Embeddings(model_name=embedding_model, batch_size=batch_size, cache_size=0, backend=backend).get_embedding_function()
+    texts = [chunk.page_content for chunk in chunks]
+    engine.encode(texts[:batch_size])  # warm up
+    start = time.perf_counter()
+    engine.encode(texts)
+    result = throughput(len(texts), time.perf_counter() - start, "chunks")
+    engine.close()
+    return result
+
+
+def bench_store(chunks, embedding_model: str, batch_size: int, embedding_batch_size: int, backend: str):
+    from anyqa.models.pipeline import batched
+    from anyqa.models.vector_db import ChromaDB
+
+    db = ChromaDB(
+        collection_name="bench_store",
+        embedding_model=embedding_model,
+        embedding_batch_size=embedding_batch_size,
+        embedding_cache_size=0,
+        embedding_backend=backend,
+    )
+    start = time.perf_counter()
+    n = 0
+    for batch in batched(chunks, batch_size=batch_size):
+        n += len(db.load_documents(documents=batch))
+    result = throughput(n, time.perf_counter() - start, "chunks")
+    return db, result
+
+
+def bench_end_to_end(corpus: pathlib.Path, embedding_model: str, workers: int, batch_size: int, embedding_batch_size: int, backend: str):
+    from anyqa.constants import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, PREFETCH_BATCHES
+    from anyqa.models.chunkers import Chunker
+    from anyqa.models.document_loaders import DirectoryDocumentLoader
+    from anyqa.models.pipeline import batched, prefetch
+    from anyqa.models.vector_db import ChromaDB
+
+    # Mirrors the streaming pipeline of 'anyqa load'
+    start = time.perf_counter()
+    db = ChromaDB(
+        collection_name="bench_pipeline",
+        embedding_model=embedding_model,
+        embedding_batch_size=embedding_batch_size,
+        embedding_cache_size=0,
+        embedding_backend=backend,
+    )
+    loader = DirectoryDocumentLoader(path=str(corpus), depth=-1, pattern=[".*"], workers=workers)
+    chunker = Chunker(chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP, workers=workers)
+    chunks = prefetch(chunker.lazy_chunk_documents(docs=loader.lazy_load()), max_items=PREFETCH_BATCHES * batch_size)
+    n = 0
+    for batch in batched(chunks, batch_size=batch_size):
+        n += len(db.load_documents(documents=batch))
+    return throughput(n, time.perf_counter() - start, "chunks")
+
+
+def bench_query(db, n_queries: int, token_delay: float, k: int):
+    from anyqa.constants import DEFAULT_LLM, DEFAULT_PERSONA_NAME, DEFAULT_PERSONA_TEMPLATE
+    from anyqa.models.metrics import percentile
+    from anyqa.models.persona import Persona
+    from anyqa.models.query import RAG
+    from benchmarks.corpus import WORDS
+
+    server = FakeOllamaServer(token_delay=token_delay).start()
+    try:
+        rag = RAG(
+            collection=db,
+            persona=Persona(name=DEFAULT_PERSONA_NAME, template=DEFAULT_PERSONA_TEMPLATE),
+            model_name=DEFAULT_LLM,
+            search_kwargs={"k": k},
+            base_url=server.url,
+        )
+        questions = [f"How does the {WORDS[i % len(WORDS)]} relate to the {WORDS[(3 * i + 1) % len(WORDS)]}?" for i in range(n_queries)]
+        rag.query(questions[0])  # warm up
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            rag.query(question)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        server.stop()
+    return {
+        "n": len(latencies),
+        "token_delay": token_delay,
+        "tokens": len(server.tokens),
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """Print the relative change of every metric against a baseline run."""
+    for stage, metrics in results["results"].items():
+        for name, value in metrics.items():
+            before = baseline.get("results", {}).get(stage, {}).get(name)
+            if name == "n" or not isinstance(value, (int, float)) or not before:
+                continue
+            change = (value - before) / before
+            better = change < 0 if name in LOWER_IS_BETTER else change > 0
+            print(f"{stage}.{name}: {before:.4g} -> {value:.4g} ({change:+.1%}{'' if better or change == 0 else ', worse'})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=300, help="Number of synthetic files.")
+    parser.add_argument("--size", type=int, default=20, help="Sections per synthetic file.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for loading and chunking.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per load batch.")
+    parser.add_argument("--embedding-batch-size", type=int, default=32, help="Chunks per embedding batch.")
+    parser.add_argument("--embedding-model", default=None, help="Embedding model. Defaults to the anyqa default.")
+    parser.add_argument("--embedding-backend", default="torch", choices=["torch", "onnx", "onnx-int8"], help="Embedding backend.")
+    parser.add_argument("--queries", type=int, default=100, help="Number of timed queries.")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Seconds the fake Ollama server waits before each token.")
+    parser.add_argument("-k", type=int, default=3, help="Documents retrieved per query.")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="Skip the end-to-end pipeline run.")
+    parser.add_argument("--output", type=pathlib.Path, default=None, help="JSON results file. Defaults to benchmarks/results/<timestamp>.json.")
+    parser.add_argument("--compare", type=pathlib.Path, default=None, help="Earlier JSON results file to compare against.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="anyqa-bench-") as tmp:
+        tmp = pathlib.Path(tmp)
+        # Must be set before anyqa.constants is imported so that nothing touches the real database
+        os.environ["ANYQA_PERSIST_DIRECTORY"] = str(tmp / "db")
+        from anyqa.constants import DEFAULT_EMBEDDING_MODEL
+
+        args.embedding_model = args.embedding_model or DEFAULT_EMBEDDING_MODEL
+        embedding_model = args.embedding_model
+        corpus = tmp / "corpus"
+        corpus.mkdir()
+        write_corpus(corpus, args.files, size=args.size)
+
+        results = {}
+        docs, results["load"] = bench_load(corpus, args.workers)
+        print(f"load: {results['load']['docs_per_second']:.1f} docs/sec")
+        chunks, results["chunk"] = bench_chunk(docs, args.workers)
+        print(f"chunk: {results['chunk']['chunks_per_second']:.1f} chunks/sec")
+        results["embed"] = bench_embed(chunks, embedding_model, args.embedding_batch_size, args.embedding_backend)
+        print(f"embed: {results['embed']['chunks_per_second']:.1f} chunks/sec")
+        db, results["store"] = bench_store(chunks, embedding_model, args.batch_size, args.embedding_batch_size, args.embedding_backend)
+        print(f"store: {results['store']['chunks_per_second']:.1f} chunks/sec")
+        if not args.skip_end_to_end:
+            results["end_to_end"] = bench_end_to_end(
+                corpus, embedding_model, args.workers, args.batch_size, args.embedding_batch_size, args.embedding_backend
+            )
+            print(f"end to end: {results['end_to_end']['chunks_per_second']:.1f} chunks/sec")
+        results["query"] = bench_query(db, args.queries, args.token_delay, args.k)
+        latency = results["query"]
+        print(f"query: p50 {latency['p50'] * 1000:.1f}ms, p95 {latency['p95'] * 1000:.1f}ms, p99 {latency['p99'] * 1000:.1f}ms")
+
+    run = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {key: str(value) if isinstance(value, pathlib.Path) else value for key, value in vars(args).items()},
+        "results": results,
+    }
+    output = args.output or RESULTS_DIRECTORY / f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare is not None:
+        compare(run, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Recall and latency of the flat NumPy vector store against Chroma, on random normalized vectors."""
+
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+
+
+def random_vectors(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(results: list[list[str]], truth: np.ndarray) -> float:
+    hits = sum(len({f"id-{i}" for i in expected} & set(found)) for found, expected in zip(results, truth))
+    return hits / truth.size
+
+
+def measure(name: str, collection, queries: np.ndarray, truth: np.ndarray, k: int, batch_size: int):
+    from anyqa.models.metrics import percentile
+
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0])
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        collection.query(query_embeddings=queries[i : i + batch_size].tolist(), n_results=k, include=[])
+    batched = (time.perf_counter() - start) / len(queries)
+    print(
+        f"{name}: recall@{k} {recall(results, truth):.4f}, p50 {percentile(latencies, 50) * 1000:.2f}ms, "
+        f"p95 {percentile(latencies, 95) * 1000:.2f}ms, batched {batched * 1000:.3f}ms/query"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=100_000, help="Number of stored vectors.")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("-k", type=int, default=10, help="Results per query.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Records per add, and queries per batched query.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="anyqa-bench-") as tmp:
+        # Must be set before anyqa.constants is imported so that nothing touches the real database
+        os.environ["ANYQA_PERSIST_DIRECTORY"] = str(pathlib.Path(tmp) / "db")
+        import chromadb
+
+        from anyqa.constants import PERSIST_DIRECTORY
+        from anyqa.models.flat_index import FlatCollection
+
+        rng = np.random.default_rng(0)
+        vectors = random_vectors(args.vectors, args.dim, rng)
+        # Queries near stored vectors, so that neighbours are meaningful
+        queries = vectors[rng.integers(0, args.vectors, args.queries)] + 0.05 * random_vectors(args.queries, args.dim, rng)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, : args.k]
+        ids = [f"id-{i}" for i in range(args.vectors)]
+        metadatas = [{"source": f"file_{i % 100}.md"} for i in range(args.vectors)]
+
+        stores = {}
+        start = time.perf_counter()
+        stores["flat"] = FlatCollection.create("bench", metadata={})
+        for i in range(0, args.vectors, args.batch_size):
+            window = slice(i, i + args.batch_size)
+            stores["flat"].add(ids=ids[window], embeddings=vectors[window], documents=ids[window], metadatas=metadatas[window])
+        print(f"flat: built in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        client = chromadb.PersistentClient(path=str(PERSIST_DIRECTORY))
+        stores["chroma"] = client.create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+        for i in range(0, args.vectors, args.batch_size):
+            window = slice(i, i + args.batch_size)
+            stores["chroma"].add(ids=ids[window], embeddings=vectors[window].tolist(), documents=ids[window], metadatas=metadatas[window])
+        print(f"chroma: built in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        FlatCollection("bench")
+        print(f"flat: opened in {(time.perf_counter() - start) * 1000:.1f}ms")
+        start = time.perf_counter()
+        chromadb.PersistentClient(path=str(PERSIST_DIRECTORY)).get_collection("bench")
+        print(f"chroma: opened in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        for name, collection in stores.items():
+            measure(name, collection, queries, truth, args.k, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import pytest
+from langchain_core.documents import Document
+
+from anyqa.models import answer_cache
+from anyqa.models.answer_cache import AnswerCache
+
+
+@pytest.fixture(autouse=True)
+def cache_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_FILE", tmp_path / "answer_cache.sqlite")
+
+
+def test_answers_are_keyed_by_settings():
+    cache = AnswerCache()
+    k3 = AnswerCache.fingerprint(search_kwargs={"k": 3}, hybrid=False, context_tokens=2048, template="{context} {question}")
+    k5 = AnswerCache.fingerprint(search_kwargs={"k": 5}, hybrid=False, context_tokens=2048, template="{context} {question}")
+    assert k3 != k5
+    cache.put("docs", "default", "llm", k3, "What is it?", [1.0, 0.0], "An answer", [Document(page_content="a", metadata={"source": "a.md"})])
+
+    response, sources = cache.get("docs", "default", "llm", k3, "What is it?", [1.0, 0.0])
+    assert response == "An answer" and sources[0].metadata == {"source": "a.md"}
+    assert cache.get("docs", "default", "llm", k5, "What is it?", [1.0, 0.0]) is None
+    cache.close()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from anyqa.models import catalog, flat_index
+from anyqa.models.catalog import SourceCatalog
+from anyqa.models.flat_index import FlatCollection
+
+
+@pytest.fixture(autouse=True)
+def catalog_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_FILE", tmp_path / "catalog.sqlite")
+    monkeypatch.setattr(flat_index, "FLAT_INDEX_DIRECTORY", tmp_path / "flat")
+
+
+def counts(c: SourceCatalog, collection: str) -> dict[str, tuple[int, int]]:
+    return {row["source"]: (row["chunks"], row["bytes"]) for row in c.sources(collection)}
+
+
+def test_add_and_remove_keep_running_totals():
+    c = SourceCatalog()
+    c.add("docs", "model", {"a.md": (2, 200), "b.md": (1, 50)})
+    c.add("docs", "model", {"a.md": (1, 100)})
+    assert counts(c, "docs") == {"a.md": (3, 300), "b.md": (1, 50)}
+
+    c.remove("docs", {"a.md": (1, 400), "b.md": (1, 50)})
+    assert counts(c, "docs") == {"a.md": (2, 0)}
+    summary = c.collections()[0]
+    assert (summary["name"], summary["sources"], summary["chunks"], summary["bytes"]) == ("docs", 1, 2, 0)
+    c.close()
+
+
+def test_replace_keeps_last_ingested_of_known_sources():
+    c = SourceCatalog()
+    c.add("docs", "model", {"a.md": (2, 200), "b.md": (1, 50)})
+    ingested = {row["source"]: row["last_ingested"] for row in c.sources("docs")}
+
+    c.replace("docs", None, {"a.md": (5, 500), "c.md": (1, 10)})
+    assert counts(c, "docs") == {"a.md": (5, 500), "c.md": (1, 10)}
+    rows = {row["source"]: row["last_ingested"] for row in c.sources("docs")}
+    assert rows["a.md"] == ingested["a.md"]
+    assert rows["c.md"] >= ingested["a.md"]
+    # A missing embedding model does not overwrite the known one
+    assert c.collections()[0]["embedding_model"] == "model"
+    c.close()
+
+
+def test_clear_keeps_or_drops_the_collection():
+    c = SourceCatalog()
+    c.add("docs", "model", {"a.md": (2, 200)})
+    c.add("other", "model", {"b.md": (1, 50)})
+
+    c.clear("docs")
+    assert [(summary["name"], summary["sources"]) for summary in c.collections()] == [("docs", 0), ("other", 1)]
+    c.clear("docs", drop=True)
+    assert [summary["name"] for summary in c.collections()] == ["other"]
+    c.close()
+
+
+class StandInClient:
+    def list_collections(self):
+        return []
+
+
+def test_verify_rebuilds_the_catalog_from_collections():
+    pytest.importorskip("chromadb")
+    from anyqa.models.vector_db import ChromaDB
+
+    collection = FlatCollection.create("docs", metadata={"embedding_model": "model"})
+    collection.add(
+        ids=["1", "2", "3"],
+        embeddings=np.eye(3, dtype=np.float32),
+        documents=["one", "two", "three"],
+        metadatas=[{"source": "a.md", "bytes": 3}, {"source": "a.md", "bytes": 3}, {"source": "b.md", "bytes": 5}],
+    )
+    db = ChromaDB()
+    db._client = StandInClient()
+    db.catalog.add("docs", "model", {"a.md": (1, 3), "stale.md": (4, 40)})
+    db.catalog.add("gone", "model", {"c.md": (1, 1)})
+
+    assert sorted(db.verify_catalog()) == ["docs", "gone"]
+    assert counts(db.catalog, "docs") == {"a.md": (2, 6), "b.md": (1, 5)}
+    assert [summary["name"] for summary in db.catalog.collections()] == ["docs"]
+    assert db.verify_catalog() == []
@@ -0,0 +1,32 @@
+from langchain_core.documents import Document
+
+from anyqa.models import chunkers
+from anyqa.models.chunkers import chunk_document
+
+
+class StandInTokenizer:
+    """Whitespace tokenizer that adds [CLS] and [SEP] like a BERT tokenizer, with model_max_length 512."""
+
+    model_max_length = 512
+
+    def num_special_tokens_to_add(self) -> int:
+        return 2
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> list[str]:
+        tokens = text.split()
+        return ["[CLS]", *tokens, "[SEP]"] if add_special_tokens else tokens
+
+
+def test_token_chunks_fit_the_model_without_truncation(monkeypatch):
+    tokenizer = StandInTokenizer()
+    monkeypatch.setattr(chunkers, "get_tokenizer", lambda name: tokenizer)
+    monkeypatch.setattr(chunkers, "get_max_seq_length", lambda name: 256)
+    chunkers.get_splitter.cache_clear()
+
+    doc = Document(page_content=" ".join(f"word{i}" for i in range(5000)), metadata={"source": "a.txt", "extension": ".txt"})
+    chunks = chunk_document(doc, chunk_size=1000, chunk_overlap=50, tokenizer_name="stand-in")
+    chunkers.get_splitter.cache_clear()
+
+    lengths = [len(tokenizer.encode(chunk.page_content)) for chunk in chunks]
+    assert max(lengths) == 256
+    assert all(length <= 256 for length in lengths)
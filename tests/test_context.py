@@ -0,0 +1,69 @@
+from langchain_core.documents import Document
+
+from anyqa.models.context import ContextPacker, merge_overlap
+
+
+def words(prefix: str, n: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_merge_overlap():
+    first = "The quick brown fox jumps over the lazy dog and runs away"
+    second = "over the lazy dog and runs away into the forest"
+    assert merge_overlap(first, second) == "The quick brown fox jumps over the lazy dog and runs away into the forest"
+    assert merge_overlap(second, first) == "The quick brown fox jumps over the lazy dog and runs away into the forest"
+    assert merge_overlap(first, "brown fox jumps") == first
+    assert merge_overlap(first, "a completely different text about something else") is None
+    # Overlaps shorter than min_overlap are not merged
+    assert merge_overlap("alpha beta gamma", "gamma delta epsilon") is None
+
+
+def test_overlapping_chunks_of_one_source_are_merged():
+    a = Document(page_content="The quick brown fox jumps over the lazy dog and runs away", metadata={"source": "a.md"})
+    b = Document(page_content="over the lazy dog and runs away into the forest", metadata={"source": "a.md"})
+    c = Document(page_content="over the lazy dog and runs away into the forest", metadata={"source": "b.md"})
+
+    context, stats = ContextPacker(max_tokens=None).pack([a, b])
+    assert context == "The quick brown fox jumps over the lazy dog and runs away into the forest"
+    assert stats.n_blocks == 1 and stats.deduplicated_tokens > 0 and stats.truncated_tokens == 0
+
+    _, stats = ContextPacker(max_tokens=None).pack([a, c])
+    assert stats.n_blocks == 2
+
+
+def test_near_duplicates_are_dropped_but_contained_blocks_are_not():
+    short = Document(page_content=words("w", 10), metadata={"source": "a.md"})
+    long = Document(page_content=words("w", 10) + " " + words("x", 90), metadata={"source": "b.md"})
+    copy = Document(page_content=words("w", 10) + " w0", metadata={"source": "c.md"})
+
+    context, stats = ContextPacker(max_tokens=None).pack([short, long, copy])
+    assert context == "\n\n".join([short.page_content, long.page_content])
+    assert stats.n_blocks == 2
+    assert stats.deduplicated_tokens == stats.original_tokens - stats.packed_tokens
+
+
+def test_first_block_is_truncated_to_a_small_budget():
+    doc = Document(page_content=words("w", 200), metadata={"source": "a.md"})
+    packer = ContextPacker(max_tokens=50)
+
+    context, stats = packer.pack([doc])
+    assert context and doc.page_content.startswith(context)
+    assert stats.n_blocks == 1 and stats.packed_tokens <= 50
+    assert stats.truncated_tokens == stats.original_tokens - stats.packed_tokens
+    assert stats.deduplicated_tokens == 0
+
+
+def test_budget_stops_before_small_remainders():
+    first = Document(page_content=words("a", 100), metadata={"source": "a.md"})
+    second = Document(page_content=words("b", 100), metadata={"source": "b.md"})
+    third = Document(page_content=words("c", 300), metadata={"source": "c.md"})
+    first_tokens = ContextPacker(max_tokens=None).pack([first])[1].packed_tokens
+
+    # Room for the first block and a useful part of the second
+    context, stats = ContextPacker(max_tokens=first_tokens + 100).pack([first, second])
+    assert stats.n_blocks == 2 and stats.packed_tokens <= first_tokens + 100
+
+    # Too little room left for any of the second block
+    context, stats = ContextPacker(max_tokens=first_tokens + 10).pack([first, second, third])
+    assert context == first.page_content
+    assert stats.truncated_tokens == stats.original_tokens - first_tokens
@@ -0,0 +1,106 @@
+import os
+import time
+
+from langchain_core.documents import Document
+
+from anyqa.models import document_loaders
+from anyqa.models.document_loaders import DirectoryDocumentLoader
+
+
+def load_or_crash(file_path: str, timeout: float | None):
+    # Runs in a worker process and kills it for files named crash*, like a parser segfaulting
+    if os.path.basename(file_path).startswith("crash"):
+        os._exit(1)
+    return document_loaders.load_single_document(file_path)
+
+
+def test_crashed_worker_only_fails_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_loaders, "_load_single_document_with_timeout", load_or_crash)
+    names = [f"{i:02d}.txt" for i in range(8)]
+    names.insert(3, "crash.txt")
+    for name in names:
+        (tmp_path / name).write_text(f"Contents of {name}")
+
+    loader = DirectoryDocumentLoader(str(tmp_path), depth=-1, pattern=[r".*\.txt"], workers=2)
+    docs = list(loader.lazy_load(paths=[str(tmp_path / name) for name in names]))
+
+    assert [os.path.basename(doc.metadata["source"]) for doc in docs] == [name for name in names if name != "crash.txt"]
+    assert loader.failed == [str(tmp_path / "crash.txt")]
+
+
+stream_single_document = document_loaders._stream_single_document
+
+
+class SlowRowLoader:
+    """Stand-in loader that parses one document, then hangs like a pathological file."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self):
+        yield Document(page_content="first rows", metadata={"source": self.file_path})
+        time.sleep(30)
+        yield Document(page_content="never reached", metadata={"source": self.file_path})
+
+
+def stream_or_hang(file_path: str, timeout: float | None, documents, skip: int = 0) -> int:
+    # Runs in a worker process, where files named slow* are parsed by SlowRowLoader
+    if os.path.basename(file_path).startswith("slow"):
+        document_loaders.DOCUMENT_MAP[".csv"] = SlowRowLoader
+    return stream_single_document(file_path, timeout, documents, skip)
+
+
+def stream_or_crash(file_path: str, timeout: float | None, documents, skip: int = 0) -> int:
+    # Runs in a worker process and kills it after the first document of files named crash*, even when it is skipped
+    if os.path.basename(file_path).startswith("crash"):
+        if skip == 0:
+            documents.put(next(document_loaders.lazy_load_single_document(file_path)))
+        os._exit(1)
+    return stream_single_document(file_path, timeout, documents, skip)
+
+
+def write_csv(path, rows: int):
+    path.write_text("name,value\n" + "".join(f"row {i},{i}\n" for i in range(rows)))
+
+
+def test_streamed_files_are_parsed_in_workers(tmp_path):
+    names = ["a.csv", "b.txt", "c.csv"]
+    write_csv(tmp_path / "a.csv", 95)
+    (tmp_path / "b.txt").write_text("Some text")
+    write_csv(tmp_path / "c.csv", 30)
+    paths = [str(tmp_path / name) for name in names]
+
+    sequential = list(DirectoryDocumentLoader(str(tmp_path), depth=-1, pattern=[".*"]).lazy_load(paths=paths))
+    parallel = list(DirectoryDocumentLoader(str(tmp_path), depth=-1, pattern=[".*"], workers=2).lazy_load(paths=paths))
+    assert [doc.metadata.get("loc", doc.metadata["source"]) for doc in parallel] == [
+        doc.metadata.get("loc", doc.metadata["source"]) for doc in sequential
+    ]
+    assert len(parallel) == 5 + 1 + 2
+
+
+def test_timeout_applies_to_streamed_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_loaders, "_stream_single_document", stream_or_hang)
+    write_csv(tmp_path / "slow.csv", 5)
+    write_csv(tmp_path / "fast.csv", 5)
+
+    loader = DirectoryDocumentLoader(str(tmp_path), depth=-1, pattern=[".*"], workers=2, timeout=1)
+    start = time.perf_counter()
+    docs = list(loader.lazy_load(paths=[str(tmp_path / "slow.csv"), str(tmp_path / "fast.csv")]))
+
+    assert time.perf_counter() - start < 15
+    assert [doc.page_content for doc in docs][0] == "first rows"
+    assert [os.path.basename(doc.metadata["source"]) for doc in docs[1:]] == ["fast.csv"]
+    assert loader.failed == [str(tmp_path / "slow.csv")]
+
+
+def test_crashed_streaming_worker_does_not_repeat_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_loaders, "_stream_single_document", stream_or_crash)
+    write_csv(tmp_path / "crash.csv", 45)
+    write_csv(tmp_path / "other.csv", 45)
+
+    loader = DirectoryDocumentLoader(str(tmp_path), depth=-1, pattern=[".*"], workers=2)
+    docs = list(loader.lazy_load(paths=[str(tmp_path / "crash.csv"), str(tmp_path / "other.csv")]))
+
+    sources = [os.path.basename(doc.metadata["source"]) for doc in docs]
+    assert sources == ["crash.csv", "other.csv", "other.csv", "other.csv"]
+    assert loader.failed == [str(tmp_path / "crash.csv")]
@@ -0,0 +1,52 @@
+import multiprocessing
+
+import numpy as np
+
+from anyqa.models import embedding_cache
+from anyqa.models.embedding_cache import EmbeddingCache
+
+
+def vectors_for(prefix: str, n: int) -> tuple[list[str], np.ndarray]:
+    keys = [f"{prefix}-{i}" for i in range(n)]
+    vectors = np.array([[ord(prefix[0]), i, len(prefix)] for i in range(n)], dtype=np.float32)
+    return keys, vectors
+
+
+def write_entries(directory, prefix: str):
+    # Runs in a separate process sharing the cache directory
+    embedding_cache.EMBEDDING_CACHE_DIRECTORY = directory
+    cache = EmbeddingCache(model_name="stand-in/model", max_entries=100_000)
+    keys, vectors = vectors_for(prefix, 2000)
+    for start in range(0, len(keys), 50):
+        cache.put_many(keys[start : start + 50], vectors[start : start + 50])
+    cache.close()
+
+
+def test_processes_sharing_the_cache_do_not_overwrite_each_other(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIRECTORY", tmp_path)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=write_entries, args=(tmp_path, prefix)) for prefix in ("a", "bb", "ccc")]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = EmbeddingCache(model_name="stand-in/model", max_entries=100_000)
+    assert len(cache) == 6000
+    for prefix in ("a", "bb", "ccc"):
+        keys, vectors = vectors_for(prefix, 2000)
+        found = cache.get_many(keys)
+        np.testing.assert_array_equal(np.stack([found[key] for key in keys]), vectors)
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIRECTORY", tmp_path)
+    cache = EmbeddingCache(model_name="stand-in/model", max_entries=3)
+    keys, vectors = vectors_for("a", 4)
+    cache.put_many(keys[:3], vectors[:3])
+    cache.get_many(keys[1:3])
+    cache.put_many(keys[3:], vectors[3:])
+    assert sorted(cache.get_many(keys)) == keys[1:]
+    cache.close()
@@ -0,0 +1,91 @@
+import pytest
+
+from anyqa.models.file_loaders import CSVRowLoader, ExcelRowLoader, PDFPageLoader
+
+
+def write_pdf(path, pages: list[str]):
+    # Minimal PDF with one Helvetica text line per page. Empty strings make pages without text.
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET" if text else ""
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    content = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_bytes(content.encode("latin-1"))
+
+
+def test_csv_rows_are_batched_with_locations(tmp_path):
+    path = tmp_path / "people.csv"
+    lines = ["name,city,note"] + [f"person {i},city {i % 3}," for i in range(45)]
+    lines[10] = ",,"  # an empty row is skipped but keeps its number
+    lines.append('last,"multi\nline",done')
+    path.write_text("\n".join(lines) + "\n")
+
+    docs = list(CSVRowLoader(str(path), rows_per_document=20).lazy_load())
+    assert [doc.metadata["loc"] for doc in docs] == [f"{path}#row=2-22", f"{path}#row=23-42", f"{path}#row=43-47"]
+    assert docs[0].page_content.split("\n\n")[0] == "name: person 0\ncity: city 0"
+    assert "person 9" not in docs[0].page_content
+    assert docs[-1].page_content.endswith("name: last\ncity: multi\nline\nnote: done")
+    assert sum(doc.page_content.count("name: ") for doc in docs) == 45
+    assert all(doc.metadata["source"] == str(path) for doc in docs)
+
+
+def test_excel_sheets_are_streamed(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "book.xlsx"
+    book = openpyxl.Workbook()
+    book.active.title = "first"
+    book.active.append(["id", None])
+    for i in range(5):
+        book.active.append([i, f"value {i}"])
+    second = book.create_sheet("second")
+    second.append(["id"])
+    second.append([99])
+    book.save(path)
+
+    docs = list(ExcelRowLoader(str(path), rows_per_document=3).lazy_load())
+    assert [doc.metadata["loc"] for doc in docs] == [f"{path}#sheet=first&row=2-4", f"{path}#sheet=first&row=5-6", f"{path}#sheet=second&row=2-2"]
+    assert docs[0].page_content.split("\n\n")[0] == "id: 0\ncolumn 2: value 0"
+    assert docs[2].metadata["sheet"] == "second"
+
+
+def test_excel_xls_sheets_are_streamed(tmp_path):
+    xlwt = pytest.importorskip("xlwt")
+    path = tmp_path / "book.xls"
+    book = xlwt.Workbook()
+    first = book.add_sheet("first")
+    for column, value in enumerate(["id", "name"]):
+        first.write(0, column, value)
+    for row in range(1, 5):
+        first.write(row, 0, row)
+        first.write(row, 1, f"name {row}")
+    book.add_sheet("second").write(0, 0, "only a header")
+    book.save(str(path))
+
+    docs = list(ExcelRowLoader(str(path), rows_per_document=3).lazy_load())
+    assert [doc.metadata["loc"] for doc in docs] == [f"{path}#sheet=first&row=2-4", f"{path}#sheet=first&row=5-5"]
+    assert docs[0].page_content.split("\n\n")[0] == "id: 1.0\nname: name 1"
+    assert all(doc.metadata["sheet"] == "first" for doc in docs)
+
+
+def test_pdf_pages_are_streamed_and_blank_pages_skipped(tmp_path):
+    path = tmp_path / "manual.pdf"
+    write_pdf(path, ["Installing the package", "", "Loading a directory"])
+
+    docs = list(PDFPageLoader(str(path)).lazy_load())
+    assert [doc.page_content for doc in docs] == ["Installing the package", "Loading a directory"]
+    assert [doc.metadata for doc in docs] == [
+        {"source": str(path), "page": 1, "loc": f"{path}#page=1"},
+        {"source": str(path), "page": 3, "loc": f"{path}#page=3"},
+    ]
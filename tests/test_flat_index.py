@@ -0,0 +1,120 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from anyqa.models import flat_index
+from anyqa.models.flat_index import FlatCollection, matches_where
+
+
+@pytest.fixture(autouse=True)
+def flat_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(flat_index, "FLAT_INDEX_DIRECTORY", tmp_path / "flat")
+
+
+def make_records(n: int, dim: int = 8, seed: int = 0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    ids = [f"id-{i}" for i in range(n)]
+    documents = [f"document {i}" for i in range(n)]
+    metadatas = [{"source": f"file_{i % 3}.md", "page": i} for i in range(n)]
+    return ids, vectors, documents, metadatas
+
+
+def test_query_is_exact_and_persists():
+    ids, vectors, documents, metadatas = make_records(3000)
+    collection = FlatCollection.create("docs", metadata={"embedding_model": "stand-in"})
+    for start in range(0, 3000, 700):
+        window = slice(start, start + 700)
+        collection.add(ids=ids[window], embeddings=vectors[window], documents=documents[window], metadatas=metadatas[window])
+
+    reopened = FlatCollection("docs")
+    assert reopened.count() == 3000
+    assert reopened.metadata == {"embedding_model": "stand-in"}
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = normalized[[5, 77, 2999]]
+    expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :4]
+    result = reopened.query(query_embeddings=queries, n_results=4)
+    assert result["ids"] == [[ids[i] for i in row] for row in expected]
+    assert result["documents"][1][0] == "document 77"
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_where_filters_and_deletes():
+    ids, vectors, documents, metadatas = make_records(30)
+    collection = FlatCollection.create("docs", metadata={})
+    collection.add(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+
+    result = collection.query(query_embeddings=vectors[:1], n_results=50, where={"source": "file_1.md"})
+    assert len(result["ids"][0]) == 10
+    assert all(metadata["source"] == "file_1.md" for metadata in result["metadatas"][0])
+    assert collection.get(where={"$and": [{"source": "file_0.md"}, {"page": {"$gte": 15}}]}, include=[])["ids"] == [
+        f"id-{i}" for i in range(15, 30, 3)
+    ]
+
+    collection.delete(where={"source": "file_0.md"})
+    collection.delete(ids=["id-1"])
+    assert collection.count() == 19
+    assert "id-0" not in collection.get(include=[])["ids"]
+    assert collection.query(query_embeddings=vectors[:1], n_results=1)["ids"][0] != ["id-0"]
+
+    # Freed rows are reused before the matrix grows
+    capacity = collection.capacity
+    collection.add(ids=["new"], embeddings=vectors[:1], documents=["new"], metadatas=[{"source": "new.md"}])
+    assert collection.capacity == capacity
+    assert collection.query(query_embeddings=vectors[:1], n_results=1)["ids"] == [["new"]]
+
+
+def test_paged_get_and_drop():
+    ids, vectors, documents, metadatas = make_records(25)
+    collection = FlatCollection.create("docs", metadata={})
+    collection.add(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+
+    pages = [collection.get(include=["metadatas"], limit=10, offset=offset)["ids"] for offset in range(0, 30, 10)]
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == ids
+    assert collection.get(ids=["id-3"], include=["embeddings"])["embeddings"].shape == (1, 8)
+
+    assert FlatCollection.list_names() == ["docs"]
+    collection.drop()
+    assert not FlatCollection.exists("docs")
+
+
+def test_matches_where():
+    metadata = {"source": "a.md", "page": 3}
+    assert matches_where(metadata, {"source": "a.md"})
+    assert matches_where(metadata, {"$or": [{"source": "b.md"}, {"page": {"$in": [1, 3]}}]})
+    assert not matches_where(metadata, {"missing": {"$ne": 1}})
+    with pytest.raises(ValueError):
+        matches_where(metadata, {"page": {"$regex": "3"}})
+
+
+def add_records(directory, prefix: str):
+    # Runs in a separate process writing to the same collection
+    flat_index.FLAT_INDEX_DIRECTORY = directory
+    ids, vectors, documents, metadatas = make_records(1500, seed=len(prefix))
+    collection = FlatCollection("docs")
+    for start in range(0, 1500, 100):
+        window = slice(start, start + 100)
+        collection.add(
+            ids=[f"{prefix}{id}" for id in ids[window]], embeddings=vectors[window], documents=documents[window], metadatas=metadatas[window]
+        )
+
+
+def test_concurrent_writers_and_stale_readers(tmp_path):
+    reader = FlatCollection.create("docs", metadata={})
+    assert reader.count() == 0
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=add_records, args=(tmp_path / "flat", prefix)) for prefix in ("a", "bb")]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    # The reader opened before either write, and picks up both processes' records and the grown matrix
+    assert reader.count() == 3000
+    for prefix in ("a", "bb"):
+        ids, vectors, _, _ = make_records(1500, seed=len(prefix))
+        result = reader.query(query_embeddings=vectors[[0, 1499]], n_results=1, include=[])
+        assert result["ids"] == [[f"{prefix}id-0"], [f"{prefix}id-1499"]]
@@ -0,0 +1,68 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from anyqa.models import flat_index, lexical_index
+from anyqa.models.flat_index import FlatCollection
+from anyqa.models.lexical_index import BM25Index, tokenize
+
+
+@pytest.fixture(autouse=True)
+def index_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIRECTORY", tmp_path / "lexical")
+    monkeypatch.setattr(flat_index, "FLAT_INDEX_DIRECTORY", tmp_path / "flat")
+
+
+def make_texts(n: int) -> tuple[list[str], list[str]]:
+    words = ["alpha", "beta", "gamma", "delta", "load_documents", "chunk"]
+    rng = np.random.default_rng(0)
+    texts = [" ".join(rng.choice(words, size=rng.integers(3, 30))) for _ in range(n)]
+    return [f"id-{i}" for i in range(n)], texts
+
+
+def reference_scores(texts: list[str], ids: list[str], query: str, k1: float = 1.5, b: float = 0.75) -> dict[str, float]:
+    documents = [Counter(tokenize(text)) for text in texts]
+    average_length = sum(sum(document.values()) for document in documents) / len(documents)
+    scores = Counter()
+    for term in set(tokenize(query)):
+        df = sum(term in document for document in documents)
+        if not df:
+            continue
+        idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+        for id, document in zip(ids, documents):
+            if term in document:
+                length = sum(document.values())
+                scores[id] += idf * document[term] * (k1 + 1) / (document[term] + k1 * (1 - b + b * length / average_length))
+    return scores
+
+
+def test_search_matches_bm25():
+    ids, texts = make_texts(500)
+    index = BM25Index("docs")
+    index.add(ids, texts)
+
+    expected = reference_scores(texts, ids, "gamma documents missing")
+    found = index.search("gamma documents missing", 10)
+    assert len(found) == 10
+    assert [score for _, score in found] == sorted((score for _, score in found), reverse=True)
+    for id, score in found:
+        assert score == pytest.approx(expected[id])
+    assert found[0][1] == pytest.approx(max(expected.values()))
+    assert index.search("missing", 10) == []
+    index.close()
+
+
+def test_sync_fills_an_index_created_after_the_collection():
+    ids, texts = make_texts(120)
+    collection = FlatCollection.create("docs", metadata={})
+    collection.add(ids=ids, embeddings=np.ones((120, 4), dtype=np.float32), documents=texts, metadatas=[{"source": "a.md"}] * 120)
+    index = BM25Index("docs")
+    index.add(["id-0", "removed"], [texts[0], "gone"])
+
+    assert index.sync(collection, page_size=50)
+    assert index.count() == 120
+    assert {id for id, _ in index.search("alpha beta gamma delta chunk", 200)} == set(ids)
+    assert not index.sync(collection)
+    index.close()
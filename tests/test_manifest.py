@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from anyqa.models import manifest
+from anyqa.models.manifest import Manifest
+
+
+@pytest.fixture(autouse=True)
+def manifest_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "MANIFEST_DIRECTORY", tmp_path / "manifests")
+
+
+@pytest.fixture
+def docs(tmp_path):
+    directory = tmp_path / "docs"
+    directory.mkdir()
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        (directory / name).write_text(f"Contents of {name}")
+    return directory
+
+
+def record(m: Manifest, directory) -> list[str]:
+    paths = sorted(str(path) for path in directory.iterdir())
+    for path in paths:
+        m.update(path, [f"{os.path.basename(path)}-0"])
+    return paths
+
+
+def test_unchanged_files_are_skipped(docs):
+    m = Manifest("docs")
+    paths = record(m, docs)
+    m.save()
+
+    reloaded = Manifest("docs")
+    reloaded.load()
+    assert reloaded.diff(paths, root=str(docs)) == ([], [])
+    assert reloaded.ids(paths[0]) == ["a.txt-0"]
+
+
+def test_changed_and_deleted_files(docs):
+    m = Manifest("docs")
+    paths = record(m, docs)
+    (docs / "a.txt").write_text("New contents")
+    (docs / "d.txt").write_text("A new file")
+    (docs / "c.txt").unlink()
+
+    changed, removed = m.diff([paths[0], paths[1], str(docs / "d.txt")], root=str(docs))
+    assert changed == [paths[0], str(docs / "d.txt")]
+    assert removed == [os.path.abspath(paths[2])]
+    assert m.remove(paths[2]) == ["c.txt-0"]
+
+
+def test_touched_but_identical_files_are_refreshed(docs):
+    m = Manifest("docs")
+    paths = record(m, docs)
+    stat = os.stat(paths[0])
+    os.utime(paths[0], (stat.st_atime, stat.st_mtime + 10))
+
+    assert m.diff(paths, root=str(docs)) == ([], [])
+    assert m.entries[os.path.abspath(paths[0])]["mtime"] == stat.st_mtime + 10
+    assert m.ids(paths[0]) == ["a.txt-0"]
+
+
+def test_files_outside_root_are_not_removed(docs, tmp_path):
+    m = Manifest("docs")
+    paths = record(m, docs)
+    other = tmp_path / "docs2"
+    other.mkdir()
+    (other / "e.txt").write_text("Elsewhere")
+    m.update(str(other / "e.txt"), ["e.txt-0"])
+
+    assert m.diff(paths, root=str(docs)) == ([], [])
+
+
+def test_forget_ids_drops_files_with_deleted_chunks(docs):
+    m = Manifest("docs")
+    paths = record(m, docs)
+
+    m.forget_ids(["b.txt-0", "unknown"])
+    assert sorted(m.entries) == [os.path.abspath(paths[0]), os.path.abspath(paths[2])]
+    assert m.ids(paths[1]) == []
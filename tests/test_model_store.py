@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from anyqa.models import model_store
+from anyqa.models.model_store import get_model, get_model_revision, read_pins, resolve_model
+
+
+def test_resolve_pinned_snapshot(tmp_path):
+    snapshot = tmp_path / "models--org--model" / "snapshots" / "abc123"
+    snapshot.mkdir(parents=True)
+    pins = {"org/model": {"revision": "abc123", "path": "models--org--model/snapshots/abc123", "pulled": "2024-06-01T00:00:00+00:00"}}
+    (tmp_path / model_store.PINS_FILE).write_text(json.dumps(pins))
+
+    assert read_pins(str(tmp_path)) == pins
+    assert resolve_model("org/model", str(tmp_path)) == snapshot
+    assert resolve_model(str(snapshot), str(tmp_path)) == snapshot
+
+    snapshot.rmdir()
+    with pytest.raises(FileNotFoundError, match="anyqa models pull org/model"):
+        resolve_model("org/model", str(tmp_path))
+
+
+def test_revision_identifies_the_local_model(tmp_path):
+    snapshot = tmp_path / "models--org--model" / "snapshots" / "abc123"
+    snapshot.mkdir(parents=True)
+    pins = {"org/model": {"revision": "abc123", "path": "models--org--model/snapshots/abc123", "pulled": "2024-06-01T00:00:00+00:00"}}
+    (tmp_path / model_store.PINS_FILE).write_text(json.dumps(pins))
+    assert get_model_revision("org/model", str(tmp_path)) == "abc123"
+
+    local = tmp_path / "local-model"
+    local.mkdir()
+    (local / "config.json").write_text("{}")
+    revision = get_model_revision(str(local), str(tmp_path))
+    assert get_model_revision(str(local), str(tmp_path)) == revision
+    (local / "config.json").write_text('{"hidden_size": 8}')
+    assert get_model_revision(str(local), str(tmp_path)) != revision
+
+
+def test_models_are_loaded_once_per_process(monkeypatch):
+    monkeypatch.setattr(model_store, "_models", {})
+    monkeypatch.setattr(model_store, "load_seconds", {})
+    loads = []
+
+    def load():
+        loads.append(1)
+        return object()
+
+    first = get_model(("torch", "org/model", "cpu"), load)
+    assert get_model(("torch", "org/model", "cpu"), load) is first
+    assert get_model(("onnx", "org/model"), load) is not first
+    assert len(loads) == 2
+    assert set(model_store.load_seconds) == {("torch", "org/model", "cpu"), ("onnx", "org/model")}
+
+
+def test_missing_model_is_not_pulled(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_store, "pull_model", lambda *args, **kwargs: pytest.fail("resolve_model must not pull models"))
+    with pytest.raises(FileNotFoundError, match="anyqa models pull org/missing"):
+        resolve_model("org/missing", str(tmp_path))
+
+
+class OldTorchModel:
+    base_model_prefix = "model"
+
+    def load_state_dict(self, state_dict, strict=True):
+        pytest.fail("weights must not be loaded without assign")
+
+
+class StandInTransformer:
+    auto_model = OldTorchModel()
+
+
+def test_weights_are_not_mapped_without_assign(tmp_path):
+    (tmp_path / "model.safetensors").write_bytes(b"")
+    assert model_store._mmap_weights(StandInTransformer(), tmp_path) is False
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from anyqa.constants import DEFAULT_EMBEDDING_MODEL
+from anyqa.models.embeddings import Embeddings, get_pooling_mode, pool_embeddings
+
+TEXTS = [
+    "How do I load a directory of Markdown files into a collection?",
+    "def chunk_document(doc, chunk_size, chunk_overlap):\n    return splitter.split_documents([doc])",
+    "Chroma stores embeddings in SQLite and an HNSW index.",
+    "short",
+    " ".join(["A long paragraph about retrieval augmented generation."] * 60),
+]
+
+
+@pytest.fixture(scope="module")
+def torch_vectors():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    engine = Embeddings(model_name=DEFAULT_EMBEDDING_MODEL, cache_size=0, backend="torch").get_embedding_function()
+    yield engine.encode(TEXTS)
+    engine.close()
+
+
+@pytest.mark.parametrize("backend, min_cosine", [("onnx", 0.9999), ("onnx-int8", 0.98)])
+def test_onnx_parity(torch_vectors, backend, min_cosine):
+    engine = Embeddings(model_name=DEFAULT_EMBEDDING_MODEL, cache_size=0, backend=backend).get_embedding_function()
+    vectors = engine.encode(TEXTS)
+    engine.close()
+
+    assert vectors.shape == torch_vectors.shape
+    assert vectors.dtype == np.float32
+    cosine = np.sum(vectors * torch_vectors, axis=1)
+    assert cosine.min() >= min_cosine
+
+
+def test_mean_pooling_ignores_padding():
+    hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    np.testing.assert_allclose(pool_embeddings(hidden, mask, "mean"), [[2.0, 3.0]])
+    np.testing.assert_allclose(pool_embeddings(hidden, mask, "max"), [[3.0, 4.0]])
+    np.testing.assert_allclose(pool_embeddings(hidden, mask, "cls"), [[1.0, 2.0]])
+
+
+def test_only_single_cls_max_or_mean_pooling_is_exported():
+    assert get_pooling_mode(SimpleNamespace(pooling_mode_cls_token=True, pooling_mode_mean_tokens=False)) == "cls"
+    assert get_pooling_mode(SimpleNamespace(pooling_mode_mean_tokens=True)) == "mean"
+    for pooling in (
+        SimpleNamespace(pooling_mode_weightedmean_tokens=True),
+        SimpleNamespace(pooling_mode_lasttoken=True),
+        SimpleNamespace(pooling_mode_mean_tokens=True, pooling_mode_mean_sqrt_len_tokens=True),
+    ):
+        with pytest.raises(ValueError, match="not supported by the ONNX backend"):
+            get_pooling_mode(pooling)
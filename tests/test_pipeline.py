@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from anyqa.models.pipeline import batched, prefetch
+from anyqa.models.web_fetcher import iterate_async
+
+
+def test_batched():
+    assert list(batched(range(7), batch_size=3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    with pytest.raises(ValueError):
+        list(batched([1], batch_size=0))
+
+
+def test_prefetch_keeps_order_and_bounds_the_buffer():
+    produced = []
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    consumed = []
+    for item in prefetch(items(), max_items=4):
+        consumed.append(item)
+        if item == 0:
+            time.sleep(0.2)
+            # One item is held by the consumer, up to four are buffered and one is blocked on a full buffer
+            assert len(produced) <= 6
+    assert consumed == list(range(100))
+
+
+def test_prefetch_raises_producer_errors_after_earlier_items():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("Parser failed")
+
+    consumed = []
+    with pytest.raises(RuntimeError, match="Parser failed"):
+        for item in prefetch(items(), max_items=1):
+            consumed.append(item)
+    assert consumed == [1, 2]
+
+
+def test_prefetch_stops_the_producer_when_closed_early():
+    stopped = threading.Event()
+
+    def items():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            stopped.set()
+
+    iterator = prefetch(items(), max_items=2)
+    assert next(iterator) == 0
+    iterator.close()
+    assert stopped.wait(5)
+
+
+async def numbers(n: int):
+    for i in range(n):
+        yield i
+    raise RuntimeError("Sitemap failed")
+
+
+def test_iterate_async_keeps_order_and_raises_errors():
+    consumed = []
+    with pytest.raises(RuntimeError, match="Sitemap failed"):
+        for item in iterate_async(numbers(5), max_items=2):
+            consumed.append(item)
+    assert consumed == list(range(5))
+
+
+def test_iterate_async_closes_the_generator_when_closed_early():
+    closed = threading.Event()
+
+    async def pages():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    iterator = iterate_async(pages(), max_items=2)
+    assert [next(iterator), next(iterator)] == [0, 1]
+    iterator.close()
+    assert closed.wait(5)
@@ -0,0 +1,61 @@
+import json
+import pstats
+import time
+
+import pytest
+
+from anyqa.models.pipeline import prefetch
+from anyqa.models.profiling import ProfilingSession, Profiler, profiler
+
+
+@pytest.fixture(autouse=True)
+def disabled_profiler():
+    yield
+    profiler.disable()
+    profiler.thread_profiles = None
+
+
+def test_self_time_excludes_nested_spans():
+    p = Profiler()
+    p.enable()
+    with p.span("store.write", chunks=2):
+        time.sleep(0.02)
+        with p.span("embed.encode"):
+            time.sleep(0.05)
+    p.record("query.generate", time.perf_counter(), 0.5)
+
+    stages = {stage["name"]: stage for stage in p.summary()}
+    assert stages["store.write"]["seconds"] >= stages["embed.encode"]["seconds"] >= 0.05
+    assert stages["store.write"]["self_seconds"] == pytest.approx(stages["store.write"]["seconds"] - stages["embed.encode"]["seconds"])
+    assert stages["query.generate"] == {"name": "query.generate", "count": 1, "seconds": 0.5, "self_seconds": 0.5}
+    assert [stage["name"] for stage in p.summary()] == ["query.generate", "store.write", "embed.encode"]
+
+    events = p.trace()["traceEvents"]
+    assert [event["name"] for event in events] == ["embed.encode", "store.write", "query.generate"]
+    assert events[1]["ph"] == "X" and events[1]["args"] == {"chunks": 2}
+
+
+def test_disabled_profiler_records_nothing():
+    p = Profiler()
+    with p.span("load.parse"):
+        pass
+    p.record("query.generate", time.perf_counter(), 0.5)
+    assert p.summary() == [] and p.trace()["traceEvents"] == []
+
+
+def parse_in_producer(i: int) -> int:
+    time.sleep(0.001)
+    return i
+
+
+def test_function_profile_includes_prefetch_thread(tmp_path):
+    session = ProfilingSession("load", trace_path=str(tmp_path / "trace.json"), functions=True).begin()
+    with profiler.span("load.embed"):
+        assert list(prefetch((parse_in_producer(i) for i in range(20)), max_items=4)) == list(range(20))
+    session.stop()
+
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert trace["command"] == "load" and [stage["name"] for stage in trace["stages"]] == ["load.embed"]
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / "trace.prof")).stats}
+    assert "parse_in_producer" in functions
+    assert profiler.thread_profiles is None and not profiler.enabled
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from langchain_core.documents import Document
+
+from anyqa.models import query
+from anyqa.models.persona import Persona
+from anyqa.models.query import RAG
+
+
+class StandInCollection:
+    collection_name = "docs"
+
+    def as_retriever(self, search_kwargs=None, hybrid=False):
+        return None
+
+    def similarity_search_many(self, questions, k=4, where=None):
+        return [[Document(page_content=f"About {question}", metadata={"source": "a.md"})] for question in questions]
+
+
+class StandInEmbeddings:
+    def encode(self, texts):
+        return np.array([[float(len(text))] for text in texts])
+
+
+class StandInAnswerCache:
+    def __init__(self, answers):
+        self.answers = answers
+        self.stored = []
+
+    def get(self, collection, persona, llm, settings, question, embedding):
+        return self.answers.get(question)
+
+    def put(self, collection, persona, llm, settings, question, embedding, response, sources):
+        self.stored.append(question)
+
+
+class StandInClient:
+    def __init__(self, model, base_url, pool_size):
+        pass
+
+    def generate(self, prompt: str) -> str:
+        if "broken" in prompt:
+            raise ConnectionError("Ollama went away")
+        return "An answer"
+
+    def close(self):
+        pass
+
+
+def test_batch_query_records_failed_questions(monkeypatch):
+    monkeypatch.setattr(query, "OllamaClient", StandInClient)
+    rag = RAG(collection=StandInCollection(), persona=Persona("default", "{context}\n{question}"), model_name="llm", search_kwargs={"k": 1})
+
+    results = sorted(rag.batch_query(["first", "broken", "third"], concurrency=2))
+    assert [(index, response, error) for index, response, _, _, error in results] == [
+        (0, "An answer", None),
+        (1, None, "ConnectionError: Ollama went away"),
+        (2, "An answer", None),
+    ]
+
+
+def test_batch_query_reuses_cached_answers(monkeypatch):
+    monkeypatch.setattr(query, "OllamaClient", StandInClient)
+    collection = StandInCollection()
+    collection.embedding_function = StandInEmbeddings()
+    cached_sources = [Document(page_content="Cached", metadata={"source": "b.md"})]
+    answer_cache = StandInAnswerCache({"second": ("A cached answer", cached_sources)})
+    rag = RAG(
+        collection=collection,
+        persona=Persona("default", "{context}\n{question}"),
+        model_name="llm",
+        search_kwargs={"k": 1},
+        answer_cache=answer_cache,
+    )
+
+    results = sorted(rag.batch_query(["first", "second"], concurrency=2))
+    assert [(index, response) for index, response, _, _, _ in results] == [(0, "An answer"), (1, "A cached answer")]
+    assert results[1][2] == cached_sources
+    assert answer_cache.stored == ["first"]
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from anyqa.models import flat_index, lexical_index
+from anyqa.models.flat_index import FlatCollection
+from anyqa.models.lexical_index import BM25Index
+from anyqa.models.retrievers import HybridRetriever, VectorRetriever
+
+
+@pytest.fixture(autouse=True)
+def index_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIRECTORY", tmp_path / "lexical")
+    monkeypatch.setattr(flat_index, "FLAT_INDEX_DIRECTORY", tmp_path / "flat")
+
+
+class StandInDB:
+    """ChromaDB stand-in over a flat collection, whose vector search ranks records by their first coordinate."""
+
+    def __init__(self, records: list[tuple[str, str, dict, float]]):
+        self.collection = FlatCollection.create("docs", metadata={})
+        ids, documents, metadatas, scores = zip(*records)
+        embeddings = np.array([[score, np.sqrt(1 - score**2)] for score in scores], dtype=np.float32)
+        self.collection.add(ids=list(ids), embeddings=embeddings, documents=list(documents), metadatas=list(metadatas))
+        self.lexical_index = BM25Index("docs")
+        self.lexical_index.add(list(ids), list(documents))
+
+    def similarity_search_with_ids(self, query: str, k: int = 4, filter: dict | None = None):
+        result = self.collection.query(query_embeddings=[[1.0, 0.0]], n_results=k, where=filter, include=["documents", "metadatas"])
+        docs = [Document(page_content=content, metadata=metadata) for content, metadata in zip(result["documents"][0], result["metadatas"][0])]
+        return result["ids"][0], docs
+
+
+RECORDS = [
+    ("id-1", "loading markdown files into a collection", {"source": "a.md", "loc": "a.md#1"}, 0.9),
+    ("id-2", "the chunk_size setting controls chunk length", {"source": "b.md"}, 0.8),
+    ("id-3", "unrelated notes about deployment", {"source": "b.md"}, 0.7),
+    ("id-4", "chunk_size and chunk_overlap in the config file", {"source": "c.md"}, 0.1),
+]
+
+
+def test_hybrid_results_use_stored_ids_and_fuse_both_legs():
+    db = StandInDB(RECORDS)
+    retriever = HybridRetriever(collection=db, k=3, fetch_k=3)
+    docs = retriever.invoke("chunk_size")
+
+    contents = [doc.page_content for doc in docs]
+    assert len(contents) == len(set(contents)) == 3
+    # Found by both legs, so ranked first
+    assert contents[0] == RECORDS[1][1]
+    # Only found by the keyword index
+    assert RECORDS[3][1] in contents
+
+
+def test_hybrid_keyword_hits_respect_the_filter():
+    db = StandInDB(RECORDS)
+    retriever = HybridRetriever(collection=db, k=4, fetch_k=4, search_kwargs={"filter": {"source": "b.md"}})
+    docs = retriever.invoke("chunk_size config")
+    assert {doc.metadata["source"] for doc in docs} == {"b.md"}
+
+
+def test_search_kwargs_are_not_shared():
+    first = VectorRetriever(collection=None)
+    first.search_kwargs["filter"] = {"source": "a.md"}
+    assert VectorRetriever(collection=None).search_kwargs == {}
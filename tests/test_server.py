@@ -0,0 +1,118 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from anyqa.models import catalog
+from anyqa.models.catalog import SourceCatalog
+from anyqa.models.persona import Persona
+from anyqa.server import QueryServer, QueryService, request_query
+
+
+@pytest.fixture(autouse=True)
+def catalog_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_FILE", tmp_path / "catalog.sqlite")
+
+
+class StandInService:
+    def __init__(self):
+        self.calls = []
+
+    def query(self, question: str, collection: str = "default", **settings) -> dict:
+        if question == "broken":
+            raise RuntimeError("Ollama went away")
+        self.calls.append((question, collection, settings))
+        return {"question": question, "response": "An answer", "sources": ["a.md"]}
+
+
+@pytest.fixture
+def url():
+    service = StandInService()
+    query_server = QueryServer(host="127.0.0.1", port=0, service=service)
+    thread = threading.Thread(target=query_server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{query_server.server_address[1]}", service
+    query_server.shutdown()
+    query_server.server_close()
+
+
+def test_health_and_unknown_paths(url):
+    base, _ = url
+    with urllib.request.urlopen(base + "/health") as response:
+        assert json.loads(response.read()) == {"status": "ok"}
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(base + "/missing")
+    assert error.value.code == 404
+
+
+def test_query_forwards_settings(url):
+    base, service = url
+    result = request_query(base, {"question": "What is it?", "collection": "docs", "context_tokens": 512, "no_cache": True})
+    assert result == {"question": "What is it?", "response": "An answer", "sources": ["a.md"]}
+    assert service.calls == [("What is it?", "docs", {"context_tokens": 512, "no_cache": True})]
+
+
+def test_query_errors(url):
+    base, _ = url
+    with pytest.raises(RuntimeError, match="Server error: TypeError"):
+        request_query(base, {"collection": "docs"})
+    with pytest.raises(RuntimeError, match="Server error: RuntimeError: Ollama went away"):
+        request_query(base, {"question": "broken"})
+
+
+class StandInConfig:
+    personas = [Persona("default", "{context}\n{question}")]
+    default_llm = "llm"
+
+
+class StandInQueryService(QueryService):
+    """Service whose collections and RAG chains are plain objects, optionally held up while they are built."""
+
+    def __init__(self):
+        super().__init__(config=StandInConfig(), answer_cache=False)
+        self.opened = []
+        self.hold = {}
+        self.building = threading.Event()
+
+    def _open_collection(self, collection: str):
+        if collection in self.hold:
+            self.building.set()
+            self.hold[collection].wait(5)
+        self.opened.append(collection)
+        return object()
+
+    def _build_rag(self, db, persona, llm, k, hybrid, context_tokens, answer_cache):
+        return (db, k, context_tokens, answer_cache)
+
+
+def test_collections_are_reopened_after_they_change():
+    service = StandInQueryService()
+    SourceCatalog().add("docs", "model", {"a.md": (1, 10)})
+    db = service.get_collection("docs")
+    rag = service.get_rag("docs", "default", "llm", 3)
+    assert service.get_collection("docs") is db
+    assert service.get_rag("docs", "default", "llm", 3) is rag
+    assert service.get_rag("docs", "default", "llm", 3, context_tokens=512) is not rag
+
+    # Another process loads more records into the collection
+    SourceCatalog().add("docs", "model", {"b.md": (1, 10)})
+    assert service.get_collection("docs") is not db
+    assert service.get_rag("docs", "default", "llm", 3)[0] is service.get_collection("docs")
+    assert service.opened == ["docs", "docs"]
+
+
+def test_opening_a_collection_does_not_block_others():
+    service = StandInQueryService()
+    service.hold["slow"] = threading.Event()
+    opening = threading.Thread(target=service.get_collection, args=("slow",))
+    opening.start()
+    try:
+        assert service.building.wait(5)
+        service.get_collection("fast")
+        assert service.opened == ["fast"]
+    finally:
+        service.hold["slow"].set()
+        opening.join()
+    assert service.opened == ["fast", "slow"]
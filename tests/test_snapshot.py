@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from anyqa.models import snapshot as snapshot_module
+from anyqa.models.snapshot import Snapshot, export_collection
+
+
+class StandInCollection:
+    """Minimal stand-in for a Chroma collection, supporting count and paged get."""
+
+    def __init__(self, n: int, dim: int):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(n, dim)).astype(np.float32)
+        self.embeddings = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.ids = [f"id-{i}" for i in range(n)]
+        self.documents = [f"document {i}" for i in range(n)]
+        self.metadatas = [{"source": f"file_{i % 7}.md", "bytes": 10} for i in range(n)]
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include, limit, offset):
+        window = slice(offset, offset + limit)
+        return {
+            "ids": self.ids[window],
+            "embeddings": self.embeddings[window].tolist(),
+            "documents": self.documents[window],
+            "metadatas": self.metadatas[window],
+        }
+
+
+class StandInDB:
+    def __init__(self, n: int, dim: int):
+        self.collection = StandInCollection(n, dim)
+        self.collection_name = "snapshots"
+        self.embedding_model = "stand-in/model"
+        self.embedding_backend = "onnx"
+
+
+@pytest.mark.parametrize("dtype, atol", [("float32", 0), ("float16", 1e-3)])
+def test_round_trip(tmp_path, dtype, atol):
+    db = StandInDB(n=2500, dim=16)
+    manifest = export_collection(db, tmp_path / "snapshot", dtype=dtype, chunk_size=1000, chunk_overlap=200)
+    assert manifest["count"] == 2500 and manifest["dimension"] == 16 and manifest["chunk_size"] == 1000
+
+    snapshot = Snapshot(tmp_path / "snapshot")
+    assert snapshot.vectors.dtype == np.dtype(dtype)
+    assert isinstance(snapshot.vectors, np.memmap)
+    assert (snapshot.embedding_model, snapshot.embedding_backend) == ("stand-in/model", "onnx")
+
+    batches = list(snapshot.iter_batches(batch_size=1000))
+    assert [len(ids) for ids, _, _, _ in batches] == [1000, 1000, 500]
+    ids = [id for batch_ids, _, _, _ in batches for id in batch_ids]
+    vectors = np.concatenate([batch_vectors for _, batch_vectors, _, _ in batches])
+    assert ids == db.collection.ids
+    np.testing.assert_allclose(vectors, db.collection.embeddings, atol=atol)
+    assert batches[0][3][3] == db.collection.metadatas[3]
+    snapshot.close()
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_search_is_exact(tmp_path, monkeypatch, dtype):
+    monkeypatch.setattr(snapshot_module, "SEARCH_BLOCK_ROWS", 64)
+    db = StandInDB(n=500, dim=8)
+    export_collection(db, tmp_path / "snapshot", dtype=dtype)
+    snapshot = Snapshot(tmp_path / "snapshot")
+
+    queries = db.collection.embeddings[[3, 42]]
+    results = snapshot.search(queries, k=5)
+    expected = np.argsort(-(queries @ db.collection.embeddings.T), axis=1)[:, :5]
+    assert [[row for row, _ in result] for result in results] == expected.tolist()
+    assert snapshot.records([42, 3])[0] == ("id-42", "document 42", db.collection.metadatas[42])
+    snapshot.close()
+
+
+def test_export_refuses_existing_path(tmp_path):
+    (tmp_path / "snapshot").mkdir()
+    with pytest.raises(FileExistsError):
+        export_collection(StandInDB(n=1, dim=2), tmp_path / "snapshot")
+
+
+def test_failed_export_leaves_nothing_behind(tmp_path):
+    db = StandInDB(n=2500, dim=4)
+    db.collection.count = lambda: 3000
+    with pytest.raises(RuntimeError, match="changed during export"):
+        export_collection(db, tmp_path / "snapshot")
+    assert list(tmp_path.iterdir()) == []
+
+
+class StandInClient:
+    """Chroma client with no collections, so imported collections are created as flat collections."""
+
+    def get_collection(self, name: str):
+        raise ValueError(f"Collection {name} does not exist.")
+
+
+def test_import_does_not_load_the_embedding_model(tmp_path, monkeypatch):
+    pytest.importorskip("chromadb")
+    from anyqa.models import answer_cache, catalog, flat_index, lexical_index, vector_db
+    from anyqa.models.snapshot import import_snapshot
+
+    monkeypatch.setattr(catalog, "CATALOG_FILE", tmp_path / "catalog.sqlite")
+    monkeypatch.setattr(flat_index, "FLAT_INDEX_DIRECTORY", tmp_path / "flat")
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIRECTORY", tmp_path / "lexical")
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_FILE", tmp_path / "answers.sqlite")
+    monkeypatch.setattr(vector_db, "Embeddings", None)
+    monkeypatch.setattr(vector_db.chromadb, "PersistentClient", lambda path: StandInClient())
+    export_collection(StandInDB(n=30, dim=4), tmp_path / "snapshot")
+
+    db, added = import_snapshot(tmp_path / "snapshot", vector_store="flat", batch_size=8)
+    assert added == 30 and db.collection.count() == 30 and db.embedding_function is None
+    assert db.lexical_index.count() == 30
+    assert sum(row["chunks"] for row in db.catalog.sources("snapshots")) == 30
+
+    db, added = import_snapshot(tmp_path / "snapshot", vector_store="flat")
+    assert added == 0 and db.collection.count() == 30
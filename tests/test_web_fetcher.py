@@ -0,0 +1,120 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from anyqa.models.web_fetcher import HttpCache, WebFetcher, iterate_async, parse_sitemap
+
+PAGES = {"/docs/a": "<html><body>Page A</body></html>", "/docs/b": "<html><body>Page B</body></html>", "/blog/c": "<p>C</p>"}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    lastmod = "2024-01-01"
+    requests: list[tuple[str, bool]] = []
+
+    def do_GET(self):
+        conditional = "If-None-Match" in self.headers
+        type(self).requests.append((self.path, conditional))
+        if self.path == "/index.xml":
+            host = f"http://{self.headers['Host']}"
+            sitemaps = "".join(f"<sitemap><loc>{host}{path}</loc></sitemap>" for path in ("/broken.xml", "/sitemap.xml"))
+            body = f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemaps}</sitemapindex>'
+        elif self.path == "/broken.xml":
+            body = "<urlset><url><loc>"
+        elif self.path == "/sitemap.xml":
+            host = f"http://{self.headers['Host']}"
+            urls = "".join(f"<url><loc>{host}{path}</loc><lastmod>{self.lastmod}</lastmod></url>" for path in PAGES)
+            urls += "<url><loc>http://elsewhere.invalid/docs/x</loc></url>"
+            body = f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+        elif self.path in PAGES:
+            body = PAGES[self.path]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{hash(body)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = body.encode("UTF-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.requests = []
+    StandInHandler.lastmod = "2024-01-01"
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def crawl(url: str, cache: HttpCache, patterns: list[str]) -> tuple[dict[str, str], dict]:
+    fetcher = WebFetcher(cache=cache, concurrency=4, requests_per_second=100)
+    pages = {page.url: page.content for page in iterate_async(fetcher.crawl(f"{url}/sitemap.xml", patterns=patterns))}
+    return pages, fetcher.stats
+
+
+def test_parse_sitemap():
+    xml = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"><sitemap><loc>http://x/s.xml</loc></sitemap></sitemapindex>'
+    assert parse_sitemap(xml) == ([], ["http://x/s.xml"])
+
+
+def test_crawl_filters_and_fetches_pages(server, tmp_path):
+    cache = HttpCache(tmp_path / "cache.sqlite")
+    pages, stats = crawl(server, cache, patterns=[".*/docs/.*"])
+
+    assert pages == {f"{server}/docs/a": PAGES["/docs/a"], f"{server}/docs/b": PAGES["/docs/b"]}
+    assert stats["requests"] == 3
+
+
+def test_unchanged_lastmod_skips_requests(server, tmp_path):
+    cache = HttpCache(tmp_path / "cache.sqlite")
+    crawl(server, cache, patterns=[".*"])
+    StandInHandler.requests = []
+
+    pages, stats = crawl(server, cache, patterns=[".*"])
+
+    assert len(pages) == 3
+    assert stats["skipped"] == 3
+    assert StandInHandler.requests == [("/sitemap.xml", True)]
+
+
+def test_changed_lastmod_revalidates_with_conditional_requests(server, tmp_path):
+    cache = HttpCache(tmp_path / "cache.sqlite")
+    crawl(server, cache, patterns=[".*"])
+    StandInHandler.requests = []
+    StandInHandler.lastmod = "2024-02-01"
+
+    pages, stats = crawl(server, cache, patterns=[".*"])
+
+    assert pages[f"{server}/docs/a"] == PAGES["/docs/a"]
+    assert stats["not_modified"] == 3
+    assert all(conditional for _, conditional in StandInHandler.requests)
+
+
+def test_failures_only_lose_their_own_entries(server, tmp_path, monkeypatch):
+    fetch = WebFetcher.fetch
+
+    async def fetch_or_fail(self, session, url, lastmod=None):
+        if url.endswith("/docs/b"):
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+        return await fetch(self, session, url, lastmod)
+
+    monkeypatch.setattr(WebFetcher, "fetch", fetch_or_fail)
+    fetcher = WebFetcher(cache=HttpCache(tmp_path / "cache.sqlite"), concurrency=4, requests_per_second=100)
+    pages = {page.url for page in iterate_async(fetcher.crawl(f"{server}/index.xml", patterns=[".*"]))}
+
+    assert pages == {f"{server}/docs/a", f"{server}/blog/c"}
+    assert fetcher.stats["failed"] == 2